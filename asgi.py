@@ -0,0 +1,10 @@
+import os
+import sys
+
+import uvicorn
+
+from manager.asgi import asgi_app
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(__file__))
+    uvicorn.run(asgi_app, log_level="debug" if os.getenv("DEBUG_MODE") else "info")
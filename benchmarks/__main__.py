@@ -0,0 +1,169 @@
+"""
+Benchmarks of the manager routes over a synthetic catalog.
+
+    python -m benchmarks --size medium --mode all --output results.json
+    python -m benchmarks.compare baseline.json results.json
+
+The write routes run after the read routes, and `/reset_books_from_github` last, it reads the seeded catalog
+from a local stub server instead of GitHub, so the runs don't use the network.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import time
+
+from benchmarks.benchmark_consts import BenchmarkConsts, CatalogSizeConsts
+from benchmarks.catalog_stub_server import CatalogStubServer
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--size", choices=CatalogSizeConsts.SIZES.keys(), default=CatalogSizeConsts.DEFAULT_SIZE)
+    parser.add_argument("--books", type=int, help="Override the number of books of the size")
+    parser.add_argument("--banners", type=int, help="Override the number of banners of the size")
+    parser.add_argument("--emails", type=int, help="Override the number of newsletter emails of the size")
+    parser.add_argument("--mode", choices=["test_client", "gunicorn", "all"], default="test_client")
+    parser.add_argument("--iterations", type=int, default=BenchmarkConsts.ITERATIONS)
+    parser.add_argument("--warmup", type=int, default=BenchmarkConsts.WARMUP_ITERATIONS)
+    parser.add_argument("--workers", type=int, default=BenchmarkConsts.GUNICORN_WORKERS)
+    parser.add_argument("--concurrency", type=int, default=BenchmarkConsts.CONCURRENCY)
+    parser.add_argument("--endpoints", help="Comma separated endpoints to run, default is all")
+    parser.add_argument("--work-dir", default=BenchmarkConsts.WORK_DIR,
+                        help="Directory of the seeded DB and images, it is deleted before a run unless --reuse "
+                             "is given, so it must be empty or created by an earlier run")
+    parser.add_argument("--reuse", action="store_true", help="Keep the catalog seeded by the last run")
+    parser.add_argument("--output", help="Results JSON path, default is printing the results")
+    return parser.parse_args()
+
+
+def get_git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=BenchmarkConsts.REPO_ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def prepare_work_dir(work_dir: str, reuse: bool):
+    """
+    Only a directory the benchmark created (it has the marker file) is deleted, any other directory must be empty
+
+    :param work_dir:
+    :param reuse: Keep the content of an earlier run
+    :return:
+    """
+    marker_path = os.path.join(work_dir, BenchmarkConsts.WORK_DIR_MARKER)
+    if os.path.isdir(work_dir) and not os.path.isfile(marker_path) and os.listdir(work_dir):
+        sys.exit(f"Refusing to use `{work_dir}`, it isn't empty and wasn't created by the benchmark, "
+                 f"delete it or pass an empty --work-dir")
+    if not reuse and os.path.isfile(marker_path):
+        shutil.rmtree(work_dir)
+    os.makedirs(work_dir, exist_ok=True)
+    with open(marker_path, "a"):
+        pass
+
+
+def main():
+    args = parse_args()
+    counts = dict(CatalogSizeConsts.SIZES[args.size])
+    for key in counts.keys():
+        if getattr(args, key) is not None:
+            counts[key] = getattr(args, key)
+
+    # The app reads its settings on import and opens `scarlet.db` in the working directory
+    seed_info_path = os.path.join(args.work_dir, "seed.json")
+    prepare_work_dir(work_dir=args.work_dir, reuse=args.reuse)
+    images_path = os.path.join(args.work_dir, "images")
+    os.makedirs(images_path, exist_ok=True)
+    os.chdir(args.work_dir)
+    os.environ["IMAGES_PATH"] = images_path
+    os.environ["AUTH_TOKEN"] = BenchmarkConsts.AUTH_TOKEN
+    # Only the benchmark progress is logged, not every request
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    os.environ.setdefault("LOG_LEVELS", "benchmarks=INFO")
+    # Every benchmark request comes from the same address
+    os.environ.setdefault("NEWSLETTER_RATE_LIMIT_PER_MINUTE", "0")
+    # The reset job reads the catalog from a local stub instead of GitHub
+    stub_server = CatalogStubServer(images_path=images_path)
+    stub_server.start()
+    os.environ["CATALOG_RESET_BOOKS_URL"] = stub_server.books_url
+    if args.mode != "test_client":
+        # Workers open the same DB, the gunicorn command line runs `app:app` from the work directory
+        shutil.copy(os.path.join(BenchmarkConsts.REPO_ROOT, "app.py"), os.path.join(args.work_dir, "app.py"))
+
+    from benchmarks.benchmark_runner import BenchmarkRunner, TestClientTarget, GunicornTarget, build_requests, \
+        run_functions
+    from benchmarks.catalog_generator import CatalogGenerator
+    from db.db_consts import DBTable
+    from manager.routes import manager_api
+    from objects.book import Book
+
+    if args.reuse and os.path.isfile(seed_info_path):
+        with open(seed_info_path) as seed_info_file:
+            seed_info = json.load(seed_info_file)
+    else:
+        seed_info = CatalogGenerator(manager_api=manager_api).generate(**counts)
+        with open(seed_info_path, "w") as seed_info_file:
+            json.dump(seed_info, seed_info_file)
+
+    # The reset restores the seeded catalog, after the write routes changed it
+    seeded_books = manager_api.db_utils.get_all_table_dicts(table_name=DBTable.BOOKS.value, data_object_type=Book,
+                                                                exclude=["InfoHtml"])
+    benchmark_requests = build_requests(seed_info=seed_info)
+    run_reset = True
+    if args.endpoints:
+        endpoints = set(args.endpoints.split(","))
+        benchmark_requests = [request for request in benchmark_requests if request.name in endpoints]
+        run_reset = "reset_books_from_github" in endpoints
+
+    runner = BenchmarkRunner(iterations=args.iterations, warmup_iterations=args.warmup)
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": get_git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args)
+        },
+        "seed": {key: seed_info[key] for key in ["books", "banners", "emails", "seconds"]},
+        "functions": run_functions(runner=runner, manager_api=manager_api, seed_info=seed_info),
+        "endpoints": {}
+    }
+
+    if args.mode in ["test_client", "all"]:
+        target = TestClientTarget()
+        results["endpoints"][target.name] = runner.run_endpoints(target=target, benchmark_requests=benchmark_requests)
+        if run_reset:
+            results["endpoints"][target.name].update(runner.run_reset_jobs(target=target, stub_server=stub_server,
+                                                                           books=seeded_books))
+    if args.mode in ["gunicorn", "all"]:
+        target = GunicornTarget(work_dir=args.work_dir, workers=args.workers)
+        try:
+            results["endpoints"][target.name] = runner.run_endpoints(target=target,
+                                                                     benchmark_requests=benchmark_requests,
+                                                                     concurrency=args.concurrency)
+            if run_reset:
+                results["endpoints"][target.name].update(runner.run_reset_jobs(
+                    target=target, stub_server=stub_server, books=seeded_books
+                ))
+        finally:
+            target.stop()
+    stub_server.stop()
+
+    results_json = json.dumps(results, indent=2)
+    if args.output:
+        with open(os.path.join(BenchmarkConsts.REPO_ROOT, args.output) if not os.path.isabs(args.output)
+                  else args.output, "w") as output_file:
+            output_file.write(results_json)
+    else:
+        print(results_json)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,47 @@
+import os
+
+
+class CatalogSizeConsts:
+    # Number of books, banners and newsletter emails of each catalog size
+    SIZES = {
+        'small': {'books': 100, 'banners': 5, 'emails': 1_000},
+        'medium': {'books': 10_000, 'banners': 10, 'emails': 100_000},
+        'large': {'books': 100_000, 'banners': 10, 'emails': 1_000_000}
+    }
+    DEFAULT_SIZE = 'small'
+
+
+class GeneratorConsts:
+    SEED = 1234
+    # Distinct images, books share them (images are content addressed)
+    IMAGE_VARIANTS = 50
+    IMAGE_SIZE = (600, 900)
+    INFO_PARAGRAPHS = 6
+    WORDS = ['dragon', 'castle', 'river', 'kingdom', 'shadow', 'garden', 'winter', 'journey', 'secret', 'ocean',
+             'ספר', 'מסע', 'ממלכה', 'נהר', 'סוד', 'חורף', 'גן', 'צל', 'טירה', 'ים']
+    # Rows written per transaction
+    BATCH_SIZE = 5_000
+
+
+class BenchmarkConsts:
+    AUTH_TOKEN = 'benchmark'
+    WORK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.work')
+    # Written in a work directory the benchmark created, only such a directory is deleted before a run
+    WORK_DIR_MARKER = '.benchmark-work-dir'
+    REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    ITERATIONS = 200
+    WARMUP_ITERATIONS = 10
+    GUNICORN_WORKERS = 4
+    GUNICORN_PORT = 8765
+    GUNICORN_START_TIMEOUT = 60
+    CONCURRENCY = 8
+    # Catalog numbers of the books written by the write routes, above the seeded catalog
+    INSERTED_BOOKS_OFFSET = 1_000_000
+    BULK_INSERTED_BOOKS_OFFSET = 2_000_000
+    BULK_INSERT_SIZE = 100
+    # A reset replaces the whole catalog, it runs a few times and is timed until the job is done
+    RESET_ITERATIONS = 3
+    RESET_POLL_INTERVAL = 0.1
+    RESET_TIMEOUT = 600
+    # Relative slowdown reported as a regression when comparing runs
+    REGRESSION_THRESHOLD = 0.2
@@ -0,0 +1,366 @@
+import json
+import os
+import resource
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+import requests
+
+from benchmarks.benchmark_consts import BenchmarkConsts
+from benchmarks.catalog_stub_server import CatalogStubServer
+from utils.consts import JobStatus
+from utils.log_utils import LogUtils
+
+logger = LogUtils.get_logger(__name__)
+
+
+class BenchmarkRequest:
+    def __init__(self, name: str, build: Callable[[int], Dict]):
+        """
+        :param name: Endpoint name in the results
+        :param build: Build the request of an iteration, `method`, `path` and optional `headers` and `data`
+        """
+        self.name = name
+        self.build = build
+
+
+class BenchmarkStats:
+    @staticmethod
+    def percentile(sorted_values: List[float], fraction: float) -> float:
+        # Nearest rank
+        index = min(len(sorted_values) - 1, max(0, int(round(fraction * len(sorted_values))) - 1))
+        return sorted_values[index]
+
+    @staticmethod
+    def summarize(latencies: List[float], total_seconds: float, errors: int, peak_rss_mb: Optional[float]) -> Dict:
+        sorted_latencies = sorted(latencies)
+        if not sorted_latencies:
+            return {"requests": 0, "errors": errors}
+        return {
+            "requests": len(sorted_latencies),
+            "errors": errors,
+            "p50_ms": BenchmarkStats.percentile(sorted_latencies, 0.5) * 1000,
+            "p99_ms": BenchmarkStats.percentile(sorted_latencies, 0.99) * 1000,
+            "mean_ms": sum(sorted_latencies) / len(sorted_latencies) * 1000,
+            "max_ms": sorted_latencies[-1] * 1000,
+            "throughput_rps": len(sorted_latencies) / total_seconds if total_seconds else None,
+            "peak_rss_mb": peak_rss_mb
+        }
+
+
+def build_requests(seed_info: Dict) -> List[BenchmarkRequest]:
+    books = max(seed_info["books"], 1)
+    banners = max(seed_info["banners"], 1)
+    image_url = seed_info["image_urls"][0] if seed_info["image_urls"] else "missing.jpeg"
+    words = seed_info["search_words"]
+    token_body = json.dumps({"token": BenchmarkConsts.AUTH_TOKEN})
+    run_id = int(time.time())
+    bulk_books = [build_book(catalog_number=books + BenchmarkConsts.BULK_INSERTED_BOOKS_OFFSET + index,
+                             image_url=image_url) for index in range(BenchmarkConsts.BULK_INSERT_SIZE)]
+    return [
+        BenchmarkRequest("get_books", lambda i: {"method": "GET", "path": "/get_books",
+                                                 "headers": {"Accept-Encoding": "br, gzip"}}),
+        BenchmarkRequest("get_books_parse_info", lambda i: {"method": "GET", "path": "/get_books?parse_info=1",
+                                                            "headers": {"Accept-Encoding": "br, gzip"}}),
+        BenchmarkRequest("get_books_page", lambda i: {
+            "method": "GET",
+            "path": "/get_books?limit=24&inStock=true&fields=CatalogNumber,Description,UnitPrice,ImageURL"
+        }),
+        BenchmarkRequest("search_books", lambda i: {"method": "GET",
+                                                    "path": f"/search_books?q={words[i % len(words)]}"}),
+        BenchmarkRequest("get_book", lambda i: {"method": "GET", "path": f"/get_book/{i * 7919 % books + 1}"}),
+        BenchmarkRequest("get_banners", lambda i: {"method": "GET", "path": "/get_banners"}),
+        BenchmarkRequest("get_banner", lambda i: {"method": "GET", "path": f"/get_banner/{i % banners + 1}"}),
+        BenchmarkRequest("get_image", lambda i: {"method": "GET", "path": f"/get_image/{image_url}"}),
+        BenchmarkRequest("get_image_thumbnail_webp", lambda i: {
+            "method": "GET", "path": f"/get_image/{image_url}?size=thumbnail&format=webp"
+        }),
+        BenchmarkRequest("get_image_range", lambda i: {"method": "GET", "path": f"/get_image/{image_url}",
+                                                       "headers": {"Range": "bytes=0-1023"}}),
+        BenchmarkRequest("get_newsletter_emails", lambda i: {"method": "POST", "path": "/get_newsletter_emails",
+                                                             "data": token_body}),
+        BenchmarkRequest("get_newsletter_emails_ndjson", lambda i: {
+            "method": "POST", "path": "/get_newsletter_emails",
+            "data": json.dumps({"token": BenchmarkConsts.AUTH_TOKEN, "format": "ndjson"})
+        }),
+        BenchmarkRequest("add_email_to_newsletter", lambda i: {
+            "method": "POST", "path": "/add_email_to_newsletter",
+            "data": json.dumps({"email": f"benchmark{run_id}.{i}@example.com"})
+        }),
+        # The write routes run after the read routes, the books inserted by `/insert` are deleted by `/delete`
+        BenchmarkRequest("insert", lambda i: build_write_request(path="/insert", data=build_book(
+            catalog_number=books + BenchmarkConsts.INSERTED_BOOKS_OFFSET + i, image_url=image_url
+        ))),
+        BenchmarkRequest("update", lambda i: build_write_request(path="/update", data={
+            "CatalogNumber": i * 7919 % books + 1, "UnitPrice": 20 + i % 180
+        })),
+        BenchmarkRequest("delete", lambda i: build_write_request(
+            path="/delete", item_id=books + BenchmarkConsts.INSERTED_BOOKS_OFFSET + i
+        )),
+        BenchmarkRequest("bulk_insert", lambda i: build_write_request(path="/bulk_insert", data=bulk_books)),
+        BenchmarkRequest("metrics", lambda i: {"method": "GET", "path": "/metrics"})
+    ]
+
+
+def build_book(catalog_number: int, image_url: str) -> Dict:
+    return {"CatalogNumber": catalog_number, "ImageURL": image_url, "Description": "benchmark book",
+            "Info": "benchmark book", "UnitPrice": 50.0, "NotRealUnitPrice": None, "inStock": True}
+
+
+def build_write_request(path: str, **json_data) -> Dict:
+    """
+    The write routes read the request from the `json_data` form field
+    """
+    json_data.update({"token": BenchmarkConsts.AUTH_TOKEN, "insert_type": "book"})
+    return {"method": "POST", "path": path, "data": {"json_data": json.dumps(json_data)}}
+
+
+class TestClientTarget:
+    """
+    Requests served in this process by the Flask test client, measures the server code without the network
+    """
+    name = "test_client"
+
+    def __init__(self):
+        from manager import app
+        self._client = app.test_client()
+
+    def request(self, method: str, path: str, headers: Dict = None, data: Union[str, Dict] = None) -> int:
+        response = self._client.open(path, method=method, headers=headers, data=data)
+        response.get_data()
+        return response.status_code
+
+    def request_json(self, method: str, path: str) -> Tuple[int, Optional[Dict]]:
+        response = self._client.open(path, method=method)
+        return response.status_code, response.get_json(silent=True)
+
+    def get_peak_rss_mb(self) -> Optional[float]:
+        # Peak of this process, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    def stop(self):
+        pass
+
+
+class GunicornTarget:
+    """
+    Requests sent to a local gunicorn serving the app from the work directory
+    """
+    name = "gunicorn"
+
+    def __init__(self, work_dir: str, workers: int = BenchmarkConsts.GUNICORN_WORKERS,
+                 port: int = BenchmarkConsts.GUNICORN_PORT):
+        self._base_url = f"http://127.0.0.1:{port}"
+        self._local = threading.local()
+        self._process = subprocess.Popen(
+            # `python -m gunicorn` isn't available on older gunicorn versions
+            [sys.executable, "-c", "from gunicorn.app.wsgiapp import run; run()", "--chdir", work_dir,
+             "--pythonpath", BenchmarkConsts.REPO_ROOT, "-w", str(workers), "-b", f"127.0.0.1:{port}", "app:app"],
+            env=os.environ.copy(), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        self._wait_until_ready(port=port)
+
+    def _wait_until_ready(self, port: int):
+        deadline = time.monotonic() + BenchmarkConsts.GUNICORN_START_TIMEOUT
+        while time.monotonic() < deadline:
+            if self._process.poll() is not None:
+                raise RuntimeError(f"gunicorn exited with code {self._process.returncode}")
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        self.stop()
+        raise RuntimeError("gunicorn didn't start in time")
+
+    def _get_session(self) -> requests.Session:
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            self._local.session = session
+        return session
+
+    def request(self, method: str, path: str, headers: Dict = None, data: Union[str, Dict] = None) -> int:
+        response = self._get_session().request(method, self._base_url + path, headers=headers, data=data)
+        return response.status_code
+
+    def request_json(self, method: str, path: str) -> Tuple[int, Optional[Dict]]:
+        response = self._get_session().request(method, self._base_url + path)
+        try:
+            return response.status_code, response.json()
+        except ValueError:
+            return response.status_code, None
+
+    def get_peak_rss_mb(self) -> Optional[float]:
+        """
+        :return: Sum of the peak RSS of the master and the workers, None where /proc isn't available
+        """
+        try:
+            with open(f"/proc/{self._process.pid}/task/{self._process.pid}/children") as children_file:
+                pids = [self._process.pid] + [int(pid) for pid in children_file.read().split()]
+            peak_rss_kb = 0
+            for pid in pids:
+                with open(f"/proc/{pid}/status") as status_file:
+                    for line in status_file:
+                        if line.startswith("VmHWM:"):
+                            peak_rss_kb += int(line.split()[1])
+            return peak_rss_kb / 1024
+        except (OSError, ValueError):
+            return None
+
+    def stop(self):
+        self._process.terminate()
+        try:
+            self._process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            self._process.kill()
+
+
+class BenchmarkRunner:
+    def __init__(self, iterations: int = BenchmarkConsts.ITERATIONS,
+                 warmup_iterations: int = BenchmarkConsts.WARMUP_ITERATIONS):
+        self.iterations = iterations
+        self.warmup_iterations = warmup_iterations
+
+    @staticmethod
+    def _timed_request(target, benchmark_request: BenchmarkRequest, index: int):
+        request_kwargs = benchmark_request.build(index)
+        start_time = time.perf_counter()
+        status = target.request(**request_kwargs)
+        return time.perf_counter() - start_time, status
+
+    def run_endpoint(self, target, benchmark_request: BenchmarkRequest, concurrency: int = 1) -> Dict:
+        for index in range(self.warmup_iterations):
+            self._timed_request(target=target, benchmark_request=benchmark_request, index=index)
+
+        indexes = range(self.warmup_iterations, self.warmup_iterations + self.iterations)
+        start_time = time.perf_counter()
+        if concurrency > 1:
+            with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                results = list(executor.map(
+                    lambda index: self._timed_request(target=target, benchmark_request=benchmark_request,
+                                                      index=index), indexes
+                ))
+        else:
+            results = [self._timed_request(target=target, benchmark_request=benchmark_request, index=index)
+                       for index in indexes]
+        total_seconds = time.perf_counter() - start_time
+
+        # 304 and 204 are valid answers, everything from 400 is an error
+        errors = sum(1 for _, status in results if status >= 400)
+        return BenchmarkStats.summarize(latencies=[latency for latency, _ in results], total_seconds=total_seconds,
+                                        errors=errors, peak_rss_mb=target.get_peak_rss_mb())
+
+    def run_endpoints(self, target, benchmark_requests: List[BenchmarkRequest], concurrency: int = 1) -> Dict:
+        results = {}
+        for benchmark_request in benchmark_requests:
+            results[benchmark_request.name] = self.run_endpoint(target=target, benchmark_request=benchmark_request,
+                                                                concurrency=concurrency)
+            logger.info("[%s] %s: %s", target.name, benchmark_request.name,
+                           json.dumps(results[benchmark_request.name]))
+        return results
+
+    def run_reset_jobs(self, target, stub_server: CatalogStubServer, books: List[Dict]) -> Dict:
+        """
+        Times reset jobs from the enqueue until the job is done, the reset reads the catalog from a local stub server.
+        The reset jobs run one at a time, so they aren't repeated like the other routes, and the `/jobs/<job_id>`
+        route is measured on the last job.
+
+        :param target:
+        :param stub_server: Started stub server, the app `CATALOG_RESET_BOOKS_URL` points to
+        :param books: Books served to the reset, the seeded catalog
+        :return: Results of `reset_books_from_github` and `get_job`
+        """
+        stub_server.set_books(books)
+        token_query = f"token={BenchmarkConsts.AUTH_TOKEN}"
+        latencies = []
+        errors = 0
+        job_id = None
+        start_time = time.perf_counter()
+        for _ in range(BenchmarkConsts.RESET_ITERATIONS):
+            job_start_time = time.perf_counter()
+            status, body = target.request_json("GET", f"/reset_books_from_github?{token_query}")
+            if status != 202 or not body:
+                errors += 1
+                continue
+            job_id = body["job_id"]
+            job = self._wait_for_job(target=target, path=f"/jobs/{job_id}?{token_query}")
+            latencies.append(time.perf_counter() - job_start_time)
+            if job is None or job["status"] != JobStatus.DONE.value or job["progress"].get("errors"):
+                logger.warning("[%s] Reset job `%s` didn't succeed: %s", target.name, job_id, json.dumps(job))
+                errors += 1
+        results = {"reset_books_from_github": BenchmarkStats.summarize(
+            latencies=latencies, total_seconds=time.perf_counter() - start_time, errors=errors,
+            peak_rss_mb=target.get_peak_rss_mb()
+        )}
+        logger.info("[%s] reset_books_from_github: %s", target.name, json.dumps(results["reset_books_from_github"]))
+
+        if job_id is not None:
+            results["get_job"] = self.run_endpoint(target=target, benchmark_request=BenchmarkRequest(
+                "get_job", lambda i: {"method": "GET", "path": f"/jobs/{job_id}?{token_query}"}
+            ))
+            logger.info("[%s] get_job: %s", target.name, json.dumps(results["get_job"]))
+        return results
+
+    @staticmethod
+    def _wait_for_job(target, path: str) -> Optional[Dict]:
+        deadline = time.monotonic() + BenchmarkConsts.RESET_TIMEOUT
+        while time.monotonic() < deadline:
+            status, job = target.request_json("GET", path)
+            if status == 200 and job["status"] in [JobStatus.DONE.value, JobStatus.FAILED.value]:
+                return job
+            time.sleep(BenchmarkConsts.RESET_POLL_INTERVAL)
+        return None
+
+    def run_function(self, function: Callable[[], object], iterations: int) -> Dict:
+        latencies = []
+        start_time = time.perf_counter()
+        for _ in range(iterations):
+            function_start_time = time.perf_counter()
+            function()
+            latencies.append(time.perf_counter() - function_start_time)
+        return BenchmarkStats.summarize(latencies=latencies, total_seconds=time.perf_counter() - start_time,
+                                        errors=0, peak_rss_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024)
+
+
+def run_functions(runner: BenchmarkRunner, manager_api, seed_info: Dict) -> Dict:
+    """
+    Benchmarks the functions behind the hot routes, without the request handling
+    :param runner:
+    :param manager_api: `ManagerAPI` of the seeded DB
+    :param seed_info: Seed details returned by `CatalogGenerator.generate`
+    :return: Results by function name
+    """
+    from db.db_consts import DBTable
+    from manager.routes import resolve_image_file
+    from objects.book import Book
+
+    db_utils = manager_api.db_utils
+    books = max(seed_info["books"], 1)
+    image_url = seed_info["image_urls"][0] if seed_info["image_urls"] else "missing.jpeg"
+    # Full table reads are slow on the large catalog, they run fewer times
+    full_read_iterations = max(1, runner.iterations // 10)
+    functions = {
+        "get_all_table_data": (lambda: db_utils.get_all_table_data(table_name=DBTable.BOOKS.value,
+                                                                   data_object_type=Book), full_read_iterations),
+        "get_all_table_dicts": (lambda: db_utils.get_all_table_dicts(table_name=DBTable.BOOKS.value,
+                                                                     data_object_type=Book), full_read_iterations),
+        "get_newsletters_emails": (lambda: manager_api.get_newsletters_emails(), full_read_iterations),
+        "exists": (lambda: db_utils.exists(table_name=DBTable.BOOKS.value,
+                                           data_filter={"CatalogNumber": books // 2 + 1}), runner.iterations),
+        "exist_in_db_by_filter": (lambda: manager_api.exist_in_db_by_filter(
+            table_name=DBTable.NEWS_LETTERS.value, data_filter={"EmailAddress": "reader0@example.com"}
+        ), runner.iterations),
+        "resolve_image_file": (lambda: resolve_image_file(filename=image_url, size="thumbnail", image_format="webp"),
+                               runner.iterations)
+    }
+    results = {}
+    for name, (function, iterations) in functions.items():
+        results[name] = runner.run_function(function=function, iterations=iterations)
+        logger.info("[function] %s: %s", name, json.dumps(results[name]))
+    return results
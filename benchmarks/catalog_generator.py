@@ -0,0 +1,99 @@
+import io
+import random
+import time
+from typing import List, Dict
+
+from PIL import Image
+
+from benchmarks.benchmark_consts import GeneratorConsts
+from db.db_consts import DBTable, CommandsFormats
+from manager.manager_api import ManagerAPI
+from objects.banner import Banner
+from objects.book import Book
+from objects.news_letter import NewsLetter
+from utils.consts import InsertType
+from utils.content_utils import ContentUtils
+from utils.log_utils import LogUtils
+
+logger = LogUtils.get_logger(__name__)
+
+
+class CatalogGenerator:
+    """
+    Seeds the DB and the images directory with a synthetic catalog, through the same write paths as the routes
+    """
+
+    def __init__(self, manager_api: ManagerAPI, seed: int = GeneratorConsts.SEED):
+        self.manager_api = manager_api
+        self._random = random.Random(seed)
+
+    def generate_images(self, count: int) -> List[str]:
+        image_urls = []
+        for index in range(count):
+            color = tuple(self._random.randrange(256) for _ in range(3))
+            image = Image.new('RGB', GeneratorConsts.IMAGE_SIZE, color)
+            image_bytes = io.BytesIO()
+            image.save(image_bytes, format='JPEG', quality=85)
+            image_urls.append(ContentUtils.add_image_blob(image_data=image_bytes.getvalue()))
+        return image_urls
+
+    def generate_text(self, words_count: int) -> str:
+        return ' '.join(self._random.choice(GeneratorConsts.WORDS) for _ in range(words_count))
+
+    def generate_book(self, catalog_number: int, image_urls: List[str]) -> Dict:
+        info = '\n'.join(self.generate_text(words_count=40) for _ in range(GeneratorConsts.INFO_PARAGRAPHS))
+        unit_price = round(self._random.uniform(20, 200), 2)
+        book = Book(
+            CatalogNumber=catalog_number,
+            IsDigital=self._random.random() < 0.2,
+            ImageURL=image_urls[catalog_number % len(image_urls)] if image_urls else "",
+            Description=self.generate_text(words_count=4),
+            Info=f'"{info}"',
+            UnitPrice=unit_price,
+            NotRealUnitPrice=round(unit_price * 1.2, 2) if self._random.random() < 0.5 else None,
+            inStock=self._random.random() < 0.8,
+            isCase=self._random.random() < 0.1
+        )
+        return book.model_dump(exclude={'InfoHtml'})
+
+    def generate_books(self, count: int, image_urls: List[str]):
+        for start in range(1, count + 1, GeneratorConsts.BATCH_SIZE):
+            books = [self.generate_book(catalog_number=catalog_number, image_urls=image_urls)
+                     for catalog_number in range(start, min(start + GeneratorConsts.BATCH_SIZE, count + 1))]
+            self.manager_api.bulk_insert_data(insert_type=InsertType.BOOK.value, data_list=books)
+
+    def generate_banners(self, count: int, image_urls: List[str]):
+        banners = [Banner(banner_id=banner_id, ImageURL=image_urls[banner_id % len(image_urls)]).model_dump()
+                   for banner_id in range(1, count + 1)]
+        self.manager_api.bulk_insert_data(insert_type=InsertType.BANNER.value, data_list=banners)
+
+    def generate_emails(self, count: int):
+        db_utils = self.manager_api.db_utils
+        for start in range(0, count, GeneratorConsts.BATCH_SIZE):
+            emails = [NewsLetter(EmailAddress=f"reader{index}@example.com").model_dump()
+                      for index in range(start, min(start + GeneratorConsts.BATCH_SIZE, count))]
+            db_utils.insert_many_data(table_name=DBTable.NEWS_LETTERS.value, data_list=emails,
+                                      conflict_columns=CommandsFormats.UNIQUE_KEYS[DBTable.NEWS_LETTERS.value])
+
+    def generate(self, books: int, banners: int, emails: int) -> Dict:
+        """
+        :param books: Number of books
+        :param banners: Number of banners
+        :param emails: Number of newsletter emails
+        :return: Seed details used to build the benchmark requests
+        """
+        start_time = time.perf_counter()
+        image_urls = self.generate_images(count=min(GeneratorConsts.IMAGE_VARIANTS, max(books, 1)))
+        self.generate_books(count=books, image_urls=image_urls)
+        self.generate_banners(count=banners, image_urls=image_urls)
+        self.generate_emails(count=emails)
+        seconds = time.perf_counter() - start_time
+        logger.info("Generated %d books, %d banners and %d emails in %.1f seconds", books, banners, emails, seconds)
+        return {
+            "books": books,
+            "banners": banners,
+            "emails": emails,
+            "image_urls": image_urls,
+            "search_words": GeneratorConsts.WORDS,
+            "seconds": seconds
+        }
@@ -0,0 +1,75 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List
+
+
+class CatalogStubServer:
+    """
+    Local stand-in of GitHub for the reset job, serves the books JSON in the shape of a GitHub blob page,
+    and the images the books point to
+    """
+    BOOKS_PATH = "/books.json"
+    IMAGES_PATH_PREFIX = "/images/"
+
+    def __init__(self, images_path: str):
+        self.images_path = images_path
+        self._books_body = b""
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._build_handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, name="catalog-stub-server", daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    @property
+    def books_url(self) -> str:
+        return self.base_url + self.BOOKS_PATH
+
+    def set_books(self, books: List[Dict]):
+        """
+        :param books: Books to serve, their `ImageURL` is a file name in the images directory
+        """
+        served_books = [{**book, "ImageURL": self.base_url + self.IMAGES_PATH_PREFIX + book["ImageURL"]
+                         if book["ImageURL"] else ""} for book in books]
+        raw_lines = json.dumps({"books": served_books}, ensure_ascii=False).splitlines(keepends=True)
+        self._books_body = json.dumps({"payload": {"blob": {"rawLines": raw_lines}}}).encode("UTF-8")
+
+    def _build_handler(self):
+        stub_server = self
+
+        class StubHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == CatalogStubServer.BOOKS_PATH:
+                    self._respond(body=stub_server._books_body, content_type="application/json")
+                    return
+                if self.path.startswith(CatalogStubServer.IMAGES_PATH_PREFIX):
+                    file_name = os.path.basename(self.path[len(CatalogStubServer.IMAGES_PATH_PREFIX):])
+                    try:
+                        with open(os.path.join(stub_server.images_path, file_name), "rb") as image_file:
+                            self._respond(body=image_file.read(), content_type="image/jpeg")
+                        return
+                    except OSError:
+                        pass
+                self.send_error(404)
+
+            def _respond(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return StubHandler
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
@@ -0,0 +1,69 @@
+"""
+Compares two benchmark results and fails when a latency regressed.
+
+    python -m benchmarks.compare baseline.json results.json [--threshold 0.2]
+"""
+import argparse
+import json
+import sys
+from typing import Dict, List, Tuple
+
+from benchmarks.benchmark_consts import BenchmarkConsts
+
+COMPARED_METRICS = ["p50_ms", "p99_ms"]
+
+
+def get_results(results: Dict) -> Dict[str, Dict]:
+    """
+    :param results: Results JSON of `python -m benchmarks`
+    :return: Stats by `functions/<name>` and `<mode>/<endpoint>`
+    """
+    flat_results = {f"functions/{name}": stats for name, stats in results.get("functions", {}).items()}
+    for mode, endpoints in results.get("endpoints", {}).items():
+        flat_results.update({f"{mode}/{name}": stats for name, stats in endpoints.items()})
+    return flat_results
+
+
+def compare(baseline: Dict, current: Dict, threshold: float) -> Tuple[List[str], List[str]]:
+    """
+    :return: Report lines and regressions
+    """
+    baseline_results = get_results(results=baseline)
+    current_results = get_results(results=current)
+    lines, regressions = [], []
+    for name in sorted(set(baseline_results.keys()) & set(current_results.keys())):
+        for metric in COMPARED_METRICS:
+            before = baseline_results[name].get(metric)
+            after = current_results[name].get(metric)
+            if not before or after is None:
+                continue
+            change = after / before - 1
+            line = f"{name:<50} {metric:<7} {before:>10.2f} -> {after:>10.2f} ({change:+.0%})"
+            lines.append(line)
+            if change > threshold:
+                regressions.append(line)
+        if current_results[name].get("errors") and not baseline_results[name].get("errors"):
+            regressions.append(f"{name:<50} errors  {current_results[name]['errors']}")
+    return lines, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(prog="python -m benchmarks.compare", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=BenchmarkConsts.REGRESSION_THRESHOLD,
+                        help="Relative slowdown reported as a regression")
+    args = parser.parse_args()
+    with open(args.baseline) as baseline_file, open(args.current) as current_file:
+        lines, regressions = compare(baseline=json.load(baseline_file), current=json.load(current_file),
+                                     threshold=args.threshold)
+    print("\n".join(lines))
+    if regressions:
+        print(f"\n{len(regressions)} regressions over {args.threshold:.0%}:")
+        print("\n".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
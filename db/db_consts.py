@@ -1,30 +1,122 @@
 from enum import Enum
 
 
+class ConnectionConsts:
+    # Seconds to wait for a lock held by another connection
+    TIMEOUT = 10
+    # Number of prepared statements kept per connection
+    CACHED_STATEMENTS = 256
+    PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 256 * 1024 * 1024,
+        # Negative value is in KiB
+        'cache_size': -64 * 1024,
+        'temp_store': 'MEMORY'
+    }
+
+
 class CommandsFormats:
     CREATE_TABLE_FORMAT = {
         'books':
             f'''
-            (CatalogNumber INTEGER KEY, IsDigital INTEGER, ImageURL TEXT, Description TEXT, Info TEXT, UnitPrice REAL,
-            NotRealUnitPrice REAL, inStock INTEGER, isCase INTEGER, ImageData BLOB)
+            (CatalogNumber INTEGER PRIMARY KEY, IsDigital INTEGER, ImageURL TEXT, Description TEXT, Info TEXT,
+            UnitPrice REAL, NotRealUnitPrice REAL, inStock INTEGER, isCase INTEGER, InfoHtml TEXT)
             ''',
         'banners':
             f'''
-            (banner_id INTEGER KEY, ImageURL TEXT)
+            (banner_id INTEGER PRIMARY KEY, ImageURL TEXT)
             ''',
         'news_letters':
             f'''
-            (EmailAddress TEXT KEY)
+            (EmailAddress TEXT PRIMARY KEY)
+            ''',
+        'catalog_versions':
+            f'''
+            (table_name TEXT PRIMARY KEY, version INTEGER)
+            ''',
+        'jobs':
+            f'''
+            (job_id TEXT PRIMARY KEY, job_type TEXT, status TEXT, progress TEXT, error TEXT, created_at TEXT,
+            updated_at TEXT, owner_host TEXT, owner_pid INTEGER, heartbeat_at TEXT)
+            ''',
+        'image_blobs':
+            f'''
+            (digest TEXT PRIMARY KEY, ref_count INTEGER)
             '''
     }
 
+    # Tables created before the keys were declared get a unique index on these columns instead
+    UNIQUE_KEYS = {
+        'books': ['CatalogNumber'],
+        'banners': ['banner_id'],
+        'news_letters': ['EmailAddress']
+    }
+
+    # Indexes of each table, by index name. Books are paged by CatalogNumber, so it ends the filter indexes
+    INDEXES = {
+        'books': {
+            'ix_books_inStock_CatalogNumber': ['inStock', 'CatalogNumber'],
+            'ix_books_IsDigital_CatalogNumber': ['IsDigital', 'CatalogNumber'],
+            'ix_books_isCase_CatalogNumber': ['isCase', 'CatalogNumber'],
+            'ix_books_UnitPrice': ['UnitPrice']
+        }
+    }
+
+    # Full text search tables (FTS5, external content), kept in sync with their table by triggers.
+    # Combining marks (e.g. niqqud) are token characters, so pointed Hebrew words are not split apart.
+    SEARCH_TABLES = {
+        'books': {
+            'search_table': 'books_fts',
+            'key_column': 'CatalogNumber',
+            'columns': ['Description', 'Info'],
+            # The columns are indexed without `ContentConsts.SEARCH_STRIPPED_MARKS`, the marks that are left are kept
+            # inside the words
+            'tokenize': "unicode61 remove_diacritics 2 categories 'L* N* Co M*'",
+            # Prefix indexes, for prefix queries of 2 and 3 characters
+            'prefix': '2 3'
+        }
+    }
+
+    # `replace` calls nested in each subquery of the expression stripping the search marks
+    SEARCH_STRIP_MARKS_PER_SUBQUERY = 10
+
+    # Columns declared after the table was first created, tables created before get them on startup
+    ADDED_COLUMNS = {
+        'books': {'InfoHtml': 'TEXT'},
+        'jobs': {'owner_host': 'TEXT', 'owner_pid': 'INTEGER', 'heartbeat_at': 'TEXT'}
+    }
+
+
+class SchemaConsts:
+    # Stored in the DB `user_version`, bumped when a startup migration is added
+    VERSION = 4
+    # The search tables of older versions are rebuilt, they were fed with the text as is (version 1), or through an
+    # application defined SQL function that other SQLite clients don't have (version 2)
+    SEARCH_TABLES_VERSION = 3
+    # Serializes the schema setup of the workers starting together
+    LOCK_FILE_SUFFIX = '.schema.lock'
+
+
+class LegacyColumns(Enum):
+    # Image bytes used to be stored inside the books table, they are kept on disk only
+    BOOKS_IMAGE_DATA = 'ImageData'
+
 
 class DBTable(Enum):
     BOOKS = 'books'
     BANNERS = 'banners'
     NEWS_LETTERS = 'news_letters'
+    CATALOG_VERSIONS = 'catalog_versions'
+    JOBS = 'jobs'
+    IMAGE_BLOBS = 'image_blobs'
+
+
+class BookColumns:
+    INFO_HTML = 'InfoHtml'
 
 
 class ProductIDKeys(Enum):
     BOOKS = 'CatalogNumber'
     BANNERS = 'banner_id'
+    NEWS_LETTERS = 'EmailAddress'
@@ -0,0 +1,62 @@
+from collections import namedtuple
+from functools import lru_cache
+from typing import Tuple, Union, get_args, get_origin
+
+# SQLite stores booleans as integers, and may return whole REAL values of old rows as integers
+_CONVERTERS = {bool: bool, float: float}
+
+
+class RowMapping:
+    """
+    Mapping of DB rows to a model, computed once per model and columns.
+    Rows read from our own tables were validated when they were written, so they are hydrated to dicts or
+    records without validation, only the values SQLite returns in another type are converted.
+    (`model_construct` isn't used, in pydantic 2 it is slower than `model_validate`.)
+    """
+
+    def __init__(self, data_object_type, columns: Tuple[str, ...]):
+        self.data_object_type = data_object_type
+        self.columns = columns
+        self._converters = []
+        for index, column in enumerate(columns):
+            field_type = self.get_field_type(annotation=data_object_type.model_fields[column].annotation)
+            converter = _CONVERTERS.get(field_type)
+            if converter is not None:
+                self._converters.append((index, converter))
+        # Tuple backed record, smaller than a dict or a model when many rows are kept
+        self.record_type = namedtuple(f"{data_object_type.__name__}Record", columns)
+
+    @staticmethod
+    @lru_cache(maxsize=None)
+    def get(data_object_type, columns: Tuple[str, ...] = None) -> 'RowMapping':
+        """
+        :param data_object_type: Model of the rows
+        :param columns: Selected columns, default is all the model fields
+        :return:
+        """
+        return RowMapping(data_object_type=data_object_type,
+                          columns=columns or tuple(data_object_type.model_fields.keys()))
+
+    @staticmethod
+    def get_field_type(annotation):
+        # `Optional[X]` is `Union[X, None]`
+        if get_origin(annotation) is Union:
+            args = [arg for arg in get_args(annotation) if arg is not type(None)]
+            if len(args) == 1:
+                return args[0]
+        return annotation
+
+    def convert(self, row: tuple) -> tuple:
+        if not self._converters:
+            return row
+        values = list(row)
+        for index, converter in self._converters:
+            if values[index] is not None:
+                values[index] = converter(values[index])
+        return tuple(values)
+
+    def to_dict(self, row: tuple) -> dict:
+        return dict(zip(self.columns, self.convert(row=row)))
+
+    def to_record(self, row: tuple):
+        return self.record_type._make(self.convert(row=row))
@@ -1,15 +1,169 @@
 import json
+import os
 import sqlite3
-from typing import List
+import threading
+import time
+from contextlib import contextmanager
+from typing import List, Dict
 
-from db.db_consts import DBTable, CommandsFormats, ProductIDKeys
-from objects.news_letter import NewsLetter
-from utils.consts import InsertType
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows, the schema setup isn't serialized there
+    fcntl = None
+
+from db.db_consts import DBTable, CommandsFormats, ProductIDKeys, ConnectionConsts, SchemaConsts
+from db.db_row_mapping import RowMapping
+from utils.consts import InsertType, ContentConsts
 from utils.exceptions import UnknownInsertType
+from utils.log_utils import LogUtils
+from utils.metrics_utils import MetricsUtils
+
+logger = LogUtils.get_logger(__name__)
+
+
+class TimedCursor(sqlite3.Cursor):
+    """
+    Cursor reporting the duration of every statement, and of fetching its rows
+    """
+    _query_labels = ('UNKNOWN', '')
+
+    def _observe(self, labels, start_time: float):
+        MetricsUtils.observe_query(labels=labels, seconds=time.perf_counter() - start_time)
+
+    def execute(self, sql, parameters=()):
+        self._query_labels = MetricsUtils.get_query_labels(sql)
+        start_time = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._observe(labels=self._query_labels, start_time=start_time)
+
+    def executemany(self, sql, seq_of_parameters):
+        self._query_labels = MetricsUtils.get_query_labels(sql)
+        start_time = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._observe(labels=self._query_labels, start_time=start_time)
+
+    def fetchone(self):
+        start_time = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self._observe(labels=('FETCH', self._query_labels[1]), start_time=start_time)
+
+    def fetchmany(self, size: int = None):
+        start_time = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self._observe(labels=('FETCH', self._query_labels[1]), start_time=start_time)
+
+    def fetchall(self):
+        start_time = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self._observe(labels=('FETCH', self._query_labels[1]), start_time=start_time)
+
+
+class TimedConnection(sqlite3.Connection):
+    def cursor(self, factory=TimedCursor):
+        return super().cursor(factory)
+
+
+class DBConnectionProvider:
+    """
+    Gives every thread its own connection (and cursor) to the DB.
+    A connection is opened once per thread and reused by all the requests handled by that thread.
+    """
+
+    def __init__(self, database_name: str):
+        self._database_name = database_name
+        self._local = threading.local()
+        self._pid = os.getpid()
+
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(
+            self._database_name, timeout=ConnectionConsts.TIMEOUT, cached_statements=ConnectionConsts.CACHED_STATEMENTS,
+            factory=TimedConnection
+        )
+        for pragma, value in ConnectionConsts.PRAGMAS.items():
+            connection.execute(f"PRAGMA {pragma} = {value}")
+        return connection
+
+    @contextmanager
+    def schema_lock(self):
+        """
+        Exclusive lock across processes, held while a worker sets up the schema
+        """
+        with open(f"{self._database_name}{SchemaConsts.LOCK_FILE_SUFFIX}", 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    @contextmanager
+    def transaction(self):
+        """
+        Run the block in a single transaction of the thread connection. The write lock is taken at the start of the
+        block, so the block is serialized with the writers of all the processes.
+        A nested block joins the outer transaction.
+        """
+        connection = self.get_connection()
+        if self.in_transaction_block():
+            yield
+            return
+
+        if connection.in_transaction:
+            connection.commit()
+        connection.execute("BEGIN IMMEDIATE")
+        self._local.in_transaction_block = True
+        try:
+            yield
+            connection.commit()
+        except BaseException:
+            connection.rollback()
+            raise
+        finally:
+            self._local.in_transaction_block = False
+
+    def in_transaction_block(self) -> bool:
+        return getattr(self._local, 'in_transaction_block', False)
+
+    def get_connection(self) -> sqlite3.Connection:
+        # Connections must not be shared with forked workers
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._pid = os.getpid()
+
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = self._connect()
+            self._local.connection = connection
+            self._local.cursor = connection.cursor()
+        return connection
+
+    def get_cursor(self) -> sqlite3.Cursor:
+        self.get_connection()
+        return self._local.cursor
+
+    def close(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+            self._local.cursor = None
 
 
 class DBUtils:
     __DATABASE_NAME = 'scarlet.db'
+    _CONNECTION_PROVIDER = DBConnectionProvider(database_name=__DATABASE_NAME)
     TABLE_NAME_BY_INSET_TYPE = {
         InsertType.BOOK.value: DBTable.BOOKS.value,
         InsertType.BANNER.value: DBTable.BANNERS.value,
@@ -23,15 +177,43 @@ class DBUtils:
 
     def __init__(self):
         try:
-            self._db = sqlite3.connect(self.__DATABASE_NAME, check_same_thread=False)
-            self._cursor = self._db.cursor()
+            self._CONNECTION_PROVIDER.get_connection()
             self.initialized = True
         except Exception as e:
-            print(f"Exception while trying to connect DB, {str(e)}")
+            logger.error("Exception while trying to connect DB, %s", e)
             self.initialized = False
 
+    @property
+    def _db(self) -> sqlite3.Connection:
+        return self._CONNECTION_PROVIDER.get_connection()
+
+    @property
+    def _cursor(self) -> sqlite3.Cursor:
+        return self._CONNECTION_PROVIDER.get_cursor()
+
     def close(self):
-        self._db.close()
+        self._CONNECTION_PROVIDER.close()
+
+    def schema_lock(self):
+        return self._CONNECTION_PROVIDER.schema_lock()
+
+    def transaction(self):
+        """
+        Write transaction of many DBUtils calls, the calls in the block don't commit on their own
+        """
+        return self._CONNECTION_PROVIDER.transaction()
+
+    def _commit(self):
+        if not self._CONNECTION_PROVIDER.in_transaction_block():
+            self._db.commit()
+
+    def get_schema_version(self) -> int:
+        self._cursor.execute("PRAGMA user_version")
+        return self._cursor.fetchone()[0]
+
+    def set_schema_version(self, version: int):
+        self._cursor.execute(f"PRAGMA user_version = {int(version)}")
+        self._commit()
 
     def get_table_name_by_insert_type(self, insert_type: str) -> str:
         try:
@@ -57,7 +239,140 @@ class DBUtils:
     def create_table(self, table_name: str):
         if not self.is_table_exists(table_name=table_name):
             self._cursor.execute(f"CREATE TABLE {table_name}{CommandsFormats.CREATE_TABLE_FORMAT[table_name]}")
-            self._db.commit()
+            self._commit()
+            self.create_indexes(table_name=table_name)
+            self.create_search_table(table_name=table_name)
+
+    def create_indexes(self, table_name: str):
+        for index_name, columns in CommandsFormats.INDEXES.get(table_name, {}).items():
+            self._cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} ON {table_name} ({', '.join(columns)})")
+        self._commit()
+
+    @staticmethod
+    def build_strip_search_marks_expression(column: str) -> str:
+        """
+        SQL expression of the column without `ContentConsts.SEARCH_STRIPPED_MARKS`, like
+        `ContentUtils.strip_search_marks`.
+        Plain SQL, so the search triggers work on any SQLite client, not only on the server connections.
+        The `replace` calls are nested in chained subqueries, a single expression nesting them all overflows the
+        SQLite parser stack.
+
+        :param column:
+        :return:
+        """
+        marks = ContentConsts.SEARCH_STRIPPED_MARKS
+        marks_per_subquery = CommandsFormats.SEARCH_STRIP_MARKS_PER_SUBQUERY
+        query = None
+        for index in range(0, len(marks), marks_per_subquery):
+            expression = column if query is None else "value"
+            for mark in marks[index:index + marks_per_subquery]:
+                expression = f"replace({expression}, char({ord(mark)}), '')"
+            query = f"SELECT {expression} AS value" + (f" FROM ({query})" if query is not None else "")
+        return f"({query})"
+
+    def create_search_table(self, table_name: str) -> bool:
+        """
+        Create the full text search table of a table, with the triggers keeping it in sync.
+        A new search table is filled with the rows already in the table.
+
+        :param table_name:
+        :return: Whether the table has a search table
+        """
+        search_config = CommandsFormats.SEARCH_TABLES.get(table_name)
+        if search_config is None:
+            return False
+
+        search_table = search_config['search_table']
+        key_column = search_config['key_column']
+        columns = ', '.join(search_config['columns'])
+        # The index is fed with the stripped text, the content (and the snippets) stay as is
+        new_values = ', '.join(self.build_strip_search_marks_expression(column=f"new.{column}")
+                               for column in search_config['columns'])
+        old_values = ', '.join(self.build_strip_search_marks_expression(column=f"old.{column}")
+                               for column in search_config['columns'])
+        table_values = ', '.join(self.build_strip_search_marks_expression(column=column)
+                                 for column in search_config['columns'])
+        insert_new = f"INSERT INTO {search_table} (rowid, {columns}) VALUES (new.{key_column}, {new_values});"
+        delete_old = (f"INSERT INTO {search_table} ({search_table}, rowid, {columns}) "
+                      f"VALUES ('delete', old.{key_column}, {old_values});")
+        try:
+            created = not self.is_table_exists(table_name=search_table)
+            with self.transaction():
+                self._cursor.execute(
+                    f"CREATE VIRTUAL TABLE IF NOT EXISTS {search_table} USING fts5({columns}, "
+                    f"content='{table_name}', content_rowid='{key_column}', "
+                    f"tokenize=\"{search_config['tokenize']}\", prefix='{search_config['prefix']}')"
+                )
+                self._cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {search_table}_ai AFTER INSERT ON {table_name} "
+                                     f"BEGIN {insert_new} END")
+                self._cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {search_table}_ad AFTER DELETE ON {table_name} "
+                                     f"BEGIN {delete_old} END")
+                self._cursor.execute(f"CREATE TRIGGER IF NOT EXISTS {search_table}_au AFTER UPDATE ON {table_name} "
+                                     f"BEGIN {delete_old} {insert_new} END")
+                if created:
+                    # Not the FTS5 `rebuild`, it indexes the content as is
+                    self._cursor.execute(f"INSERT INTO {search_table} (rowid, {columns}) "
+                                         f"SELECT {key_column}, {table_values} FROM {table_name}")
+            if created:
+                logger.info("Created search table `%s` of `%s`", search_table, table_name)
+            return True
+        except sqlite3.Error as e:
+            # SQLite may be built without FTS5, the rest of the server works without search
+            logger.warning("Cannot create search table of `%s`, except: %s", table_name, e)
+            return False
+
+    def drop_search_table(self, table_name: str):
+        """
+        Drop the full text search table of a table, with its triggers
+
+        :param table_name:
+        :return:
+        """
+        search_config = CommandsFormats.SEARCH_TABLES.get(table_name)
+        if search_config is None:
+            return
+
+        search_table = search_config['search_table']
+        if not self.is_table_exists(table_name=search_table):
+            return
+
+        with self.transaction():
+            for trigger_suffix in ('ai', 'ad', 'au'):
+                self._cursor.execute(f"DROP TRIGGER IF EXISTS {search_table}_{trigger_suffix}")
+            self._cursor.execute(f"DROP TABLE IF EXISTS {search_table}")
+        logger.info("Dropped search table `%s` of `%s`", search_table, table_name)
+
+    def search(self, table_name: str, query: str, columns: List[str], limit: int, offset: int = 0,
+               weights: List[float] = None, snippet_tokens: int = 16) -> List[Dict]:
+        """
+        Full text search, best matches first
+
+        :param table_name:
+        :param query: FTS5 query
+        :param columns: Table columns to select
+        :param limit:
+        :param offset:
+        :param weights: BM25 weight of each searched column, default is equal weights
+        :param snippet_tokens: Maximum number of tokens in the snippet
+        :return: Rows as dicts of the selected columns, with a `Snippet` of the best matching column,
+                 matched terms are wrapped with `<b>` tags
+        """
+        search_config = CommandsFormats.SEARCH_TABLES[table_name]
+        search_table = search_config['search_table']
+        weights = weights or [1.0] * len(search_config['columns'])
+        selected_columns = ', '.join(f"{table_name}.{column}" for column in columns)
+        sql_query = (
+            f"SELECT {selected_columns}, snippet({search_table}, -1, '<b>', '</b>', '...', ?) "
+            f"FROM {search_table} JOIN {table_name} ON {table_name}.{search_config['key_column']} = {search_table}.rowid "
+            f"WHERE {search_table} MATCH ? "
+            f"ORDER BY bm25({search_table}, {', '.join(['?'] * len(weights))}) LIMIT ? OFFSET ?"
+        )
+        try:
+            self._cursor.execute(sql_query, (snippet_tokens, query, *weights, limit, offset))
+            return [dict(zip(columns + ['Snippet'], row)) for row in self._cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error("(search) Error searching `%s`: %s", table_name, e)
+            raise e
 
     def get_table_columns(self, table_name: str) -> List[str]:
         self._cursor.execute(f"PRAGMA table_info({table_name})")
@@ -66,9 +381,63 @@ class DBUtils:
         for column in columns:
             column_name = column[1]
             columns_names.append(column_name)
-            print(column_name)
         return columns_names
 
+    def get_primary_key_columns(self, table_name: str) -> List[str]:
+        self._cursor.execute(f"PRAGMA table_info({table_name})")
+        return [column[1] for column in self._cursor.fetchall() if column[5]]
+
+    def ensure_unique_key(self, table_name: str):
+        """
+        Make sure the table key columns are unique, for tables created without a primary key
+        duplicated keys are removed (keeping the latest row) and a unique index is created
+
+        :param table_name:
+        :return:
+        """
+        key_columns = CommandsFormats.UNIQUE_KEYS[table_name]
+        if not self.is_table_exists(table_name=table_name):
+            return
+        if self.get_primary_key_columns(table_name=table_name) == key_columns:
+            return
+
+        columns = ', '.join(key_columns)
+        self._cursor.execute(
+            f"DELETE FROM {table_name} WHERE rowid NOT IN (SELECT MAX(rowid) FROM {table_name} GROUP BY {columns})"
+        )
+        if self._cursor.rowcount:
+            logger.info("Removed %d duplicated row(s) from `%s`", self._cursor.rowcount, table_name)
+        index_name = f"ux_{table_name}_{'_'.join(key_columns)}"
+        self._cursor.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {index_name} ON {table_name} ({columns})")
+        self._commit()
+
+    @staticmethod
+    def build_where_clause(filter_data: dict) -> str:
+        return " AND ".join(f"{column} = ?" for column in filter_data.keys())
+
+    def update_data_by_filter(self, table_name: str, data: dict, filter_data: dict) -> int:
+        """
+        Update the given columns of all the rows matching the filter
+
+        :param table_name:
+        :param data:
+        :param filter_data:
+        :return: Number of rows updated
+        """
+        if not filter_data:
+            logger.warning("No filter conditions specified. No rows updated.")
+            return 0
+
+        set_clause = ', '.join(f"{column} = ?" for column in data.keys())
+        query = f"UPDATE {table_name} SET {set_clause} WHERE {self.build_where_clause(filter_data=filter_data)}"
+        try:
+            self._cursor.execute(query, tuple(data.values()) + tuple(filter_data.values()))
+            self._commit()
+            return self._cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error("Error updating rows: %s", e)
+            raise e
+
     def delete_data_by_filter(self, table_name: str, filter_data: dict) -> bool:
         where_conditions = []
         for column, value in filter_data.items():
@@ -76,7 +445,7 @@ class DBUtils:
             where_conditions.append(condition)
 
         if not where_conditions:
-            print("No filter conditions specified. No rows deleted.")
+            logger.warning("No filter conditions specified. No rows deleted.")
             return False
 
         where_clause = " AND ".join(where_conditions)
@@ -84,15 +453,14 @@ class DBUtils:
 
         try:
             self._cursor.execute(query, tuple(filter_data.values()))
-            self._db.commit()
-            print(f"{self._cursor.rowcount} row(s) deleted.")
+            self._commit()
+            logger.debug("%d row(s) deleted from `%s`", self._cursor.rowcount, table_name)
             return True
         except sqlite3.Error as e:
-            print(f"Error deleting rows: {e}")
+            logger.error("Error deleting rows: %s", e)
             return False
 
     def insert_data(self, table_name: str, data: dict):
-        print("Start db_utils insert_data")
         if not self.is_table_exists(table_name=table_name):
             self.create_table(table_name=table_name)
 
@@ -104,90 +472,553 @@ class DBUtils:
 
         try:
             self._cursor.execute(query, values)
-            self._db.commit()
-            print(f"Data inserted successfully, data: {data}")
+            self._commit()
+            # Logging only the columns, the values can be large
+            logger.debug("Data inserted to `%s`, columns: %s", table_name, list(data.keys()))
+            return data
+        except sqlite3.Error as e:
+            logger.error("Error inserting data: %s", e)
+            raise e
+
+    def insert_data_ignore_conflict(self, table_name: str, data: dict, conflict_columns: List[str]) -> bool:
+        """
+        Insert the data unless a row with the same conflict columns already exists
+
+        :param table_name:
+        :param data:
+        :param conflict_columns:
+        :return: True if the data was inserted
+        """
+        if not self.is_table_exists(table_name=table_name):
+            self.create_table(table_name=table_name)
+
+        columns = ', '.join(data.keys())
+        placeholders = ', '.join(['?'] * len(data))
+        query = (f"INSERT INTO {table_name} ({columns}) VALUES ({placeholders}) "
+                 f"ON CONFLICT({', '.join(conflict_columns)}) DO NOTHING")
+
+        try:
+            self._cursor.execute(query, tuple(data.values()))
+            self._commit()
+            return self._cursor.rowcount == 1
+        except sqlite3.Error as e:
+            logger.error("Error inserting data: %s", e)
+            raise e
+
+    @staticmethod
+    def build_upsert_query(table_name: str, columns: List[str], conflict_columns: List[str],
+                           update_columns: List[str] = None) -> str:
+        """
+        Build an insert query that updates the existing row when the conflict columns already exist
+
+        :param table_name:
+        :param columns: Columns to insert
+        :param conflict_columns: Unique key columns of the table
+        :param update_columns: Columns to update on an existing row, default is all the inserted columns except the key
+        :return:
+        """
+        if update_columns is None:
+            update_columns = [column for column in columns if column not in conflict_columns]
+
+        placeholders = ', '.join(['?'] * len(columns))
+        query = (f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({placeholders}) "
+                 f"ON CONFLICT({', '.join(conflict_columns)}) ")
+        if update_columns:
+            query += "DO UPDATE SET " + ', '.join(f"{column} = excluded.{column}" for column in update_columns)
+        else:
+            query += "DO NOTHING"
+        return query
+
+    def upsert_data(self, table_name: str, data: dict, conflict_columns: List[str], update_columns: List[str] = None):
+        """
+        Insert the data, or update the existing row with the same conflict columns, in a single statement
+
+        :param table_name:
+        :param data:
+        :param conflict_columns:
+        :param update_columns: Columns to update on an existing row, default is all the given columns except the key
+        :return:
+        """
+        if not self.is_table_exists(table_name=table_name):
+            self.create_table(table_name=table_name)
+
+        query = self.build_upsert_query(table_name=table_name, columns=list(data.keys()),
+                                        conflict_columns=conflict_columns, update_columns=update_columns)
+        try:
+            self._cursor.execute(query, tuple(data.values()))
+            self._commit()
             return data
         except sqlite3.Error as e:
-            print(f"Error inserting data: {e}")
+            if not self._CONNECTION_PROVIDER.in_transaction_block():
+                self._db.rollback()
+            logger.error("Error upserting data: %s", e)
             raise e
 
+    def insert_many_data(self, table_name: str, data_list: List[Dict], conflict_columns: List[str] = None,
+                         delete_existing: bool = False) -> int:
+        """
+        Insert many rows with a single statement, in a single transaction
+
+        :param table_name:
+        :param data_list:
+        :param conflict_columns: If given, existing rows with the same conflict columns are updated
+        :param delete_existing: Delete all the table rows in the same transaction, before inserting
+        :return: Number of rows written
+        """
+        if not self.is_table_exists(table_name=table_name):
+            self.create_table(table_name=table_name)
+
+        columns = []
+        for data in data_list:
+            columns.extend(key for key in data.keys() if key not in columns)
+
+        if conflict_columns:
+            query = self.build_upsert_query(table_name=table_name, columns=columns, conflict_columns=conflict_columns)
+        else:
+            query = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join(['?'] * len(columns))})"
+
+        try:
+            with self.transaction():
+                if delete_existing:
+                    self._cursor.execute(f"DELETE FROM {table_name}")
+                if data_list:
+                    self._cursor.executemany(query, (tuple(data.get(column) for column in columns)
+                                                     for data in data_list))
+            logger.debug("%d row(s) written to `%s`", len(data_list), table_name)
+            return len(data_list)
+        except sqlite3.Error as e:
+            logger.error("Error inserting many rows: %s", e)
+            raise e
+
+    def upsert_many_data(self, table_name: str, data_list: List[Dict], conflict_columns: List[str],
+                         update_columns_list: List[List[str]]) -> int:
+        """
+        Insert many rows, existing rows with the same conflict columns are updated with their own update columns.
+        The rows are written with a statement per distinct update columns, in a single transaction.
+
+        :param table_name:
+        :param data_list: Full rows, used as is for the new rows
+        :param conflict_columns:
+        :param update_columns_list: Columns to update for each row of `data_list`, if the row already exists
+        :return: Number of rows written
+        """
+        if not self.is_table_exists(table_name=table_name):
+            self.create_table(table_name=table_name)
+
+        rows_by_update_columns = {}
+        for data, update_columns in zip(data_list, update_columns_list):
+            columns = tuple(data.keys())
+            rows_by_update_columns.setdefault((columns, tuple(update_columns)), []).append(tuple(data.values()))
+
+        try:
+            with self.transaction():
+                for (columns, update_columns), rows in rows_by_update_columns.items():
+                    query = self.build_upsert_query(table_name=table_name, columns=list(columns),
+                                                    conflict_columns=conflict_columns,
+                                                    update_columns=list(update_columns))
+                    self._cursor.executemany(query, rows)
+            logger.debug("%d row(s) written to `%s` with %d statement(s)", len(data_list), table_name,
+                         len(rows_by_update_columns))
+            return len(data_list)
+        except sqlite3.Error as e:
+            logger.error("Error upserting many rows: %s", e)
+            raise e
+
+    def delete_data_not_in(self, table_name: str, column: str, values: list) -> int:
+        """
+        Delete all the rows whose column value is not one of the given values
+
+        :param table_name:
+        :param column:
+        :param values:
+        :return: Number of rows deleted
+        """
+        # Passing the values as a single JSON parameter, there can be more values than the SQLite variables limit
+        query = f"DELETE FROM {table_name} WHERE {column} NOT IN (SELECT value FROM json_each(?))"
+        try:
+            self._cursor.execute(query, (json.dumps(values),))
+            self._commit()
+            logger.debug("%d row(s) deleted from `%s`", self._cursor.rowcount, table_name)
+            return self._cursor.rowcount
+        except sqlite3.Error as e:
+            logger.error("Error deleting rows: %s", e)
+            raise e
+
+    @staticmethod
+    def get_model_columns(data_object_type) -> List[str]:
+        return list(data_object_type.model_fields.keys())
+
     def get_all_table_data(self, table_name: str, data_object_type):
-        print(f"data_object_type: {data_object_type.__name__}")
-        print(f"Initialized: {self.initialized}")
-        object_keys = list(data_object_type.__annotations__.keys())
-        query = f"SELECT * FROM {table_name}"
+        """
+        Get all the table rows as validated models, reads of trusted rows use `get_all_table_dicts`
+
+        :param table_name:
+        :param data_object_type:
+        :return:
+        """
+        row_mapping = RowMapping.get(data_object_type=data_object_type)
+        rows = self.get_all_table_rows(table_name=table_name, row_mapping=row_mapping)
+        with MetricsUtils.stage(name='validate'):
+            return [data_object_type.model_validate(dict(zip(row_mapping.columns, row))) for row in rows]
+
+    def get_all_table_dicts(self, table_name: str, data_object_type, exclude: List[str] = None,
+                            order_by: str = None) -> List[Dict]:
+        """
+        Get all the table rows straight as dicts, without building models
+
+        :param table_name:
+        :param data_object_type:
+        :param exclude: Model fields not to read
+        :param order_by: Column to order the rows by
+        :return:
+        """
+        columns = tuple(field for field in data_object_type.model_fields.keys() if field not in (exclude or []))
+        row_mapping = RowMapping.get(data_object_type=data_object_type, columns=columns)
+        rows = self.get_all_table_rows(table_name=table_name, row_mapping=row_mapping, order_by=order_by)
+        with MetricsUtils.stage(name='hydrate'):
+            return [row_mapping.to_dict(row=row) for row in rows]
+
+    def get_all_table_rows(self, table_name: str, row_mapping: RowMapping, order_by: str = None) -> List[tuple]:
+        # Selecting only the model columns, so columns the model doesn't declare are never read
+        query = f"SELECT {', '.join(row_mapping.columns)} FROM {table_name}"
+        if order_by:
+            query += f" ORDER BY {order_by}"
         try:
             self._cursor.execute(query)
-            rows = self._cursor.fetchall()
-            data = []
-            for row in rows:
-                data_dict = dict()
-                for key, value in zip(object_keys, row):
-                    data_dict[key] = value
-                data.append(data_dict)
-
-            data_objects = []
-            for index, data_dict_entry in enumerate(data):
-                obj = data_object_type.model_validate(data_dict_entry)
-                data_objects.append(obj)
-
-            return data_objects
-        except sqlite3.Error as e:
-            print(f"(get_all_table_data) Error retrieving data: {e}")
+            return self._cursor.fetchall()
+        except sqlite3.Error as e:
+            logger.error("(get_all_table_data) Error retrieving data: %s", e)
             raise e
-        except Exception as e:
-            print(f"Error while trying to get_all_table_data, except: {str(e)}")
+
+    def get_page(self, table_name: str, columns: List[str], key_column: str, filter_data: dict = None,
+                 min_values: dict = None, max_values: dict = None, after_key=None, limit: int = None) -> List[Dict]:
+        """
+        Get the rows matching the filters, ordered by the key column.
+        Pages are keyset paginated, the next page starts after the last key of the previous page.
+
+        :param table_name:
+        :param columns: Columns to select
+        :param key_column: Unique column the rows are ordered by
+        :param filter_data: Columns values to be equal to
+        :param min_values: Columns minimum values (inclusive)
+        :param max_values: Columns maximum values (inclusive)
+        :param after_key: Last key of the previous page
+        :param limit: Maximum number of rows, default is all the rows
+        :return: Rows as dicts of the selected columns
+        """
+        if not self.is_table_exists(table_name=table_name):
+            return []
+
+        conditions = []
+        params = []
+        for operator, values in (("=", filter_data), (">=", min_values), ("<=", max_values)):
+            for column, value in (values or {}).items():
+                conditions.append(f"{column} {operator} ?")
+                params.append(value)
+        if after_key is not None:
+            conditions.append(f"{key_column} > ?")
+            params.append(after_key)
+
+        query = f"SELECT {', '.join(columns)} FROM {table_name}"
+        if conditions:
+            query += f" WHERE {' AND '.join(conditions)}"
+        query += f" ORDER BY {key_column}"
+        if limit is not None:
+            query += " LIMIT ?"
+            params.append(limit)
+
+        try:
+            self._cursor.execute(query, params)
+            return [dict(zip(columns, row)) for row in self._cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error("(get_page) Error retrieving data: %s", e)
             raise e
 
-    def delete_all_table(self, table_name: str):
-        if self.is_table_exists(table_name=table_name):
-            self._cursor.execute(f"DELETE FROM {table_name}")
-            self._db.commit()
+    def get_data_by_filter(self, table_name: str, data_object_type, data_filter: dict) -> list:
+        object_keys = self.get_model_columns(data_object_type=data_object_type)
+        query = f"SELECT {', '.join(object_keys)} FROM {table_name}"
+        if data_filter:
+            query += f" WHERE {self.build_where_clause(filter_data=data_filter)}"
+        try:
+            self._cursor.execute(query, tuple(data_filter.values()))
+            return [data_object_type.model_validate(dict(zip(object_keys, row))) for row in self._cursor.fetchall()]
+        except sqlite3.Error as e:
+            logger.error("(get_data_by_filter) Error retrieving data: %s", e)
+            raise e
 
-    def export_table_to_json(self, table_name, json_file_path):
-        query = f"SELECT * FROM {table_name}"
+    def get_data_by_key(self, table_name: str, data_object_type, key_column: str, key):
+        """
+        Get a single row by its key, with a point query on the key index
 
+        :param table_name:
+        :param data_object_type:
+        :param key_column:
+        :param key:
+        :return: The row as a compact record of the model fields, None if there is no such row
+        """
+        if not self.is_table_exists(table_name=table_name):
+            return None
+
+        row_mapping = RowMapping.get(data_object_type=data_object_type)
+        query = f"SELECT {', '.join(row_mapping.columns)} FROM {table_name} WHERE {key_column} = ? LIMIT 1"
         try:
-            self._cursor.execute(query)
-            rows = self._cursor.fetchall()
+            self._cursor.execute(query, (key,))
+            row = self._cursor.fetchone()
+            return row_mapping.to_record(row=row) if row else None
+        except sqlite3.Error as e:
+            logger.error("(get_data_by_key) Error retrieving data: %s", e)
+            raise e
 
-            columns = [description[0] for description in self._cursor.description]
+    def iter_column_data(self, table_name: str, key_column: str, column: str, batch_size: int = 100):
+        """
+        Iterate over (key, value) pairs of a column without loading the whole column to memory,
+        rows with null value are skipped
 
-            data = []
-            for row in rows:
-                row_dict = dict(zip(columns, row))
-                data.append(row_dict)
+        :param table_name:
+        :param key_column:
+        :param column:
+        :param batch_size:
+        :return:
+        """
+        cursor = self._db.cursor()
+        try:
+            cursor.execute(f"SELECT {key_column}, {column} FROM {table_name} WHERE {column} IS NOT NULL")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row[0], row[1]
+        finally:
+            cursor.close()
 
-            with open(json_file_path, 'w') as json_file:
-                json.dump(data, json_file, indent=2)
+    def iter_table_batches(self, table_name: str, columns: List[str], order_by: str = None,
+                           batch_size: int = 1000):
+        """
+        Iterate over batches of the table rows, with a cursor of its own, without loading the whole table to memory
+
+        :param table_name:
+        :param columns: Columns to select
+        :param order_by: Column to order the rows by
+        :param batch_size: Rows fetched at a time
+        :return: Lists of rows
+        """
+        if not self.is_table_exists(table_name=table_name):
+            return
+
+        query = f"SELECT {', '.join(columns)} FROM {table_name}"
+        if order_by:
+            query += f" ORDER BY {order_by}"
+        cursor = self._db.cursor()
+        try:
+            cursor.execute(query)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield rows
+        finally:
+            cursor.close()
 
-            print(f"Data from '{table_name}' exported to '{json_file_path}' successfully.")
+    def drop_column(self, table_name: str, column: str):
+        try:
+            self._cursor.execute(f"ALTER TABLE {table_name} DROP COLUMN {column}")
+            self._commit()
+            logger.info("Dropped column `%s` from `%s`", column, table_name)
+        except sqlite3.Error as e:
+            # Old SQLite versions can't drop columns, at least release the data
+            logger.warning("Cannot drop column `%s` from `%s`, clearing it instead, except: %s", column, table_name, e)
+            self._cursor.execute(f"UPDATE {table_name} SET {column} = NULL")
+            self._commit()
+
+    def add_column_if_missing(self, table_name: str, column: str, column_type: str) -> bool:
+        """
+        Add a column to a table created before the column was declared
+
+        :param table_name:
+        :param column:
+        :param column_type:
+        :return: Whether the column was added
+        """
+        if column in self.get_table_columns(table_name=table_name):
+            return False
+
+        try:
+            self._cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN {column} {column_type}")
+            self._commit()
+        except sqlite3.OperationalError as e:
+            # Added by another worker since the columns were read
+            if "duplicate column" in str(e):
+                return False
+            raise e
+        logger.info("Added column `%s` to `%s`", column, table_name)
+        return True
+
+    def update_column_values(self, table_name: str, key_column: str, column: str, values: dict) -> int:
+        """
+        Set a column value of many rows in a single transaction
+
+        :param table_name:
+        :param key_column:
+        :param column:
+        :param values: Column value by the row key
+        :return: Number of rows given
+        """
+        query = f"UPDATE {table_name} SET {column} = ? WHERE {key_column} = ?"
+        try:
+            with self.transaction():
+                self._cursor.executemany(query, ((value, key) for key, value in values.items()))
+            return len(values)
         except sqlite3.Error as e:
-            print(f"Error exporting data: {e}")
+            logger.error("Error updating `%s` of `%s`: %s", column, table_name, e)
+            raise e
 
     @staticmethod
-    def _base_model_object_valid_by_data_filter(data_filter: dict, base_model_object) -> bool:
+    def get_staging_table_name(table_name: str) -> str:
+        return f"{table_name}_staging"
+
+    def create_staging_table(self, table_name: str) -> str:
         """
-        Given a base model pydantic object and a data_filter
-        if each key value exists also in the object - return true, else - falses
-        :param data_filter:
-        :param base_model_object:
+        Create an empty copy of the table, to be filled and then swapped in with `swap_staging_table`
+
+        :param table_name:
+        :return: Staging table name
+        """
+        staging_table_name = self.get_staging_table_name(table_name=table_name)
+        self._cursor.execute(f"DROP TABLE IF EXISTS {staging_table_name}")
+        self._cursor.execute(f"CREATE TABLE {staging_table_name}{CommandsFormats.CREATE_TABLE_FORMAT[table_name]}")
+        self._commit()
+        return staging_table_name
+
+    def swap_staging_table(self, table_name: str):
+        """
+        Replace the table rows with the staging table rows in a single transaction,
+        readers see either all the old rows or all the new rows
+
+        :param table_name:
         :return:
         """
+        staging_table_name = self.get_staging_table_name(table_name=table_name)
+        if not self.is_table_exists(table_name=table_name):
+            self.create_table(table_name=table_name)
+
+        columns = ', '.join(self.get_table_columns(table_name=staging_table_name))
         try:
-            for key, value in data_filter.items():
-                if base_model_object.model_dump()[key] != value:
-                    return False
-            return True
-        except (KeyError, ValueError):
-            return False
-        except Exception as e:
-            print(f"Cannot check if base model object is valid by data filter, except: {str(e)}")
-            return False
+            with self.transaction():
+                self._cursor.execute(f"DELETE FROM {table_name}")
+                self._cursor.execute(f"INSERT INTO {table_name} ({columns}) SELECT {columns} FROM {staging_table_name}")
+            self._cursor.execute(f"DROP TABLE {staging_table_name}")
+            self._commit()
+        except sqlite3.Error as e:
+            logger.error("Error swapping staging table of `%s`: %s", table_name, e)
+            raise e
+
+    def delete_all_table(self, table_name: str):
+        if self.is_table_exists(table_name=table_name):
+            self._cursor.execute(f"DELETE FROM {table_name}")
+            self._commit()
+
+    def get_catalog_version(self, table_name: str) -> int:
+        """
+        Get the current version of a catalog table, shared by all the processes using the DB
+
+        :param table_name:
+        :return:
+        """
+        query = f"SELECT version FROM {DBTable.CATALOG_VERSIONS.value} WHERE table_name = ?"
+        self._cursor.execute(query, (table_name,))
+        result = self._cursor.fetchone()
+        if result:
+            return result[0]
+        return 0
+
+    def bump_catalog_version(self, table_name: str) -> int:
+        """
+        Increase the version of a catalog table, any snapshot taken on an older version becomes stale
+
+        :param table_name:
+        :return:
+        """
+        query = (f"INSERT INTO {DBTable.CATALOG_VERSIONS.value} (table_name, version) VALUES (?, 1) "
+                 f"ON CONFLICT(table_name) DO UPDATE SET version = version + 1")
+        self._cursor.execute(query, (table_name,))
+        self._commit()
+        return self.get_catalog_version(table_name=table_name)
+
+    def get_column_values(self, table_name: str, key_column: str, column: str, keys: list = None) -> dict:
+        """
+        Get a column value of each row, by the row key
+
+        :param table_name:
+        :param key_column:
+        :param column:
+        :param keys: Keys of the wanted rows, default is all the rows
+        :return:
+        """
+        if not self.is_table_exists(table_name=table_name):
+            return {}
+
+        query = f"SELECT {key_column}, {column} FROM {table_name}"
+        params = ()
+        if keys is not None:
+            query += f" WHERE {key_column} IN (SELECT value FROM json_each(?))"
+            params = (json.dumps(keys),)
+        self._cursor.execute(query, params)
+        return {row[0]: row[1] for row in self._cursor.fetchall()}
+
+    def add_image_reference(self, digest: str):
+        query = (f"INSERT INTO {DBTable.IMAGE_BLOBS.value} (digest, ref_count) VALUES (?, 1) "
+                 f"ON CONFLICT(digest) DO UPDATE SET ref_count = ref_count + 1")
+        self._cursor.execute(query, (digest,))
+        self._commit()
+
+    def release_image_reference(self, digest: str) -> int:
+        """
+        Remove a reference to a content addressed image, the image row is deleted with its last reference
+
+        :param digest:
+        :return: Number of references left
+        """
+        table_name = DBTable.IMAGE_BLOBS.value
+        with self.transaction():
+            self._cursor.execute(f"UPDATE {table_name} SET ref_count = ref_count - 1 WHERE digest = ?", (digest,))
+            self._cursor.execute(f"SELECT ref_count FROM {table_name} WHERE digest = ?", (digest,))
+            result = self._cursor.fetchone()
+            ref_count = result[0] if result else 0
+            if ref_count <= 0:
+                self._cursor.execute(f"DELETE FROM {table_name} WHERE digest = ?", (digest,))
+        return max(ref_count, 0)
+
+    def export_table_to_json(self, table_name, json_file_path, batch_size: int = 1000):
+        """
+        Export the table to a JSON list of row objects, streamed to the file so the table is never loaded to memory
+
+        :param table_name:
+        :param json_file_path:
+        :param batch_size: Rows fetched at a time
+        :return:
+        """
+        try:
+            columns = self.get_table_columns(table_name=table_name)
+            with open(json_file_path, 'w') as json_file:
+                # Same format as `json.dump(rows, json_file, indent=2)`
+                rows_count = 0
+                for rows in self.iter_table_batches(table_name=table_name, columns=columns, batch_size=batch_size):
+                    for row in rows:
+                        json_file.write(',\n  ' if rows_count else '[\n  ')
+                        json_file.write(json.dumps(dict(zip(columns, row)), indent=2).replace('\n', '\n  '))
+                        rows_count += 1
+                json_file.write('\n]' if rows_count else '[]')
+
+            logger.info("Data from `%s` exported to `%s` successfully.", table_name, json_file_path)
+        except sqlite3.Error as e:
+            logger.error("Error exporting data: %s", e)
 
     def exists(self, table_name, data_filter: dict) -> bool:
-        data = self.get_all_table_data(table_name=table_name, data_object_type=NewsLetter)
-        for data_obj in data:
-            if self._base_model_object_valid_by_data_filter(data_filter=data_filter, base_model_object=data_obj):
-                return True
-        return False
+        if not data_filter or not self.is_table_exists(table_name=table_name):
+            return False
+
+        where_clause = self.build_where_clause(filter_data=data_filter)
+        query = f"SELECT 1 FROM {table_name} WHERE {where_clause} LIMIT 1"
+        self._cursor.execute(query, tuple(data_filter.values()))
+        return self._cursor.fetchone() is not None
@@ -0,0 +1,247 @@
+import functools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Callable, Any, Optional
+
+import anyio.to_thread
+from a2wsgi import WSGIMiddleware
+from pydantic import ValidationError
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import Response, JSONResponse, FileResponse
+from starlette.routing import Route, Mount
+
+from db.db_consts import DBTable
+from manager import app
+from manager.routes import manager_api, resolve_image_file, get_image_offload_headers, image_file_cache
+from objects.get_books_request_data import GetBooksRequestData
+from objects.search_books_request_data import SearchBooksRequestData
+from utils.cache_utils import CatalogPayload, ImageFile
+from utils.consts import ServerConsts, CatalogPayloadConsts, ImageDerivativeConsts, AsgiConsts, MetricsConsts, \
+    ImageServingConsts
+from utils.http_utils import HttpUtils
+from utils.log_utils import LogUtils
+from utils.metrics_utils import MetricsUtils
+
+logger = LogUtils.get_logger(__name__)
+
+# Async versions of the read routes, blocking work runs in a thread pool so the event loop is never blocked.
+# All the other routes are served by the Flask app.
+
+
+def timed_route(handler):
+    """
+    Report the handler latency, labeled by the handler name like the Flask routes (by endpoint)
+    """
+    route = handler.__name__
+
+    @functools.wraps(handler)
+    async def wrapper(request: Request) -> Response:
+        start_time = time.perf_counter()
+        request_profile = MetricsUtils.get_request_profile(
+            profile_header=request.headers.get(MetricsConsts.PROFILE_HEADER)
+        )
+        if request_profile:
+            request_profile.start()
+        status = 500
+        try:
+            response = await handler(request)
+            status = response.status_code
+            if request_profile:
+                response.headers['Server-Timing'] = request_profile.stop(route=route)
+            return response
+        finally:
+            MetricsUtils.observe_request(route=route, method=request.method, status=status,
+                                         seconds=time.perf_counter() - start_time)
+
+    return wrapper
+
+
+def set_cache_headers(response: Response, etag: str, route_name: str) -> Response:
+    response.headers['ETag'] = f'"{etag}"'
+    response.headers['Cache-Control'] = ServerConsts.CACHE_CONTROL_BY_ROUTE[route_name]
+    return response
+
+
+def not_modified_response(etag: str, route_name: str) -> Response:
+    return set_cache_headers(response=Response(status_code=304), etag=etag, route_name=route_name)
+
+
+def is_not_modified(request: Request, etag: str) -> bool:
+    return HttpUtils.is_etag_matching(if_none_match=request.headers.get('If-None-Match'), etag=etag)
+
+
+def error_response(desc: str, status_code: int) -> Response:
+    return Response(desc, status_code=status_code, media_type='application/json')
+
+
+async def catalog_payload_response(request: Request, table_name: str, route_name: str,
+                                   get_payload: Callable[[int], CatalogPayload], empty_desc: str) -> Response:
+    encoding = HttpUtils.choose_content_encoding(accept_encoding=request.headers.get('Accept-Encoding'),
+                                                 encodings=CatalogPayloadConsts.ENCODINGS)
+    version = await run_in_threadpool(manager_api.get_catalog_version, table_name=table_name)
+    etag = HttpUtils.make_etag(table_name, version, encoding or 'identity')
+    if is_not_modified(request=request, etag=etag):
+        return not_modified_response(etag=etag, route_name=route_name)
+
+    payload = await run_in_threadpool(get_payload, version)
+    if not payload.items_count:
+        logger.debug(empty_desc)
+        return Response(status_code=204)
+
+    headers = {'Vary': 'Accept-Encoding'}
+    if encoding:
+        headers['Content-Encoding'] = encoding
+    response = Response(payload.get_body(encoding=encoding), media_type='application/json', headers=headers)
+    return set_cache_headers(response=response, etag=etag, route_name=route_name)
+
+
+async def versioned_json_response(request: Request, table_name: str, route_name: str,
+                                  get_data: Callable[[int], Any], not_found_desc: str = None) -> Response:
+    """
+    Respond with data read from a catalog table, its entity tag is the catalog version
+    """
+    version = await run_in_threadpool(manager_api.get_catalog_version, table_name=table_name)
+    etag = HttpUtils.make_etag(table_name, version, 'identity')
+    if is_not_modified(request=request, etag=etag):
+        return not_modified_response(etag=etag, route_name=route_name)
+
+    data = await run_in_threadpool(get_data, version)
+    if data is None:
+        return error_response(desc=not_found_desc, status_code=404)
+    return set_cache_headers(response=JSONResponse(data), etag=etag, route_name=route_name)
+
+
+@timed_route
+async def get_books(request: Request) -> Response:
+    parse_info = request.query_params.get("parse_info")
+    page_args = {key: value for key, value in request.query_params.items() if key in GetBooksRequestData.model_fields}
+    if not page_args:
+        return await catalog_payload_response(
+            request=request, table_name=DBTable.BOOKS.value, route_name='get_books', empty_desc="No books found",
+            get_payload=lambda version: manager_api.get_books_payload(parse_info=parse_info, version=version)
+        )
+
+    try:
+        request_data = GetBooksRequestData.model_validate(page_args)
+    except ValidationError as e:
+        return error_response(desc=f"Wrong books query, {str(e)}", status_code=400)
+    return await versioned_json_response(
+        request=request, table_name=DBTable.BOOKS.value, route_name='get_books',
+        get_data=lambda version: manager_api.get_books_page(request_data=request_data, parse_info=parse_info)
+    )
+
+
+@timed_route
+async def search_books(request: Request) -> Response:
+    try:
+        request_data = SearchBooksRequestData.model_validate(dict(request.query_params))
+    except ValidationError as e:
+        return error_response(desc=f"Wrong search query, {str(e)}", status_code=400)
+    return await versioned_json_response(
+        request=request, table_name=DBTable.BOOKS.value, route_name='search_books',
+        get_data=lambda version: manager_api.search_books(request_data=request_data)
+    )
+
+
+@timed_route
+async def get_book(request: Request) -> Response:
+    catalog_number: int = request.path_params['catalog_number']
+    parse_info = request.query_params.get("parse_info")
+    return await versioned_json_response(
+        request=request, table_name=DBTable.BOOKS.value, route_name='get_book',
+        not_found_desc=f"Book `{catalog_number}` not found",
+        get_data=lambda version: manager_api.get_book(catalog_number=catalog_number, parse_info=parse_info,
+                                                      version=version)
+    )
+
+
+@timed_route
+async def get_banners(request: Request) -> Response:
+    return await catalog_payload_response(
+        request=request, table_name=DBTable.BANNERS.value, route_name='get_banners', empty_desc="No banners found",
+        get_payload=lambda version: manager_api.get_banners_payload(version=version)
+    )
+
+
+@timed_route
+async def get_banner(request: Request) -> Response:
+    banner_id: int = request.path_params['banner_id']
+    return await versioned_json_response(
+        request=request, table_name=DBTable.BANNERS.value, route_name='get_banner',
+        not_found_desc=f"Banner `{banner_id}` not found",
+        get_data=lambda version: manager_api.get_banner(banner_id=banner_id, version=version)
+    )
+
+
+def resolve_existing_image_file(filename: str, size: str, image_format: str) -> Optional[ImageFile]:
+    """
+    Resolve the image file, making sure it still exists.
+    The file is opened only once the response started, too late to answer 404.
+
+    :param filename:
+    :param size:
+    :param image_format:
+    :return: The image file, None if the file name is not valid
+    :raises FileNotFoundError: If there is no such image
+    """
+    image_file = resolve_image_file(filename=filename, size=size, image_format=image_format)
+    if image_file is not None and not os.path.exists(image_file.path):
+        # Deleted since its metadata was cached
+        image_file_cache.invalidate(key=(filename, size, image_format))
+        image_file = resolve_image_file(filename=filename, size=size, image_format=image_format)
+    return image_file
+
+
+@timed_route
+async def get_book_image(request: Request) -> Response:
+    filename: str = request.path_params['filename']
+    size = request.query_params.get("size", ImageDerivativeConsts.ORIGINAL_SIZE)
+    image_format = request.query_params.get("format", ImageDerivativeConsts.ORIGINAL_FORMAT)
+    if size not in ImageDerivativeConsts.SIZES or image_format not in ImageDerivativeConsts.FORMATS:
+        return error_response(desc=f"Unknown image size `{size}` or format `{image_format}`", status_code=400)
+
+    try:
+        image_file = await run_in_threadpool(resolve_existing_image_file, filename=filename, size=size,
+                                             image_format=image_format)
+    except FileNotFoundError:
+        image_file = None
+    if image_file is None:
+        return error_response(desc=f"Image `{filename}` not found", status_code=404)
+
+    if is_not_modified(request=request, etag=image_file.etag):
+        return not_modified_response(etag=image_file.etag, route_name=image_file.route_name)
+
+    if ImageServingConsts.OFFLOAD:
+        response = Response(media_type=image_file.mimetype, headers=get_image_offload_headers(image_file=image_file))
+    else:
+        # The file is streamed without blocking the event loop, range requests included
+        response = FileResponse(image_file.path, stat_result=image_file.stat_result, media_type=image_file.mimetype)
+    MetricsUtils.count_image_bytes_served(size=image_file.stat_result.st_size)
+    return set_cache_headers(response=response, etag=image_file.etag, route_name=image_file.route_name)
+
+
+@asynccontextmanager
+async def lifespan(_app: Starlette):
+    anyio.to_thread.current_default_thread_limiter().total_tokens = AsgiConsts.THREADPOOL_SIZE
+    yield
+
+
+asgi_app = Starlette(
+    routes=[
+        Route('/get_books', get_books),
+        Route('/search_books', search_books),
+        Route('/get_book/{catalog_number:int}', get_book),
+        Route('/get_banners', get_banners),
+        Route('/get_banner/{banner_id:int}', get_banner),
+        Route('/get_image/{filename}', get_book_image),
+        Mount('/', app=WSGIMiddleware(app, workers=AsgiConsts.WSGI_WORKERS))
+    ],
+    # Same as the Flask app CORS, which keeps handling the CORS of its own routes
+    middleware=[Middleware(CORSMiddleware, allow_origins=['*'], allow_methods=['*'], allow_headers=['*'])],
+    lifespan=lifespan
+)
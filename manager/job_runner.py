@@ -0,0 +1,203 @@
+import json
+import os
+import queue
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional
+
+from db.db_consts import DBTable
+from db.db_utils import DBUtils
+from objects.job import Job
+from utils.consts import JobStatus, JobConsts
+from utils.log_utils import LogUtils
+
+logger = LogUtils.get_logger(__name__)
+
+
+class JobProgress:
+    """
+    Progress reporter given to a running job, progress is written to the jobs table at most once per interval
+    """
+
+    def __init__(self, db_utils: DBUtils, job_id: str):
+        self._db_utils = db_utils
+        self._job_id = job_id
+        self._progress = {}
+        self._last_write_time = 0
+
+    def update(self, force: bool = False, **progress):
+        self._progress.update(progress)
+        if force or time.monotonic() - self._last_write_time >= JobConsts.PROGRESS_INTERVAL:
+            self._db_utils.update_data_by_filter(
+                table_name=DBTable.JOBS.value,
+                data={"progress": json.dumps(self._progress), "updated_at": datetime.now().isoformat()},
+                filter_data={"job_id": self._job_id}
+            )
+            self._last_write_time = time.monotonic()
+
+
+class JobHeartbeat:
+    """
+    Writes the heartbeat of a running job from its own thread, so a long job step doesn't delay it
+    """
+
+    def __init__(self, db_utils: DBUtils, job_id: str):
+        self._db_utils = db_utils
+        self._job_id = job_id
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name=f"job-heartbeat-{job_id}", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._stopped.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stopped.wait(timeout=JobConsts.HEARTBEAT_INTERVAL):
+            try:
+                self._db_utils.update_data_by_filter(
+                    table_name=DBTable.JOBS.value, data={"heartbeat_at": datetime.now().isoformat()},
+                    filter_data={"job_id": self._job_id, "owner_host": socket.gethostname(),
+                                 "owner_pid": os.getpid()}
+                )
+            except Exception as e:
+                logger.error("Error writing the heartbeat of job `%s`, except: %s", self._job_id, e)
+
+
+class JobRunner:
+    """
+    Runs long admin operations on a background thread, one job at a time.
+    Jobs are kept in the jobs table, so queued jobs and jobs interrupted by a restart are run again on startup.
+    A job is claimed before it runs, so when many workers share the DB every job runs only once.
+    The claiming worker is recorded as the job owner, a running job is run again only when its owner is gone.
+    """
+
+    def __init__(self, handlers: Dict[str, Callable[[JobProgress], None]]):
+        self.db_utils = DBUtils()
+        self._handlers = handlers
+        self._queue = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        self.db_utils.create_table(table_name=DBTable.JOBS.value)
+        self.requeue_stale_jobs()
+        for job in self.db_utils.get_data_by_filter(table_name=DBTable.JOBS.value, data_object_type=Job,
+                                                    data_filter={"status": JobStatus.QUEUED.value}):
+            self._queue.put(job.job_id)
+        self._ensure_thread()
+
+    def requeue_stale_jobs(self):
+        stale_before = (datetime.now() - timedelta(seconds=JobConsts.STALE_AFTER_SECONDS)).isoformat()
+        running_jobs = self.db_utils.get_data_by_filter(table_name=DBTable.JOBS.value, data_object_type=Job,
+                                                        data_filter={"status": JobStatus.RUNNING.value})
+        for job in running_jobs:
+            if not self.is_owner_gone(job=job, stale_before=stale_before):
+                continue
+            logger.warning("Job `%s` was interrupted, queueing it again", job.job_id)
+            # Unless the owner wrote a heartbeat since it was read
+            filter_data = {"job_id": job.job_id, "status": JobStatus.RUNNING.value, "updated_at": job.updated_at}
+            if job.heartbeat_at is not None:
+                filter_data["heartbeat_at"] = job.heartbeat_at
+            self.db_utils.update_data_by_filter(
+                table_name=DBTable.JOBS.value,
+                data={"status": JobStatus.QUEUED.value, "updated_at": datetime.now().isoformat(), "owner_host": None,
+                      "owner_pid": None, "heartbeat_at": None},
+                filter_data=filter_data
+            )
+
+    @staticmethod
+    def is_owner_gone(job: Job, stale_before: str) -> bool:
+        """
+        :param job: Running job
+        :param stale_before: Time before which a heartbeat is too old
+        :return: True if the worker running the job doesn't exist anymore
+        """
+        if job.owner_host == socket.gethostname() and job.owner_pid is not None \
+                and not JobRunner.is_process_alive(pid=job.owner_pid):
+            return True
+        # Jobs claimed before the owner was recorded have only the progress time
+        last_seen = job.heartbeat_at if job.heartbeat_at is not None else job.updated_at
+        return last_seen < stale_before
+
+    @staticmethod
+    def is_process_alive(pid: int) -> bool:
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            # A process of another user
+            return True
+        return True
+
+    def _ensure_thread(self):
+        with self._lock:
+            # Threads don't survive a fork, a forked worker starts its own thread
+            if self._thread is None or not self._thread.is_alive() or self._thread_pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name="job-runner", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def enqueue(self, job_type: str) -> str:
+        if job_type not in self._handlers:
+            raise ValueError(f"Unknown job type `{job_type}`")
+
+        job_id = str(uuid.uuid4())
+        now = datetime.now().isoformat()
+        self.db_utils.insert_data(table_name=DBTable.JOBS.value, data={
+            "job_id": job_id, "job_type": job_type, "status": JobStatus.QUEUED.value, "progress": json.dumps({}),
+            "error": None, "created_at": now, "updated_at": now
+        })
+        self._queue.put(job_id)
+        self._ensure_thread()
+        return job_id
+
+    def get_job(self, job_id: str) -> Optional[Job]:
+        jobs = self.db_utils.get_data_by_filter(table_name=DBTable.JOBS.value, data_object_type=Job,
+                                                data_filter={"job_id": job_id})
+        if not jobs:
+            return None
+        return jobs[0]
+
+    def _claim_job(self, job_id: str) -> bool:
+        now = datetime.now().isoformat()
+        updated_rows = self.db_utils.update_data_by_filter(
+            table_name=DBTable.JOBS.value,
+            data={"status": JobStatus.RUNNING.value, "updated_at": now, "owner_host": socket.gethostname(),
+                  "owner_pid": os.getpid(), "heartbeat_at": now},
+            filter_data={"job_id": job_id, "status": JobStatus.QUEUED.value}
+        )
+        return updated_rows == 1
+
+    def _finish_job(self, job_id: str, status: str, error: str = None):
+        self.db_utils.update_data_by_filter(
+            table_name=DBTable.JOBS.value,
+            data={"status": status, "error": error, "updated_at": datetime.now().isoformat()},
+            filter_data={"job_id": job_id}
+        )
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                if not self._claim_job(job_id=job_id):
+                    continue
+                job = self.get_job(job_id=job_id)
+                logger.info("Running job `%s` (%s)", job_id, job.job_type)
+                with JobHeartbeat(db_utils=self.db_utils, job_id=job_id):
+                    self._handlers[job.job_type](JobProgress(db_utils=self.db_utils, job_id=job_id))
+                self._finish_job(job_id=job_id, status=JobStatus.DONE.value)
+                logger.info("Job `%s` done", job_id)
+            except Exception as e:
+                logger.exception("Job `%s` failed, except: %s", job_id, e)
+                self._finish_job(job_id=job_id, status=JobStatus.FAILED.value, error=str(e))
+            finally:
+                self._queue.task_done()
@@ -1,33 +1,161 @@
 import json
 import os
-from typing import List
+import zipfile
+from contextlib import contextmanager
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import List, Dict, Callable, Iterator
 
 import requests
 
-from db.db_consts import DBTable, ProductIDKeys
+from db.db_consts import DBTable, ProductIDKeys, LegacyColumns, CommandsFormats, BookColumns, SchemaConsts
 from db.db_utils import DBUtils
+from manager.newsletter_buffer import NewsletterBuffer
 from objects.banner import Banner
 from objects.book import Book
+from objects.get_books_request_data import GetBooksRequestData
 from objects.news_letter import NewsLetter
-from utils.consts import InsertType
+from objects.newsletter_export_request_data import NewsletterExportRequestData
+from objects.search_books_request_data import SearchBooksRequestData
+from utils.cache_utils import CatalogCache, CatalogPayload, ItemCache
+from utils.consts import InsertType, CatalogResetConsts, BooksPageConsts, SearchBooksConsts, ExportFormat, \
+    NewsletterExportConsts, NewsletterSignupConsts, DurabilityMode
 from utils.content_utils import ContentUtils
+from utils.export_utils import ExportUtils
+from utils.fetch_utils import ImageFetcher
 from utils.exceptions import UnknownInsertType
+from utils.log_utils import LogUtils
+from utils.metrics_utils import MetricsUtils
+
+logger = LogUtils.get_logger(__name__)
 
 
 class ManagerAPI:
     _AUTH_TOKEN = os.getenv(key="AUTH_TOKEN")
+    DATA_OBJECT_TYPE_BY_INSERT_TYPE = {
+        InsertType.BOOK.value: Book,
+        InsertType.BANNER.value: Banner
+    }
+    # Stored as integers by SQLite
+    BOOK_BOOLEAN_FIELDS = [name for name, field in Book.model_fields.items() if field.annotation is bool]
 
     def __init__(self):
         self.db_utils = DBUtils()
         self.content_utils = ContentUtils()
+        self.catalog_cache = CatalogCache()
+        self.item_cache = ItemCache()
+        self.newsletter_buffer = NewsletterBuffer(
+            flush_interval_ms=NewsletterSignupConsts.COMMIT_DELAY_MS
+            if NewsletterSignupConsts.DURABILITY == DurabilityMode.GROUP_COMMIT
+            else NewsletterSignupConsts.FLUSH_INTERVAL_MS
+        )
+        self.setup_schema()
+
+    def setup_schema(self):
+        """
+        Create the missing tables and migrate the tables of older versions.
+        Runs on the startup of every worker, the workers starting together wait for each other, and the migrations
+        run only once per schema version.
+
+        :return:
+        """
+        with self.db_utils.schema_lock():
+            self.db_utils.create_table(table_name=DBTable.CATALOG_VERSIONS.value)
+            self.db_utils.create_table(table_name=DBTable.IMAGE_BLOBS.value)
+            schema_version = self.db_utils.get_schema_version()
+            if schema_version >= SchemaConsts.VERSION:
+                return
+
+            logger.info("Migrating the DB schema from version %d to %d", schema_version, SchemaConsts.VERSION)
+            if schema_version < SchemaConsts.SEARCH_TABLES_VERSION:
+                for table_name in CommandsFormats.SEARCH_TABLES.keys():
+                    self.db_utils.drop_search_table(table_name=table_name)
+            self.migrate_books_image_data_to_disk()
+            self.add_missing_columns()
+            for table_name in CommandsFormats.UNIQUE_KEYS.keys():
+                self.db_utils.ensure_unique_key(table_name=table_name)
+            for table_name in CommandsFormats.INDEXES.keys():
+                if self.db_utils.is_table_exists(table_name=table_name):
+                    self.db_utils.create_indexes(table_name=table_name)
+            for table_name in CommandsFormats.SEARCH_TABLES.keys():
+                if self.db_utils.is_table_exists(table_name=table_name):
+                    self.db_utils.create_search_table(table_name=table_name)
+            self.db_utils.set_schema_version(version=SchemaConsts.VERSION)
 
     def set_db_utils_connection_if_needed(self):
-        if self.db_utils.initialized:
+        if not self.db_utils.initialized:
             self.db_utils = DBUtils()
 
+    def migrate_books_image_data_to_disk(self):
+        """
+        Move image bytes stored in the books table to the images directory, and drop them from the table
+
+        :return:
+        """
+        table_name = DBTable.BOOKS.value
+        image_data_column = LegacyColumns.BOOKS_IMAGE_DATA.value
+        if image_data_column not in self.db_utils.get_table_columns(table_name=table_name):
+            return
+
+        logger.info("Moving `%s` of `%s` to disk", image_data_column, table_name)
+        for catalog_number, image_data in self.db_utils.iter_column_data(
+                table_name=table_name, key_column=ProductIDKeys.BOOKS.value, column=image_data_column
+        ):
+            file_name = self.content_utils.get_image_file_name(insert_type=InsertType.BOOK.value, item_id=catalog_number)
+            if not self.content_utils.image_exists(image_file_name=file_name):
+                self.content_utils.add_image(image_data=image_data, file_name=file_name)
+
+        self.db_utils.drop_column(table_name=table_name, column=image_data_column)
+
+    def add_missing_columns(self):
+        for table_name, columns in CommandsFormats.ADDED_COLUMNS.items():
+            if not self.db_utils.is_table_exists(table_name=table_name):
+                continue
+            for column, column_type in columns.items():
+                added = self.db_utils.add_column_if_missing(table_name=table_name, column=column,
+                                                            column_type=column_type)
+                if added and table_name == DBTable.BOOKS.value and column == BookColumns.INFO_HTML:
+                    self.migrate_books_info_html()
+
+    def migrate_books_info_html(self):
+        """
+        Render the html info of books written before it was stored
+
+        :return:
+        """
+        table_name = DBTable.BOOKS.value
+        product_id_key = ProductIDKeys.BOOKS.value
+        infos = self.db_utils.get_column_values(table_name=table_name, key_column=product_id_key, column="Info")
+        info_htmls = {catalog_number: self.content_utils.info_html_parser(text_info=info)
+                      for catalog_number, info in infos.items() if info is not None}
+        self.db_utils.update_column_values(table_name=table_name, key_column=product_id_key,
+                                           column=BookColumns.INFO_HTML, values=info_htmls)
+        logger.info("Rendered html info of %d book(s)", len(info_htmls))
+
+    def set_info_html(self, data: dict):
+        """
+        Render the book info to html once, when the book is written, instead of on every read
+
+        :param data: Book data
+        :return:
+        """
+        info = data.get("Info")
+        data[BookColumns.INFO_HTML] = self.content_utils.info_html_parser(text_info=info) if info is not None else None
+
     def check_authentication_token(self, authentication_token: str) -> bool:
         return authentication_token == self._AUTH_TOKEN
 
+    def invalidate_catalog(self, table_name: str):
+        """
+        Mark the cached snapshots of a catalog table as stale, in this process and in every other process
+
+        :param table_name:
+        :return:
+        """
+        self.db_utils.bump_catalog_version(table_name=table_name)
+        self.catalog_cache.invalidate(table_name=table_name)
+        # Cached items are tagged with the old version, dropping them now instead of on their next read
+        self.item_cache.invalidate(table_name=table_name)
+
     def get_product_id_key_by_insert_type(self, insert_type: str):
         return self.db_utils.get_product_id_key_by_insert_type(insert_type=insert_type)
 
@@ -35,55 +163,270 @@ class ManagerAPI:
         item_id = data[self.db_utils.get_product_id_key_by_insert_type(insert_type=insert_type)]
         return item_id
 
-    def insert_data(self, insert_type: str, data: dict, image_data=None, parse: bool = False):
-        print(f"Start manager_api insert_data")
+    def get_image_urls(self, table_name: str, product_id_key: str, item_ids: list = None) -> dict:
+        return self.db_utils.get_column_values(table_name=table_name, key_column=product_id_key, column="ImageURL",
+                                               keys=item_ids)
+
+    @staticmethod
+    def get_update_columns(table_name: str, product_id_key: str, data: dict, update_fields) -> List[str]:
+        """
+        :param table_name:
+        :param product_id_key:
+        :param data: Item data
+        :param update_fields: Fields the client sent
+        :return: Columns to update on an existing item
+        """
+        update_columns = [key for key in data.keys() if key in update_fields and key != product_id_key]
+        if table_name == DBTable.BOOKS.value:
+            # The html info always follows the stored info
+            update_columns = [key for key in update_columns if key != BookColumns.INFO_HTML]
+            if "Info" in update_columns:
+                update_columns.append(BookColumns.INFO_HTML)
+        return update_columns
+
+    @contextmanager
+    def collect_pending_images(self) -> Iterator[Dict[str, str]]:
+        """
+        Collect the images saved by `save_item_image` until `write_items` stores them,
+        the images that weren't stored (the write failed) are deleted at the end of the block
+
+        :return: Temporary file path by image file name
+        """
+        pending_images = {}
         try:
-            print(f"Data to insert: `{data}`")
+            yield pending_images
+        finally:
+            # The stored images were moved from their temporary path
+            for temp_path in pending_images.values():
+                self.content_utils.discard_temp_image(temp_path=temp_path)
+
+    def save_item_image(self, data: dict, image_data, pending_images: Dict[str, str]):
+        """
+        Write the image to a temporary file, and point the item to its content addressed name.
+        The image is stored by `write_items`, after the item reference to it is taken.
+
+        :param data:
+        :param image_data: Bytes or a file like object
+        :param pending_images: Temporary file path by image file name, of the images to store with the items
+        :return:
+        """
+        temp_path, digest = self.content_utils.write_temp_image(image_data=image_data)
+        file_name = self.content_utils.get_image_blob_file_name(digest=digest)
+        if file_name in pending_images:
+            self.content_utils.discard_temp_image(temp_path=temp_path)
+        else:
+            pending_images[file_name] = temp_path
+        data.update({"ImageURL": file_name})
+
+    def release_image(self, image_url: str):
+        digest = self.content_utils.get_image_blob_digest(file_name=image_url)
+        if digest is None:
+            return
+        if self.db_utils.release_image_reference(digest=digest) == 0:
+            self.content_utils.delete_image_if_exists(image_file_name=image_url)
+
+    def update_image_references(self, old_image_urls: dict, new_image_urls: dict,
+                                pending_images: Dict[str, str] = None) -> List[str]:
+        """
+        Update the reference counts of the content addressed images after items image urls changed,
+        an image is deleted when no item references it anymore.
+        Called in the transaction that wrote the items, so a reference is never taken to an image being deleted.
+
+        :param old_image_urls: Image url by item id, before the change
+        :param new_image_urls: Image url by item id, after the change
+        :param pending_images: Temporary file path by image file name, of the images to store
+        :return: File names of the stored images
+        """
+        changed_item_ids = [item_id for item_id in set(old_image_urls.keys()) | set(new_image_urls.keys())
+                            if old_image_urls.get(item_id) != new_image_urls.get(item_id)]
+
+        # Adding the new references first, so an image moved between items is never deleted
+        for item_id in changed_item_ids:
+            digest = self.content_utils.get_image_blob_digest(file_name=new_image_urls.get(item_id))
+            if digest:
+                self.db_utils.add_image_reference(digest=digest)
+        stored_file_names = [file_name for file_name, temp_path in (pending_images or {}).items()
+                             if self.content_utils.store_image_blob(temp_path=temp_path, file_name=file_name)]
+        for item_id in changed_item_ids:
+            self.release_image(image_url=old_image_urls.get(item_id))
+        return stored_file_names
+
+    def write_items(self, table_name: str, product_id_key: str, item_ids: list, write: Callable[[], object],
+                    pending_images: Dict[str, str] = None):
+        """
+        Write items and update the references of their images in a single transaction.
+        The DB write lock is held while the images are stored and deleted, so a concurrent write never references
+        an image that another write deletes.
+
+        :param table_name:
+        :param product_id_key:
+        :param item_ids: Ids of the written items, None if the write may change any item
+        :param write: Writes the items
+        :param pending_images: Temporary file path by image file name, of the images to store with the items
+        :return: The result of `write`
+        """
+        with self.db_utils.transaction():
+            old_image_urls = self.get_image_urls(table_name=table_name, product_id_key=product_id_key,
+                                                 item_ids=item_ids)
+            result = write()
+            new_image_urls = self.get_image_urls(table_name=table_name, product_id_key=product_id_key,
+                                                 item_ids=item_ids)
+            stored_file_names = self.update_image_references(old_image_urls=old_image_urls,
+                                                             new_image_urls=new_image_urls,
+                                                             pending_images=pending_images)
+        for file_name in stored_file_names:
+            self.content_utils.generate_image_derivatives_if_needed(file_name=file_name)
+        return result
+
+    def insert_data(self, insert_type: str, data: dict, image_data=None):
+        try:
+            logger.debug("Inserting %s, columns: %s", insert_type, list(data.keys()))
             table_name = self.db_utils.get_table_name_by_insert_type(insert_type=insert_type)
+            data_object_type = self.DATA_OBJECT_TYPE_BY_INSERT_TYPE.get(insert_type)
+            if data_object_type is not None:
+                # Stored with the model defaults, the reads hydrate the rows without validation
+                data = data_object_type.model_validate(data).model_dump()
+
+            with self.collect_pending_images() as pending_images:
+                if image_data:
+                    self.save_item_image(data=data, image_data=image_data, pending_images=pending_images)
+                    logger.debug("Added image `%s`", data['ImageURL'])
+
+                if table_name == DBTable.BOOKS.value:
+                    self.set_info_html(data=data)
+
+                product_id_key = self.db_utils.get_product_id_key_by_insert_type(insert_type=insert_type)
+                inserted_data = self.write_items(
+                    table_name=table_name, product_id_key=product_id_key, item_ids=[data[product_id_key]],
+                    write=lambda: self.db_utils.insert_data(table_name=table_name, data=data),
+                    pending_images=pending_images
+                )
+            self.invalidate_catalog(table_name=table_name)
+            return inserted_data
+        except UnknownInsertType as e:
+            desc = f"Error: Unknown insert type `{insert_type}`, except: {str(e)}"
+            logger.error(desc)
+            raise UnknownInsertType(desc)
+        except Exception as e:
+            logger.error("Error inserting data")
+            raise e
 
-            if image_data:
-                item_id = self.extract_item_id(data=data, insert_type=insert_type)
-                file_name = self.content_utils.get_image_file_name(insert_type=insert_type, item_id=item_id)
-                data.update({"ImageURL": file_name})
-                print(f"Adding image `{file_name}`")
-                self.content_utils.add_image(image_data=image_data, file_name=file_name)
-                print(f"Done adding image `{file_name}`")
-
-            # TODO - Move to utils or other class instead of doing this in manager api
-            if parse and table_name == DBTable.BOOKS.value:
-                data['Info'] = self.content_utils.info_html_parser(data['Info'])
+    def bulk_insert_data(self, insert_type: str, data_list: List[Dict], images_archive=None) -> int:
+        """
+        Insert or update many items in a single transaction
 
-            return self.db_utils.insert_data(table_name=table_name, data=data)
+        :param insert_type:
+        :param data_list:
+        :param images_archive: Optional zip file, an image named by the item id (e.g. `1234.jpeg`) is the item image
+        :return: Number of items written
+        """
+        logger.info("Start bulk_insert_data, %d item(s)", len(data_list))
+        try:
+            table_name = self.db_utils.get_table_name_by_insert_type(insert_type=insert_type)
+            product_id_key = self.db_utils.get_product_id_key_by_insert_type(insert_type=insert_type)
+            data_object_type = self.DATA_OBJECT_TYPE_BY_INSERT_TYPE.get(insert_type)
+            if data_object_type is None:
+                raise UnknownInsertType(msg=f"Bulk insert is not supported for `{insert_type}`")
+            items = []
+            update_columns_list = []
+            for data in data_list:
+                item = data_object_type.model_validate(data)
+                items.append(item.model_dump())
+                # An existing item is updated only with the sent fields, the defaults fill the new items only
+                update_columns_list.append(
+                    self.get_update_columns(table_name=table_name, product_id_key=product_id_key,
+                                            data=items[-1], update_fields=item.model_fields_set)
+                )
+            if table_name == DBTable.BOOKS.value:
+                for item in items:
+                    self.set_info_html(data=item)
+
+            with self.collect_pending_images() as pending_images:
+                if images_archive:
+                    with zipfile.ZipFile(images_archive) as archive:
+                        image_names_by_item_id = {
+                            os.path.splitext(os.path.basename(name))[0]: name
+                            for name in archive.namelist() if not name.endswith('/')
+                        }
+                        for item, update_columns in zip(items, update_columns_list):
+                            image_name = image_names_by_item_id.get(str(item[product_id_key]))
+                            if image_name:
+                                with archive.open(image_name) as image_file:
+                                    self.save_item_image(data=item, image_data=image_file,
+                                                         pending_images=pending_images)
+                                if "ImageURL" not in update_columns:
+                                    update_columns.append("ImageURL")
+
+                inserted_count = self.write_items(
+                    table_name=table_name, product_id_key=product_id_key,
+                    item_ids=[item[product_id_key] for item in items],
+                    write=lambda: self.db_utils.upsert_many_data(table_name=table_name, data_list=items,
+                                                                 conflict_columns=[product_id_key],
+                                                                 update_columns_list=update_columns_list),
+                    pending_images=pending_images
+                )
+            self.invalidate_catalog(table_name=table_name)
+            return inserted_count
         except UnknownInsertType as e:
             desc = f"Error: Unknown insert type `{insert_type}`, except: {str(e)}"
-            print(desc)
+            logger.error(desc)
             raise UnknownInsertType(desc)
         except Exception as e:
-            print(f"Error inserting data")
+            logger.error("Error bulk inserting data")
             raise e
 
-    def update_data(self, insert_type: str, data: dict, image_data=None):
-        print(f"Start manager_api update_data")
+    def update_data(self, insert_type: str, data: dict, image_data=None, update_fields=None):
+        """
+        Insert or update an item in a single transaction
+
+        :param insert_type:
+        :param data: Item data, may be partial for an existing item.
+                     A new item is validated against the full model, pydantic.ValidationError is raised if it isn't
+                     complete.
+        :param image_data:
+        :param update_fields: Fields to update on an existing item, default is all the given fields
+        :return:
+        """
         try:
             table_name = self.db_utils.get_table_name_by_insert_type(insert_type=insert_type)
-            if image_data:
-                data.update({"ImageData": image_data})
-
-            filter_data = {ProductIDKeys.BOOKS.value: data[ProductIDKeys.BOOKS.value]}
-            self.db_utils.delete_data_by_filter(table_name=table_name, filter_data=filter_data)
-            return self.insert_data(insert_type=insert_type, data=data, image_data=image_data)
-            # return self.db_utils.update_data(table_name=table_name, data=data)
+            product_id_key = self.db_utils.get_product_id_key_by_insert_type(insert_type=insert_type)
+            data_object_type = self.DATA_OBJECT_TYPE_BY_INSERT_TYPE.get(insert_type)
+            if data_object_type is not None and \
+                    not self.db_utils.exists(table_name=table_name, data_filter={product_id_key: data[product_id_key]}):
+                # The fields that aren't sent get the model defaults
+                data = data_object_type.model_validate(data).model_dump()
+            update_columns = None
+            if update_fields is not None:
+                update_columns = self.get_update_columns(table_name=table_name, product_id_key=product_id_key,
+                                                         data=data, update_fields=update_fields)
+
+            if table_name == DBTable.BOOKS.value:
+                self.set_info_html(data=data)
+
+            with self.collect_pending_images() as pending_images:
+                if image_data:
+                    self.save_item_image(data=data, image_data=image_data, pending_images=pending_images)
+                    if update_columns is not None and "ImageURL" not in update_columns:
+                        update_columns.append("ImageURL")
+
+                self.write_items(table_name=table_name, product_id_key=product_id_key, item_ids=[data[product_id_key]],
+                                 write=lambda: self.db_utils.upsert_data(table_name=table_name, data=data,
+                                                                         conflict_columns=[product_id_key],
+                                                                         update_columns=update_columns),
+                                 pending_images=pending_images)
+            self.invalidate_catalog(table_name=table_name)
+            return data
         except UnknownInsertType as e:
             desc = f"Error: Unknown insert type `{insert_type}`, except: {str(e)}"
-            print(desc)
+            logger.error(desc)
             raise UnknownInsertType(desc)
         except Exception as e:
-            print(f"Error updating data")
+            logger.error("Error updating data")
             raise e
 
     def delete_data(self, insert_type: str, data: dict):
         try:
-            # Delete image
+            # Delete image saved by the item id (before images were content addressed)
             item_id = self.extract_item_id(data=data, insert_type=insert_type)
             file_name = self.content_utils.get_image_file_name(insert_type=insert_type, item_id=item_id)
             self.content_utils.delete_image_if_exists(image_file_name=file_name)
@@ -92,97 +435,341 @@ class ManagerAPI:
             table_name = self.db_utils.get_table_name_by_insert_type(insert_type=insert_type)
             product_id_key = self.db_utils.get_product_id_key_by_insert_type(insert_type=insert_type)
             filter_data = {product_id_key: data[product_id_key]}
-            return self.db_utils.delete_data_by_filter(table_name=table_name, filter_data=filter_data)
+            # The content addressed image is deleted, if this was its last reference
+            deleted = self.write_items(
+                table_name=table_name, product_id_key=product_id_key, item_ids=[item_id],
+                write=lambda: self.db_utils.delete_data_by_filter(table_name=table_name, filter_data=filter_data)
+            )
+            self.invalidate_catalog(table_name=table_name)
+            return deleted
         except UnknownInsertType as e:
-            print(f"Error (manager_api) deleting data, insert_type: {insert_type}, data: {data}, except: {str(e)}")
+            logger.error("Error (manager_api) deleting data, insert_type: %s, data: %s, except: %s", insert_type, data, e)
             raise e
 
-    def get_books(self, parse_info: bool = None):
+    def get_catalog_version(self, table_name: str) -> int:
         self.set_db_utils_connection_if_needed()
-        books = self.db_utils.get_all_table_data(table_name=DBTable.BOOKS.value, data_object_type=Book)
-
-        # No books
-        if books is None:
-            return []
-
-        # Convert to dict
-        wanted_books = [book.dict() for book in books]
-
-        # Fixing html info
-        for book in wanted_books:
-            if parse_info:
-                book['Info'] = self.content_utils.info_html_parser(text_info=book['Info'])
-
-        # Soring books by catalog number
-        wanted_books = sorted(wanted_books, key=lambda x: x['CatalogNumber'])
-
-        return wanted_books
+        return self.db_utils.get_catalog_version(table_name=table_name)
+
+    def get_catalog_payload(self, table_name: str, cache_key: str, response_key: str, get_items: Callable[[], list],
+                            version: int = None) -> CatalogPayload:
+        """
+        Get the serialized catalog response, built once per catalog version
+
+        :param table_name:
+        :param cache_key: Response variant
+        :param response_key: Key of the items in the response
+        :param get_items: Load the items from the DB
+        :param version: Catalog version, if it was already read
+        :return:
+        """
+        # Version must be read before the data, so a snapshot is never tagged with a newer version than its data
+        if version is None:
+            version = self.get_catalog_version(table_name=table_name)
+        payload = self.catalog_cache.get(table_name=table_name, key=cache_key, version=version)
+        if payload is not None:
+            return payload
+
+        items = get_items()
+        payload = CatalogPayload(version=version, data={response_key: items}, items_count=len(items))
+        self.catalog_cache.set(table_name=table_name, key=cache_key, version=version, value=payload)
+        return payload
+
+    def get_books_payload(self, parse_info: bool = None, version: int = None) -> CatalogPayload:
+        return self.get_catalog_payload(table_name=DBTable.BOOKS.value, cache_key=f"parse_info={bool(parse_info)}",
+                                        response_key='books', get_items=lambda: self.get_books(parse_info=parse_info),
+                                        version=version)
+
+    def get_banners_payload(self, version: int = None) -> CatalogPayload:
+        return self.get_catalog_payload(table_name=DBTable.BANNERS.value, cache_key="all", response_key='banners',
+                                        get_items=self.get_banners, version=version)
+
+    def get_book_data(self, book_data: dict, parse_info: bool = None) -> dict:
+        """
+        :param book_data: Book row, modified in place
+        :param parse_info:
+        :return: The book response
+        """
+        info_html = book_data.pop(BookColumns.INFO_HTML, None)
+        if parse_info:
+            # Html info is rendered when the book is written, rendering here only if it's missing
+            if info_html is not None:
+                book_data['Info'] = info_html
+            elif book_data.get('Info') is not None:
+                book_data['Info'] = self.content_utils.info_html_parser(text_info=book_data['Info'])
+        return book_data
+
+    def get_item(self, table_name: str, data_object_type, key_column: str, item_id, version: int = None):
+        """
+        Get a single item, from the items cache or with a point query
+
+        :param table_name:
+        :param data_object_type:
+        :param key_column:
+        :param item_id:
+        :param version: Catalog version, if it was already read
+        :return: The item record, None if there is no such item
+        """
+        self.set_db_utils_connection_if_needed()
+        # Version must be read before the data, so an item is never tagged with a newer version than its data
+        if version is None:
+            version = self.get_catalog_version(table_name=table_name)
+        item = self.item_cache.get(table_name=table_name, item_id=item_id, version=version)
+        if item is not None:
+            return item
+
+        item = self.db_utils.get_data_by_key(table_name=table_name, data_object_type=data_object_type,
+                                             key_column=key_column, key=item_id)
+        if item is not None:
+            self.item_cache.set(table_name=table_name, item_id=item_id, version=version, value=item)
+        return item
+
+    def get_book(self, catalog_number: int, parse_info: bool = None, version: int = None):
+        book = self.get_item(table_name=DBTable.BOOKS.value, data_object_type=Book,
+                             key_column=ProductIDKeys.BOOKS.value, item_id=catalog_number, version=version)
+        if book is None:
+            return None
+        return self.get_book_data(book_data=book._asdict(), parse_info=parse_info)
+
+    def get_banner(self, banner_id: int, version: int = None):
+        banner = self.get_item(table_name=DBTable.BANNERS.value, data_object_type=Banner,
+                               key_column=ProductIDKeys.BANNERS.value, item_id=banner_id, version=version)
+        if banner is None:
+            return None
+        return banner._asdict()
 
-    def reset_books_from_github(self):
-        self.db_utils.delete_all_table(table_name=DBTable.BOOKS.value)
-        self.db_utils.create_table(table_name=DBTable.BOOKS.value)
-        self.db_utils.get_table_columns(table_name=DBTable.BOOKS.value)
-        res = requests.get("https://github.com/scarlet-website/api-data/blob/main/books.json")
+    def get_books(self, parse_info: bool = None):
+        self.set_db_utils_connection_if_needed()
+        # Html info is only read when it is returned, books are sorted by catalog number by the DB
+        books = self.db_utils.get_all_table_dicts(table_name=DBTable.BOOKS.value, data_object_type=Book,
+                                                  exclude=None if parse_info else [BookColumns.INFO_HTML],
+                                                  order_by=ProductIDKeys.BOOKS.value)
+
+        with MetricsUtils.stage(name='dump'):
+            return [self.get_book_data(book_data=book, parse_info=parse_info) for book in books]
+
+    def get_books_page(self, request_data: GetBooksRequestData, parse_info: bool = None) -> dict:
+        """
+        Get a page of the books matching the request filters, with only the requested fields.
+        Filtering, projection and paging are all done by the DB.
+
+        :param request_data:
+        :param parse_info:
+        :return: The books, and the cursor of the next page (None on the last page)
+        """
+        self.set_db_utils_connection_if_needed()
+        product_id_key = ProductIDKeys.BOOKS.value
+        fields = request_data.fields or [field for field in Book.model_fields.keys()
+                                         if field not in BooksPageConsts.HIDDEN_FIELDS]
+        # The catalog number is the cursor, it is always returned
+        columns = [product_id_key] + [field for field in fields if field != product_id_key]
+        render_info = bool(parse_info) and "Info" in columns
+        if render_info:
+            columns.append(BookColumns.INFO_HTML)
+
+        filter_data = {key: value for key, value in request_data.model_dump(include={"inStock", "IsDigital", "isCase"})
+                       .items() if value is not None}
+        min_values = {"UnitPrice": request_data.min_price} if request_data.min_price is not None else None
+        max_values = {"UnitPrice": request_data.max_price} if request_data.max_price is not None else None
+        # Reading one more book than the limit, to know if there is a next page
+        limit = request_data.limit + 1 if request_data.limit is not None else None
+        books = self.db_utils.get_page(table_name=DBTable.BOOKS.value, columns=columns, key_column=product_id_key,
+                                       filter_data=filter_data, min_values=min_values, max_values=max_values,
+                                       after_key=request_data.cursor, limit=limit)
+
+        next_cursor = None
+        if request_data.limit is not None and len(books) > request_data.limit:
+            books = books[:request_data.limit]
+            next_cursor = books[-1][product_id_key]
+
+        for book in books:
+            for field in self.BOOK_BOOLEAN_FIELDS:
+                if book.get(field) is not None:
+                    book[field] = bool(book[field])
+            if render_info:
+                info_html = book.pop(BookColumns.INFO_HTML)
+                if info_html is None and book["Info"] is not None:
+                    info_html = self.content_utils.info_html_parser(text_info=book["Info"])
+                book["Info"] = info_html
+
+        return {"books": books, "next_cursor": next_cursor}
+
+    def search_books(self, request_data: SearchBooksRequestData) -> dict:
+        """
+        Full text search of the books description and info, best matches first
+
+        :param request_data:
+        :return: The books, and the offset of the next page (None on the last page)
+        """
+        self.set_db_utils_connection_if_needed()
+        query = self.content_utils.build_search_query(text=request_data.q)
+        table_name = DBTable.BOOKS.value
+        if not query or not self.db_utils.is_table_exists(table_name=table_name):
+            return {"books": [], "next_offset": None}
+
+        search_columns = CommandsFormats.SEARCH_TABLES[table_name]['columns']
+        # Reading one more book than the limit, to know if there is a next page
+        books = self.db_utils.search(table_name=table_name, query=query,
+                                     columns=SearchBooksConsts.RESULT_FIELDS, limit=request_data.limit + 1,
+                                     offset=request_data.offset,
+                                     weights=[SearchBooksConsts.WEIGHTS[column] for column in search_columns],
+                                     snippet_tokens=SearchBooksConsts.SNIPPET_TOKENS)
+
+        next_offset = None
+        if len(books) > request_data.limit:
+            books = books[:request_data.limit]
+            next_offset = request_data.offset + request_data.limit
+
+        for book in books:
+            for field in self.BOOK_BOOLEAN_FIELDS:
+                if book.get(field) is not None:
+                    book[field] = bool(book[field])
+
+        return {"books": books, "next_offset": next_offset}
+
+    @staticmethod
+    def get_books_from_github() -> List[Dict]:
+        res = requests.get(CatalogResetConsts.BOOKS_URL)
         data = json.loads(res.text)
         books = json.loads(''.join(data['payload']['blob']['rawLines']).strip())['books']
-
-        for index, book in enumerate(books):
-            image_data = None
-            if book['ImageURL']:
-                try:
-                    response = requests.get(book['ImageURL'], timeout=15)
-                    if response.status_code == 200:
-                        image_data = response.content
-                        # book['ImageData'] = response.content
-                except Exception as e:
-                    print(f"Error getting image of `{book['ImageURL']}`, except: {str(e)}")
-
-            self.insert_data(insert_type=InsertType.BOOK.value, data=book, image_data=image_data)
-            print(f"{index + 1}/{len(books)}) Inserted book, book id: {book['CatalogNumber']}")
+        return [Book.model_validate(book).model_dump() for book in books]
+
+    def reset_books_from_github(self, progress=None):
+        """
+        Replace the books with the books from GitHub.
+        Images are downloaded concurrently, and books are written in batches to a staging table as their images
+        complete. The staging table is swapped in at the end, so readers never see a partial or an empty catalog.
+
+        :param progress: Optional `JobProgress` to report to
+        :return:
+        """
+        table_name = DBTable.BOOKS.value
+        product_id_key = ProductIDKeys.BOOKS.value
+        books = self.get_books_from_github()
+        books_by_id = {book[product_id_key]: book for book in books}
+        for book in books_by_id.values():
+            self.set_info_html(data=book)
+        image_urls = [(book[product_id_key], book['ImageURL']) for book in books if book['ImageURL']]
+        staging_table_name = self.db_utils.create_staging_table(table_name=table_name)
+
+        progress_data = {"total_books": len(books_by_id), "written_books": 0, "total_images": len(image_urls),
+                         "fetched_images": 0, "errors": []}
+        if progress:
+            progress.update(force=True, **progress_data)
+
+        # Books without image are ready to be written
+        batch = [book for book in books_by_id.values() if not book['ImageURL']]
+        # Stored when the staging table is swapped in, with the references to them
+        with self.collect_pending_images() as pending_images:
+            with ImageFetcher() as image_fetcher:
+                for index, (catalog_number, image_data) in enumerate(image_fetcher.fetch_all(urls=image_urls)):
+                    book = books_by_id[catalog_number]
+                    if image_data:
+                        self.save_item_image(data=book, image_data=image_data, pending_images=pending_images)
+                        progress_data["fetched_images"] += 1
+                    else:
+                        progress_data["errors"].append(f"Cannot get image of book {catalog_number}")
+                    batch.append(book)
+                    logger.debug("%d/%d) Fetched image of book id: %s", index + 1, len(image_urls), catalog_number)
+
+                    if len(batch) >= CatalogResetConsts.BATCH_SIZE:
+                        progress_data["written_books"] += self.db_utils.insert_many_data(
+                            table_name=staging_table_name, data_list=batch, conflict_columns=[product_id_key]
+                        )
+                        batch = []
+                    if progress:
+                        progress.update(**progress_data)
+
+            progress_data["written_books"] += self.db_utils.insert_many_data(
+                table_name=staging_table_name, data_list=batch, conflict_columns=[product_id_key]
+            )
+            self.write_items(table_name=table_name, product_id_key=product_id_key, item_ids=None,
+                             write=lambda: self.db_utils.swap_staging_table(table_name=table_name),
+                             pending_images=pending_images)
+        self.invalidate_catalog(table_name=table_name)
+        if progress:
+            progress.update(force=True, **progress_data)
 
     def exist_in_db_by_filter(self, table_name: str, data_filter) -> bool:
         try:
             exist = self.db_utils.exists(table_name=table_name, data_filter=data_filter)
             return exist
         except Exception as e:
-            print(f"Error check if exist by data filter: {str(e)}")
+            logger.error("Error check if exist by data filter: %s", e)
             return False
 
-    def add_email_to_newsletter(self, email: str):
-        self.set_db_utils_connection_if_needed()
+    def add_email_to_newsletter(self, email: str) -> bool:
+        """
+        Sign up an email to the newsletter, as the durability mode says
+
+        :param email:
+        :return: True if the email is committed, False if it is queued to be written
+        """
         self.content_utils.check_valid_email_address(email=email)
-        newsletter_object = NewsLetter(EmailAddress=email)
-        data_filter = {"EmailAddress": email}
-        email_exists = self.exist_in_db_by_filter(table_name=DBTable.NEWS_LETTERS.value, data_filter=data_filter)
-        if email_exists:
-            print(f"Email `{email}` already exists")
-        else:
-            self.db_utils.insert_data(table_name=DBTable.NEWS_LETTERS.value, data=newsletter_object.model_dump())
-            print(f"Inserted new newsletter email: `{email}`")
+        newsletter_object = NewsLetter(EmailAddress=self.content_utils.normalize_email_address(email=email))
+        if NewsletterSignupConsts.DURABILITY == DurabilityMode.SYNC:
+            self.set_db_utils_connection_if_needed()
+            inserted = self.db_utils.insert_data_ignore_conflict(
+                table_name=DBTable.NEWS_LETTERS.value, data=newsletter_object.model_dump(),
+                conflict_columns=CommandsFormats.UNIQUE_KEYS[DBTable.NEWS_LETTERS.value]
+            )
+            if inserted:
+                logger.debug("Inserted new newsletter email")
+            else:
+                logger.debug("Newsletter email already exists")
+            return True
+
+        future = self.newsletter_buffer.add(email=newsletter_object.EmailAddress)
+        if NewsletterSignupConsts.DURABILITY == DurabilityMode.BUFFERED:
+            return False
+        try:
+            return future.result(timeout=NewsletterSignupConsts.COMMIT_TIMEOUT)
+        except FutureTimeoutError:
+            logger.warning("Newsletter email batch wasn't committed in %s seconds, answering as queued",
+                           NewsletterSignupConsts.COMMIT_TIMEOUT)
+            return False
 
     def get_newsletters_emails(self):
-        emails_objects: List[NewsLetter] = self.db_utils.get_all_table_data(
-            table_name=DBTable.NEWS_LETTERS.value, data_object_type=NewsLetter
-        )
+        emails_rows = self.db_utils.get_all_table_dicts(table_name=DBTable.NEWS_LETTERS.value,
+                                                        data_object_type=NewsLetter)
+        emails: List[str] = [email["EmailAddress"] for email in emails_rows]
+        return emails
 
-        if not emails_objects:
-            return []
+    def export_newsletters_emails(self, export_format: ExportFormat) -> Iterator[str]:
+        """
+        Stream the newsletter emails, ordered by email, a batch of rows at a time so memory doesn't grow with the list
 
-        emails: List[str] = [email.EmailAddress for email in emails_objects]
-        return emails
+        :param export_format: `json`, `ndjson` or `csv`
+        :return: Chunks of the response body
+        """
+        self.set_db_utils_connection_if_needed()
+        batches = self.db_utils.iter_table_batches(table_name=DBTable.NEWS_LETTERS.value,
+                                                   columns=NewsletterExportConsts.COLUMNS,
+                                                   order_by=ProductIDKeys.NEWS_LETTERS.value,
+                                                   batch_size=NewsletterExportConsts.BATCH_SIZE)
+        if export_format == ExportFormat.NDJSON:
+            return ExportUtils.iter_ndjson(columns=NewsletterExportConsts.COLUMNS, batches=batches)
+        if export_format == ExportFormat.CSV:
+            return ExportUtils.iter_csv(columns=NewsletterExportConsts.COLUMNS, batches=batches)
+        return ExportUtils.iter_json_list(key='news_letters', batches=batches)
+
+    def get_newsletters_emails_page(self, request_data: NewsletterExportRequestData) -> dict:
+        """
+        :param request_data:
+        :return: A page of the newsletter emails ordered by email, and the cursor of the next page
+                 (None on the last page)
+        """
+        self.set_db_utils_connection_if_needed()
+        key_column = ProductIDKeys.NEWS_LETTERS.value
+        # Reading one more email than the limit, to know if there is a next page
+        rows = self.db_utils.get_page(table_name=DBTable.NEWS_LETTERS.value, columns=[key_column],
+                                      key_column=key_column, after_key=request_data.cursor,
+                                      limit=request_data.limit + 1)
+        emails = [row[key_column] for row in rows[:request_data.limit]]
+        next_cursor = emails[-1] if len(rows) > request_data.limit else None
+        return {"news_letters": emails, "next_cursor": next_cursor}
 
     def get_banners(self):
         self.set_db_utils_connection_if_needed()
-        banners = self.db_utils.get_all_table_data(table_name=DBTable.BANNERS.value, data_object_type=Banner)
-
-        # No banners
-        if banners is None:
-            return []
-
-        # Convert to dict
-        wanted_banners = [banner.dict() for banner in banners]
-
-        # Soring banners by catalog number
-        wanted_banners = sorted(wanted_banners, key=lambda x: x['banner_id'])
-
-        return wanted_banners
+        # Banners are sorted by banner id by the DB
+        return self.db_utils.get_all_table_dicts(table_name=DBTable.BANNERS.value, data_object_type=Banner,
+                                                 order_by=ProductIDKeys.BANNERS.value)
@@ -0,0 +1,122 @@
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+from db.db_consts import DBTable, CommandsFormats, ProductIDKeys
+from db.db_utils import DBUtils
+from utils.consts import NewsletterSignupConsts
+from utils.exceptions import NewsletterBufferFullException
+from utils.log_utils import LogUtils
+
+logger = LogUtils.get_logger(__name__)
+
+
+class NewsletterBuffer:
+    """
+    Write-behind buffer of newsletter signups.
+    Signups are queued by the request threads and written by a background thread, a batch per transaction,
+    so a burst of signups costs a commit per batch instead of a commit per signup.
+    """
+
+    def __init__(self, max_batch: int = NewsletterSignupConsts.MAX_BATCH,
+                 flush_interval_ms: int = NewsletterSignupConsts.FLUSH_INTERVAL_MS,
+                 max_queue: int = NewsletterSignupConsts.MAX_QUEUE):
+        self.db_utils = DBUtils()
+        self._max_batch = max_batch
+        self._flush_interval = flush_interval_ms / 1000
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._thread: Optional[threading.Thread] = None
+        self._thread_pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.stop)
+
+    def _ensure_thread(self):
+        with self._lock:
+            # Threads don't survive a fork, a forked worker starts its own thread
+            if self._thread is None or not self._thread.is_alive() or self._thread_pid != os.getpid():
+                self._thread = threading.Thread(target=self._run, name="newsletter-buffer", daemon=True)
+                self._thread_pid = os.getpid()
+                self._thread.start()
+
+    def add(self, email: str) -> Future:
+        """
+        :param email: Valid and normalized email address
+        :return: Future resolved once the email is committed
+        """
+        future = Future()
+        try:
+            self._queue.put_nowait((email, future))
+        except queue.Full:
+            raise NewsletterBufferFullException(msg="Newsletter signups queue is full")
+        self._ensure_thread()
+        return future
+
+    def _take_batch(self) -> Optional[Dict[str, List[Future]]]:
+        """
+        Wait for a signup, then gather the signups queued until the batch is full or the flush interval passed
+
+        :return: Futures by email, emails signed up more than once are written once.
+                 None when the buffer is stopped.
+        """
+        item = self._queue.get()
+        if item is None:
+            return None
+        batch = {item[0]: [item[1]]}
+        deadline = time.monotonic() + self._flush_interval
+        while len(batch) < self._max_batch:
+            timeout = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                # Stop after writing this batch
+                self._queue.put_nowait(None)
+                break
+            batch.setdefault(item[0], []).append(item[1])
+        return batch
+
+    def _write_batch(self, batch: Dict[str, List[Future]]):
+        table_name = DBTable.NEWS_LETTERS.value
+        try:
+            self.db_utils.insert_many_data(
+                table_name=table_name,
+                data_list=[{ProductIDKeys.NEWS_LETTERS.value: email} for email in batch.keys()],
+                conflict_columns=CommandsFormats.UNIQUE_KEYS[table_name]
+            )
+            logger.debug("Wrote a batch of %d newsletter email(s)", len(batch))
+        except Exception as e:
+            logger.exception("Error writing a batch of %d newsletter email(s), except: %s", len(batch), e)
+            for futures in batch.values():
+                for future in futures:
+                    future.set_exception(e)
+            return
+
+        for futures in batch.values():
+            for future in futures:
+                future.set_result(True)
+
+    def _run(self):
+        while True:
+            batch = self._take_batch()
+            if batch is None:
+                return
+            self._write_batch(batch=batch)
+
+    def stop(self, timeout: float = NewsletterSignupConsts.STOP_TIMEOUT):
+        """
+        Write the queued signups and stop the background thread
+        """
+        thread = self._thread
+        if thread is None or not thread.is_alive() or self._thread_pid != os.getpid():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            logger.error("Newsletter signups queue is full on shutdown, queued signups are lost")
+            return
+        thread.join(timeout=timeout)
@@ -1,21 +1,107 @@
 import json
-from datetime import datetime
-from typing import Union
+import math
+import os
+import stat
+import time
+from typing import Union, Callable, Optional
 
-from flask import request, Response, jsonify, send_from_directory
+from flask import request, Response, jsonify, g
+from pydantic import ValidationError
+from werkzeug.utils import safe_join
+from werkzeug.wsgi import wrap_file
 
+from db.db_consts import DBTable
 from manager import app
+from manager.job_runner import JobRunner
 from manager.manager_api import ManagerAPI
 from objects.book import Book
+from objects.bulk_insert_request_data import BulkInsertRequestData
 from objects.delete_request_data import DeleteRequestData
+from objects.get_books_request_data import GetBooksRequestData
+from objects.newsletter_export_request_data import NewsletterExportRequestData
+from objects.search_books_request_data import SearchBooksRequestData
 from objects.update_request_data import UpdateRequestData
-from utils.consts import ServerConsts
+from utils.cache_utils import CatalogPayload, ImageFile, ImageFileCache
+from utils.consts import ServerConsts, JobType, ImageDerivativeConsts, CatalogPayloadConsts, MetricsConsts, \
+    ExportFormat, NewsletterExportConsts, NewsletterSignupConsts, ImageServingConsts
 from utils.content_utils import ContentUtils
-from utils.exceptions import NotValidEmailAddressException
+from utils.http_utils import HttpUtils
+from utils.image_utils import ImageUtils
+from utils.exceptions import NotValidEmailAddressException, NewsletterBufferFullException
+from utils.log_utils import LogUtils
+from utils.metrics_utils import MetricsUtils
+from utils.rate_limit_utils import RateLimiter
+
+logger = LogUtils.get_logger(__name__)
 
 manager_api = ManagerAPI()
 
 
+@app.before_request
+def start_request_metrics():
+    g.request_start_time = time.perf_counter()
+    g.request_profile = MetricsUtils.get_request_profile(
+        profile_header=request.headers.get(MetricsConsts.PROFILE_HEADER)
+    )
+    if g.request_profile:
+        g.request_profile.start()
+
+
+@app.after_request
+def finish_request_metrics(response: Response) -> Response:
+    route = request.endpoint or 'unmatched'
+    request_profile = g.pop('request_profile', None)
+    if request_profile:
+        response.headers['Server-Timing'] = request_profile.stop(route=route)
+    MetricsUtils.observe_request(route=route, method=request.method, status=response.status_code,
+                                 seconds=time.perf_counter() - g.request_start_time)
+    return response
+
+
+@app.route('/metrics')
+def metrics():
+    body, content_type = MetricsUtils.generate_metrics()
+    return Response(body, content_type=content_type)
+
+
+def set_cache_headers(response: Response, etag: str, route_name: str) -> Response:
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = ServerConsts.CACHE_CONTROL_BY_ROUTE[route_name]
+    return response
+
+
+def not_modified_response(etag: str, route_name: str) -> Response:
+    return set_cache_headers(response=Response(status=304), etag=etag, route_name=route_name)
+
+
+job_runner = JobRunner(handlers={
+    JobType.RESET_BOOKS_FROM_GITHUB.value: lambda progress: manager_api.reset_books_from_github(progress=progress)
+})
+job_runner.start()
+
+def get_newsletter_rate_limit_per_minute() -> int:
+    rate_limit_per_minute = NewsletterSignupConsts.RATE_LIMIT_PER_MINUTE
+    if rate_limit_per_minute and not (NewsletterSignupConsts.TRUST_FORWARDED_FOR or
+                                      NewsletterSignupConsts.RATE_LIMIT_DIRECT_CLIENTS):
+        # Behind a reverse proxy every client would share the proxy limit
+        logger.error("Newsletter rate limit is disabled, set TRUST_FORWARDED_FOR behind a reverse proxy, "
+                     "or NEWSLETTER_RATE_LIMIT_DIRECT_CLIENTS when the clients connect directly")
+        return 0
+    return rate_limit_per_minute
+
+
+newsletter_rate_limiter = RateLimiter(rate_per_minute=get_newsletter_rate_limit_per_minute(),
+                                      burst=NewsletterSignupConsts.RATE_LIMIT_BURST,
+                                      max_clients=NewsletterSignupConsts.RATE_LIMIT_MAX_CLIENTS)
+
+
+def get_client_address() -> str:
+    if NewsletterSignupConsts.TRUST_FORWARDED_FOR and request.access_route:
+        # The addresses before the one the proxy added are sent by the client, and can't be trusted
+        return request.access_route[-1]
+    return request.remote_addr
+
+
 @app.route('/insert', methods=['POST'])
 def insert():
     try:
@@ -28,49 +114,72 @@ def insert():
         insert_type: str = json_data['insert_type']
         data = json_data['data']
 
-        image_data = None
-        if 'image' in request.files:
-            image_data = request.files['image'].read()
+        # Passing the uploaded file itself, it is streamed to disk
+        image_data = request.files.get('image')
 
         inserted_data = manager_api.insert_data(insert_type=insert_type, data=data, image_data=image_data)
         return Response(inserted_data, status=201, mimetype='application/json')
+    except ValidationError as e:
+        return Response(f"Wrong insert data, {str(e)}", status=400, mimetype='application/json')
     except Exception as e:
         return Response(str(e), status=500, mimetype='application/json')
 
 
+@app.route('/bulk_insert', methods=['POST'])
+def bulk_insert():
+    try:
+        json_data = json.loads(request.form.get('json_data'))
+        request_data = BulkInsertRequestData.model_validate(json_data)
+        authentication_token = request_data.token
+        if not manager_api.check_authentication_token(authentication_token=authentication_token):
+            return Response(f"Wrong token `{authentication_token}`", status=401, mimetype='application/json')
+
+        insert_type: str = request_data.insert_type
+        images_archive = request.files.get('images')
+        inserted_count = manager_api.bulk_insert_data(insert_type=insert_type, data_list=request_data.data,
+                                                      images_archive=images_archive)
+        return Response(f"{inserted_count} {insert_type}(s) inserted successfully", status=201,
+                        mimetype='application/json')
+    except Exception as e:
+        logger.exception("Error bulk insert data, %s", e)
+        return Response(str(e), status=500, mimetype='application/json')
+
+
 @app.route('/update', methods=['POST'])
 def update():
-    print("Start update route")
     insert_type = data = None
     try:
         json_data = json.loads(request.form.get('json_data').encode("UTF-8"))
-        print(f"json_data: {json_data}")
         request_data = UpdateRequestData.model_validate(json_data)
-        print(f"Update route, insert_type: {request_data.insert_type}, data: {request_data.data.model_dump()}")
+        logger.debug("Update route, insert_type: %s, fields: %s", request_data.insert_type,
+                     sorted(request_data.data.model_fields_set))
         authentication_token = request_data.token
         if not manager_api.check_authentication_token(authentication_token=authentication_token):
             return Response(f"Wrong token `{authentication_token}`", status=401, mimetype='application/json')
 
         insert_type = request_data.insert_type
-        data: Union[Book, None] = request_data.data
+        # Only the sent fields, the others are kept as stored
+        data = request_data.data.model_dump(exclude_unset=True)
 
-        image_data = None
-        if 'image' in request.files:
-            image_data = request.files['image'].read()
+        # Passing the uploaded file itself, it is streamed to disk
+        image_data = request.files.get('image')
 
-        manager_api.update_data(insert_type=insert_type, data=data.model_dump(), image_data=image_data)
+        manager_api.update_data(insert_type=insert_type, data=data, image_data=image_data,
+                                update_fields=request_data.data.model_fields_set)
         return Response(f"{insert_type} updated successfully", status=201, mimetype='application/json')
+    except ValidationError as e:
+        logger.warning("Wrong update data, insert_type: %s, %s", insert_type, e)
+        return Response(f"Wrong update data, {str(e)}", status=400, mimetype='application/json')
     except Exception as e:
         desc = (f"Error: Updating route: {str(e)}, insert_type: {insert_type}, type(insert_type): {type(insert_type)}, "
-                f"data: {data.model_dump() if data else None}")
-        print(desc)
+                f"data: {data}")
+        logger.exception("Error: Updating route: %s, insert_type: %s", e, insert_type)
         return Response(desc, status=500, mimetype='application/json')
 
 
 @app.route('/delete', methods=['POST'])
 def delete():
     try:
-        print("DELETE")
         json_data = json.loads(request.form.get('json_data'))
         request_data = DeleteRequestData.model_validate(json_data)
         authentication_token = request_data.token
@@ -83,43 +192,275 @@ def delete():
         manager_api.delete_data(insert_type=insert_type, data={product_id_key: item_id})
         return Response(f"{insert_type} deleted successfully", status=201, mimetype='application/json')
     except Exception as e:
-        print(f"Error delete data, {str(e)}")
+        logger.exception("Error delete data, %s", e)
         return Response(str(e), status=500, mimetype='application/json')
 
 
+def catalog_payload_response(table_name: str, route_name: str, get_payload: Callable[[int], CatalogPayload],
+                             empty_desc: str) -> Response:
+    """
+    Respond with a pre-serialized catalog payload, in the best encoding the client accepts
+    """
+    encoding = HttpUtils.choose_content_encoding(accept_encoding=request.headers.get('Accept-Encoding'),
+                                                 encodings=CatalogPayloadConsts.ENCODINGS)
+    # The query string is part of the cache key of clients, so the catalog version and the encoding are enough
+    version = manager_api.get_catalog_version(table_name=table_name)
+    etag = HttpUtils.make_etag(table_name, version, encoding or 'identity')
+    if HttpUtils.is_etag_matching(if_none_match=request.headers.get('If-None-Match'), etag=etag):
+        return not_modified_response(etag=etag, route_name=route_name)
+
+    payload = get_payload(version)
+    if not payload.items_count:
+        logger.debug(empty_desc)
+        return Response(empty_desc, status=204, mimetype='application/json')
+
+    response = Response(payload.get_body(encoding=encoding), mimetype='application/json')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    return set_cache_headers(response=response, etag=etag, route_name=route_name)
+
+
+def books_page_response(page_args: dict, parse_info) -> Response:
+    try:
+        request_data = GetBooksRequestData.model_validate(page_args)
+    except ValidationError as e:
+        return Response(f"Wrong books query, {str(e)}", status=400, mimetype='application/json')
+
+    table_name = DBTable.BOOKS.value
+    route_name = 'get_books'
+    version = manager_api.get_catalog_version(table_name=table_name)
+    etag = HttpUtils.make_etag(table_name, version, 'identity')
+    if HttpUtils.is_etag_matching(if_none_match=request.headers.get('If-None-Match'), etag=etag):
+        return not_modified_response(etag=etag, route_name=route_name)
+
+    books_page = manager_api.get_books_page(request_data=request_data, parse_info=parse_info)
+    return set_cache_headers(response=jsonify(books_page), etag=etag, route_name=route_name)
+
+
 @app.route('/get_books')
 def get_books():
     parse_info = request.args.get("parse_info")
-    books = manager_api.get_books(parse_info)
-    if books:
-        print(f"Return books {datetime.now()}")
-        return jsonify({'books': books})
-    else:
-        desc = "No books found"
-        print(desc)
-        return Response(desc, status=204, mimetype='application/json')
+    logger.debug("Return books")
+    # Paging, filtering or selecting fields, otherwise the whole catalog is returned as before
+    page_args = {key: value for key, value in request.args.items() if key in GetBooksRequestData.model_fields}
+    if page_args:
+        return books_page_response(page_args=page_args, parse_info=parse_info)
+
+    return catalog_payload_response(
+        table_name=DBTable.BOOKS.value, route_name='get_books', empty_desc="No books found",
+        get_payload=lambda version: manager_api.get_books_payload(parse_info=parse_info, version=version)
+    )
+
+
+@app.route('/search_books')
+def search_books():
+    logger.debug("Search books")
+    try:
+        request_data = SearchBooksRequestData.model_validate(request.args.to_dict())
+    except ValidationError as e:
+        return Response(f"Wrong search query, {str(e)}", status=400, mimetype='application/json')
+
+    table_name = DBTable.BOOKS.value
+    route_name = 'search_books'
+    version = manager_api.get_catalog_version(table_name=table_name)
+    etag = HttpUtils.make_etag(table_name, version, 'identity')
+    if HttpUtils.is_etag_matching(if_none_match=request.headers.get('If-None-Match'), etag=etag):
+        return not_modified_response(etag=etag, route_name=route_name)
+
+    try:
+        search_results = manager_api.search_books(request_data=request_data)
+        return set_cache_headers(response=jsonify(search_results), etag=etag, route_name=route_name)
+    except Exception as e:
+        logger.exception("Error searching books, %s", e)
+        return Response(str(e), status=500, mimetype='application/json')
 
 
 @app.route('/get_banners')
 def get_banners():
-    banners = manager_api.get_banners()
-    if banners:
-        print(f"Return banners {datetime.now()}")
-        return jsonify({'banners': banners})
+    logger.debug("Return banners")
+    return catalog_payload_response(
+        table_name=DBTable.BANNERS.value, route_name='get_banners', empty_desc="No banners found",
+        get_payload=lambda version: manager_api.get_banners_payload(version=version)
+    )
+
+
+def item_response(table_name: str, route_name: str, get_item: Callable[[int], dict], not_found_desc: str) -> Response:
+    """
+    Respond with a single catalog item, its entity tag is the catalog version
+    """
+    version = manager_api.get_catalog_version(table_name=table_name)
+    etag = HttpUtils.make_etag(table_name, version, 'identity')
+    if HttpUtils.is_etag_matching(if_none_match=request.headers.get('If-None-Match'), etag=etag):
+        return not_modified_response(etag=etag, route_name=route_name)
+
+    item = get_item(version)
+    if item is None:
+        return Response(not_found_desc, status=404, mimetype='application/json')
+    return set_cache_headers(response=jsonify(item), etag=etag, route_name=route_name)
+
+
+@app.route('/get_book/<int:catalog_number>')
+def get_book(catalog_number: int):
+    parse_info = request.args.get("parse_info")
+    return item_response(
+        table_name=DBTable.BOOKS.value, route_name='get_book', not_found_desc=f"Book `{catalog_number}` not found",
+        get_item=lambda version: manager_api.get_book(catalog_number=catalog_number, parse_info=parse_info,
+                                                      version=version)
+    )
+
+
+@app.route('/get_banner/<int:banner_id>')
+def get_banner(banner_id: int):
+    return item_response(
+        table_name=DBTable.BANNERS.value, route_name='get_banner', not_found_desc=f"Banner `{banner_id}` not found",
+        get_item=lambda version: manager_api.get_banner(banner_id=banner_id, version=version)
+    )
+
+
+image_file_cache = ImageFileCache()
+
+
+def is_image_file_name(filename: str) -> bool:
+    """
+    :param filename:
+    :return: False for the files of the images directory that aren't images, the derivatives directory, and the
+             hidden and temporary files (e.g. images being written)
+    """
+    return not (filename == ImageDerivativeConsts.CACHE_DIR_NAME or filename.startswith('.') or
+                filename.endswith(ImageDerivativeConsts.TEMP_SUFFIX))
+
+
+def resolve_image_file(filename: str, size: str, image_format: str) -> Optional[ImageFile]:
+    """
+    Find the file to serve for an image request, generating the derivative on the first request.
+    Content addressed images and their derivatives never change, their metadata is kept in memory.
+
+    :param filename:
+    :param size:
+    :param image_format:
+    :return: The image file, None if the file name is not valid
+    :raises FileNotFoundError: If there is no such image
+    """
+    key = (filename, size, image_format)
+    image_file = image_file_cache.get(key=key)
+    if image_file is not None:
+        if not image_file.is_derivative or image_file.touch_if_needed():
+            return image_file
+        # The derivative was evicted, generating it again
+        image_file_cache.invalidate(key=key)
+
+    path = safe_join(ServerConsts.IMAGES_PATH, filename)
+    if path is None or not is_image_file_name(filename=filename):
+        return None
+    stat_result = os.stat(path)
+    if not stat.S_ISREG(stat_result.st_mode):
+        raise FileNotFoundError(f"`{path}` is not a file")
+    derivative_path = ImageUtils.get_derivative_path(file_name=filename, size=size, image_format=image_format)
+    if derivative_path:
+        path = derivative_path
+        stat_result = os.stat(path)
+    digest = ContentUtils.get_image_blob_digest(file_name=filename)
+    if digest is None:
+        return ImageFile(path=path, stat_result=stat_result, etag=HttpUtils.get_file_etag(stat_result=stat_result),
+                         route_name='get_book_image', is_derivative=derivative_path is not None)
+
+    etag = HttpUtils.make_etag(digest, size, image_format) if derivative_path else digest
+    image_file = ImageFile(path=path, stat_result=stat_result, etag=etag, route_name='get_book_image_blob',
+                           is_derivative=derivative_path is not None)
+    image_file_cache.set(key=key, image_file=image_file)
+    return image_file
+
+
+def get_image_offload_headers(image_file: ImageFile) -> dict:
+    return HttpUtils.get_offload_headers(path=image_file.path, root_path=ServerConsts.IMAGES_PATH,
+                                         offload=ImageServingConsts.OFFLOAD,
+                                         accel_redirect_prefix=ImageServingConsts.ACCEL_REDIRECT_PREFIX)
+
+
+def is_if_range_matching(image_file: ImageFile) -> bool:
+    if_range = request.if_range
+    if if_range.etag:
+        return if_range.etag == image_file.etag
+    if if_range.date:
+        return int(image_file.stat_result.st_mtime) <= if_range.date.timestamp()
+    return True
+
+
+def image_file_response(image_file: ImageFile) -> Response:
+    """
+    Send the image file, by the front proxy when offloading is configured, otherwise with the server
+    `wsgi.file_wrapper` (sendfile on gunicorn), or only the requested byte range
+
+    :param image_file:
+    :return:
+    """
+    file_size = image_file.stat_result.st_size
+    if ImageServingConsts.OFFLOAD:
+        response = Response(mimetype=image_file.mimetype, headers=get_image_offload_headers(image_file=image_file))
+        sent_size = file_size
     else:
-        desc = "No banners found"
-        print(desc)
-        return Response(desc, status=204, mimetype='application/json')
+        byte_range = None
+        # Multiple ranges are not supported, the whole file is sent instead
+        if request.range and request.range.units == 'bytes' and len(request.range.ranges) == 1 \
+                and is_if_range_matching(image_file=image_file):
+            byte_range = request.range.range_for_length(file_size)
+            if byte_range is None:
+                response = Response(status=416)
+                response.headers['Content-Range'] = f"bytes */{file_size}"
+                return response
+
+        image_file_object = open(image_file.path, 'rb')
+        if byte_range is None:
+            response = Response(wrap_file(request.environ, image_file_object,
+                                          buffer_size=ImageServingConsts.CHUNK_SIZE),
+                                mimetype=image_file.mimetype, direct_passthrough=True)
+            sent_size = file_size
+        else:
+            start, stop = byte_range
+            sent_size = stop - start
+            response = Response(HttpUtils.iter_file_range(file=image_file_object, start=start, length=sent_size,
+                                                          chunk_size=ImageServingConsts.CHUNK_SIZE),
+                                status=206, mimetype=image_file.mimetype, direct_passthrough=True)
+            response.headers['Content-Range'] = f"bytes {start}-{stop - 1}/{file_size}"
+        response.content_length = sent_size
+
+    response.headers['Accept-Ranges'] = 'bytes'
+    response.last_modified = image_file.stat_result.st_mtime
+    MetricsUtils.count_image_bytes_served(size=sent_size)
+    return set_cache_headers(response=response, etag=image_file.etag, route_name=image_file.route_name)
 
 
 @app.route('/get_image/<filename>')
 def get_book_image(filename):
+    size = request.args.get("size", ImageDerivativeConsts.ORIGINAL_SIZE)
+    image_format = request.args.get("format", ImageDerivativeConsts.ORIGINAL_FORMAT)
+    if size not in ImageDerivativeConsts.SIZES or image_format not in ImageDerivativeConsts.FORMATS:
+        return Response(f"Unknown image size `{size}` or format `{image_format}`", status=400,
+                        mimetype='application/json')
+
+    not_found_response = Response(f"Image `{filename}` not found", status=404, mimetype='application/json')
     try:
-        print(f"Getting image file name: `{filename}`...")
-        # return send_from_directory("", filename)
-        return send_from_directory(ServerConsts.IMAGES_PATH, filename)
+        logger.debug("Getting image file name: `%s`, size: `%s`, format: `%s`...", filename, size, image_format)
+        image_file = resolve_image_file(filename=filename, size=size, image_format=image_format)
+        if image_file is None:
+            return not_found_response
+        if HttpUtils.is_etag_matching(if_none_match=request.headers.get('If-None-Match'), etag=image_file.etag):
+            return not_modified_response(etag=image_file.etag, route_name=image_file.route_name)
+
+        try:
+            return image_file_response(image_file=image_file)
+        except FileNotFoundError:
+            # Deleted since its metadata was cached
+            image_file_cache.invalidate(key=(filename, size, image_format))
+            image_file = resolve_image_file(filename=filename, size=size, image_format=image_format)
+            return image_file_response(image_file=image_file)
+    except FileNotFoundError:
+        return not_found_response
     except Exception as e:
-        print(f"Error get image `{filename}`, except: {str(e)}")
+        error_desc = f'Internal Server Error, except: {str(e)}'
+        logger.exception("Error get image `%s`, except: %s", filename, e)
+        return Response(error_desc, status=500, mimetype='application/json')
 
 
 @app.route('/reset_books_from_github')
@@ -131,27 +472,53 @@ def reset_books_from_github():
         return Response(f"Wrong token `{authentication_token}`", status=401, mimetype='application/json')
 
     try:
-        manager_api.reset_books_from_github()
-        return Response("Reset books from GitHub", status=200, mimetype='application/json')
+        job_id = job_runner.enqueue(job_type=JobType.RESET_BOOKS_FROM_GITHUB.value)
+        return jsonify({'job_id': job_id}), 202
     except Exception as e:
-        print(e)
+        logger.exception("Error enqueueing reset books job, %s", e)
         return Response(str(e), status=500, mimetype='application/json')
 
 
+@app.route('/jobs/<job_id>')
+def get_job(job_id):
+    if 'token' not in request.args.keys():
+        return Response(f"No token given", status=401, mimetype='application/json')
+    authentication_token = request.args['token']
+    if not manager_api.check_authentication_token(authentication_token=authentication_token):
+        return Response(f"Wrong token `{authentication_token}`", status=401, mimetype='application/json')
+
+    job = job_runner.get_job(job_id=job_id)
+    if job is None:
+        return Response(f"Job `{job_id}` not found", status=404, mimetype='application/json')
+    return jsonify(job.model_dump())
+
+
 @app.route('/add_email_to_newsletter', methods=['POST'])
 def add_email_to_newsletter():
+    retry_after = newsletter_rate_limiter.check(client=get_client_address())
+    if retry_after:
+        response = Response("Too many signups, try again later", status=429, mimetype='application/json')
+        response.headers['Retry-After'] = str(math.ceil(retry_after))
+        return response
+
     try:
         json_data = json.loads(request.data)
         email = json_data.get("email")
-        manager_api.add_email_to_newsletter(email=email)
-        return jsonify(json_data), 200
+        committed = manager_api.add_email_to_newsletter(email=email)
+        # Queued signups are answered with 202 Accepted
+        return jsonify(json_data), 200 if committed else 202
     except NotValidEmailAddressException:
         error_desc = 'Invalid email address'
-        print(error_desc)
+        logger.info(error_desc)
         return Response(error_desc, status=400, mimetype='application/json')
+    except NewsletterBufferFullException as e:
+        logger.warning(e.msg)
+        response = Response(e.msg, status=503, mimetype='application/json')
+        response.headers['Retry-After'] = '1'
+        return response
     except Exception as e:
         error_desc = f'Internal Server Error, except: {str(e)}'
-        print(error_desc)
+        logger.exception(error_desc)
         return Response(error_desc, status=500, mimetype='application/json')
 
 
@@ -165,10 +532,23 @@ def get_newsletter_emails():
         return Response(f"Wrong token `{authentication_token}`", status=401, mimetype='application/json')
 
     try:
-        news_letters = manager_api.get_newsletters_emails()
-        print(f"Return news_letters {datetime.now()}")
-        return jsonify({'news_letters': news_letters})
+        request_data = NewsletterExportRequestData.model_validate(json_data)
+    except ValidationError as e:
+        return Response(f"Wrong export request, {str(e)}", status=400, mimetype='application/json')
+
+    try:
+        if request_data.format == ExportFormat.PAGE:
+            return jsonify(manager_api.get_newsletters_emails_page(request_data=request_data))
+
+        # Streamed, without a content length the response is sent chunked
+        response = Response(manager_api.export_newsletters_emails(export_format=request_data.format),
+                            mimetype=NewsletterExportConsts.MIMETYPES[request_data.format])
+        if request_data.format == ExportFormat.CSV:
+            response.headers['Content-Disposition'] = \
+                f'attachment; filename="{NewsletterExportConsts.CSV_FILE_NAME}"'
+        logger.debug("Return news_letters")
+        return response
     except Exception as e:
         error_desc = f'Internal Server Error, except: {str(e)}'
-        print(error_desc)
+        logger.exception(error_desc)
         return Response(error_desc, status=500, mimetype='application/json')
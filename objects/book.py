@@ -13,3 +13,5 @@ class Book(BaseModel):
     NotRealUnitPrice: Optional[float]
     inStock: bool
     isCase: bool = False
+    # `Info` rendered to html, computed when the book is written
+    InfoHtml: Optional[str] = None
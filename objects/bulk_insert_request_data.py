@@ -0,0 +1,9 @@
+from typing import Optional, List, Dict, Any
+
+from pydantic import BaseModel
+
+
+class BulkInsertRequestData(BaseModel):
+    token: Optional[str]
+    insert_type: str
+    data: List[Dict[str, Any]]
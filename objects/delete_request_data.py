@@ -8,5 +8,4 @@ class DeleteRequestData(BaseModel):
 
     @validator("item_id", pre=True)
     def set_item_id(cls, value):
-        print("ITEM ID VALIDATOR")
         return str(value)
@@ -0,0 +1,34 @@
+from typing import Optional, List
+
+from pydantic import BaseModel, Field, validator
+
+from objects.book import Book
+from utils.consts import BooksPageConsts
+
+
+class GetBooksRequestData(BaseModel):
+    limit: Optional[int] = Field(default=None, ge=1, le=BooksPageConsts.MAX_LIMIT)
+    # Last catalog number of the previous page
+    cursor: Optional[int] = None
+    inStock: Optional[bool] = None
+    IsDigital: Optional[bool] = None
+    isCase: Optional[bool] = None
+    min_price: Optional[float] = None
+    max_price: Optional[float] = None
+    fields: Optional[List[str]] = None
+
+    @validator("fields", pre=True)
+    def set_fields(cls, value):
+        if isinstance(value, str):
+            value = [field.strip() for field in value.split(',') if field.strip()]
+        return value
+
+    @validator("fields")
+    def check_fields(cls, value):
+        if value is None:
+            return value
+        unknown_fields = [field for field in value
+                          if field not in Book.model_fields or field in BooksPageConsts.HIDDEN_FIELDS]
+        if unknown_fields:
+            raise ValueError(f"Unknown fields {unknown_fields}")
+        return value
@@ -0,0 +1,24 @@
+import json
+from typing import Any, Dict, Optional
+
+from pydantic import BaseModel, validator
+
+
+class Job(BaseModel):
+    job_id: str
+    job_type: str
+    status: str
+    progress: Dict[str, Any] = {}
+    error: Optional[str] = None
+    created_at: str
+    updated_at: str
+    # Worker running the job
+    owner_host: Optional[str] = None
+    owner_pid: Optional[int] = None
+    heartbeat_at: Optional[str] = None
+
+    @validator("progress", pre=True)
+    def set_progress(cls, value):
+        if isinstance(value, str):
+            return json.loads(value)
+        return value or {}
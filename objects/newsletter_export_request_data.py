@@ -0,0 +1,14 @@
+from typing import Optional
+
+from pydantic import BaseModel, Field
+
+from utils.consts import ExportFormat, NewsletterExportConsts
+
+
+class NewsletterExportRequestData(BaseModel):
+    token: str
+    format: ExportFormat = ExportFormat.JSON
+    # Page size and last email of the previous page, of the `page` format
+    limit: int = Field(default=NewsletterExportConsts.DEFAULT_PAGE_LIMIT, ge=1,
+                       le=NewsletterExportConsts.MAX_PAGE_LIMIT)
+    cursor: Optional[str] = None
@@ -0,0 +1,9 @@
+from pydantic import BaseModel, Field
+
+from utils.consts import SearchBooksConsts
+
+
+class SearchBooksRequestData(BaseModel):
+    q: str = Field(min_length=1)
+    limit: int = Field(default=SearchBooksConsts.DEFAULT_LIMIT, ge=1, le=SearchBooksConsts.MAX_LIMIT)
+    offset: int = Field(default=0, ge=0)
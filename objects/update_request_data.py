@@ -1,11 +1,71 @@
-from typing import Optional
+from typing import Optional, Union, get_args, get_origin
 
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 
+from objects.banner import Banner
 from objects.book import Book
+from utils.consts import InsertType
+
+
+def check_not_null_fields(data: BaseModel, data_object_type) -> BaseModel:
+    """
+    The fields of a partial item may be absent, but the sent fields may be null only if the full model allows it
+
+    :param data: Partial item
+    :param data_object_type: Full model of the item
+    :return: The partial item
+    """
+    for name in data.model_fields_set:
+        annotation = data_object_type.model_fields[name].annotation
+        # `Optional[X]` is `Union[X, None]`
+        is_nullable = get_origin(annotation) is Union and type(None) in get_args(annotation)
+        if getattr(data, name) is None and not is_nullable:
+            raise ValueError(f"`{name}` can't be null")
+    return data
+
+
+class BookUpdateData(BaseModel):
+    """
+    Partial book, only the catalog number is required, the fields that aren't sent are kept as stored
+    """
+    CatalogNumber: int
+    IsDigital: Optional[bool] = None
+    ImageURL: Optional[str] = None
+    Description: Optional[str] = None
+    Info: Optional[str] = None
+    UnitPrice: Optional[float] = None
+    NotRealUnitPrice: Optional[float] = None
+    inStock: Optional[bool] = None
+    isCase: Optional[bool] = None
+
+    @model_validator(mode='after')
+    def check_not_null_fields(self):
+        return check_not_null_fields(data=self, data_object_type=Book)
+
+
+class BannerUpdateData(BaseModel):
+    banner_id: int
+    ImageURL: Optional[str] = None
+
+    @model_validator(mode='after')
+    def check_not_null_fields(self):
+        return check_not_null_fields(data=self, data_object_type=Banner)
 
 
 class UpdateRequestData(BaseModel):
     token: Optional[str]
     insert_type: str
-    data: Book
+    data: Union[BookUpdateData, BannerUpdateData]
+
+    @model_validator(mode='after')
+    def check_data_type(self):
+        data_type = UPDATE_DATA_TYPE_BY_INSERT_TYPE.get(self.insert_type)
+        if data_type is not None and not isinstance(self.data, data_type):
+            raise ValueError(f"`data` is not a {self.insert_type}")
+        return self
+
+
+UPDATE_DATA_TYPE_BY_INSERT_TYPE = {
+    InsertType.BOOK.value: BookUpdateData,
+    InsertType.BANNER.value: BannerUpdateData
+}
@@ -0,0 +1,7 @@
+import os
+import tempfile
+
+
+def pytest_configure(config):
+    # Importing `manager` creates the app, which opens `scarlet.db` in the working directory
+    os.chdir(tempfile.mkdtemp(prefix="scarlet-tests-"))
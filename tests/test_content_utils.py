@@ -0,0 +1,126 @@
+import os
+import random
+import stat
+
+import pytest
+
+from utils.consts import ContentConsts, ServerConsts, ImageDerivativeConsts
+from utils.content_utils import ContentUtils
+
+
+def multi_pass_info_html_parser(text_info: str) -> str:
+    # The parser before the single pass, a `str.replace` pass per replacement
+    for key, value in ContentConsts.REPLACE_INFO_PARSER_TO_HTML.items():
+        text_info = text_info.replace(key, value)
+    return text_info.strip()
+
+
+def multi_pass_info_text_parser(html_info: str) -> str:
+    for key, value in ContentConsts.REPLACE_INFO_PARSER_TO_TEXT.items():
+        html_info = html_info.replace(key, value)
+    return html_info.strip()
+
+
+TEXT_INFOS = [
+    "",
+    "   ",
+    "\n",
+    "Plain info",
+    "מחבר: ישראל ישראלי\nהוצאה: סקרלט\nעמודים: 320",
+    "  leading and trailing spaces  \n",
+    "\n\nEmpty lines\n\n\nbetween\n\n",
+    "Windows\r\nline\r\nendings",
+    'Quoted "title" and \'single\' quotes',
+    '"""\n\'\'\'',
+    "<b>Bold</b> already html<br>",
+    "Tags <b><b>nested</b></b> and <br/> not replaced",
+    "Emoji 📚 and niqqud שָׁלוֹם",
+    "\t tabs \t",
+]
+
+HTML_INFOS = [
+    "",
+    "<br>",
+    "<b>Title</b><br>Author<br><br>",
+    "Mixed <B>case</B> <BR> tags",
+    "Quotes 'single' and \"double\"",
+    "<br><b></b><br>",
+    "Unclosed <b>bold",
+    "Attributes <b class='x'>kept</b>",
+    "  <br>  spaces around  <br>  ",
+    "מחבר<br><b>הוצאה</b>",
+]
+
+
+@pytest.mark.parametrize("text_info", TEXT_INFOS)
+def test_info_html_parser_same_as_multi_pass(text_info):
+    assert ContentUtils.info_html_parser(text_info=text_info) == multi_pass_info_html_parser(text_info=text_info)
+
+
+@pytest.mark.parametrize("html_info", HTML_INFOS)
+def test_info_text_parser_same_as_multi_pass(html_info):
+    assert ContentUtils.info_text_parser(html_info=html_info) == multi_pass_info_text_parser(html_info=html_info)
+
+
+@pytest.mark.parametrize("text_info", TEXT_INFOS)
+def test_info_round_trip_same_as_multi_pass(text_info):
+    html_info = ContentUtils.info_html_parser(text_info=text_info)
+    assert ContentUtils.info_text_parser(html_info=html_info) == \
+        multi_pass_info_text_parser(html_info=multi_pass_info_html_parser(text_info=text_info))
+
+
+def test_parsers_same_as_multi_pass_on_random_infos():
+    # Texts made mostly of the replaced keys, where the order of the replacements matters
+    alphabet = ["\n", "\"", "'", "<", ">", "b", "r", "/", " ", "<br>", "<b>", "</b>", "א", "x"]
+    generator = random.Random(0)
+    for _ in range(2000):
+        text = ''.join(generator.choice(alphabet) for _ in range(generator.randint(0, 20)))
+        assert ContentUtils.info_html_parser(text_info=text) == multi_pass_info_html_parser(text_info=text)
+        text_info = ContentUtils.info_text_parser(html_info=text)
+        multi_pass_text_info = multi_pass_info_text_parser(html_info=text)
+        if text_info != multi_pass_text_info:
+            # Only where removing `<b>` formed a `</b>`, that the multi pass parser removed too
+            assert text_info.replace("</b>", "") == multi_pass_text_info
+
+
+@pytest.mark.parametrize("html_info, text_info", [
+    ("</b<b>>", "</b>"),
+    ("<<b>/b>", "</b>"),
+    ("</<b>b>", "</b>"),
+])
+def test_info_text_parser_doesnt_rescan_its_output(html_info, text_info):
+    # The multi pass parser removed the tags formed by its own replacements, the single pass doesn't
+    assert ContentUtils.info_text_parser(html_info=html_info) == text_info
+
+
+@pytest.mark.parametrize("text, stripped_text", [
+    ("שָׁלוֹם", "שלום"),
+    ("בְּרֵאשִׁית בָּרָא", "בראשית ברא"),
+    ("שלום", "שלום"),
+    # Removed by the search tokenizer
+    ("Café crème", "Café crème"),
+    ("", ""),
+    (None, None),
+])
+def test_strip_search_marks(text, stripped_text):
+    assert ContentUtils.strip_search_marks(text=text) == stripped_text
+
+
+def test_build_search_query_strips_combining_marks():
+    assert ContentUtils.build_search_query(text="שָׁלוֹם  עֲלֵיכֶם") == ContentUtils.build_search_query(text="שלום עליכם")
+    assert ContentUtils.build_search_query(text='שלום "x') == '"שלום"* """x"*'
+
+
+@pytest.fixture
+def images_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(ServerConsts, "IMAGES_PATH", str(tmp_path))
+    monkeypatch.setattr(ImageDerivativeConsts, "GENERATE_ON_UPLOAD", False)
+    return tmp_path
+
+
+def test_saved_images_are_readable_by_others(images_path):
+    # The front proxy serving the images may run as another user
+    blob_file_name = ContentUtils.add_image_blob(image_data=b"image")
+    ContentUtils.save_image(image_data=b"other image", file_name="book_1.jpeg")
+    for file_name in (blob_file_name, "book_1.jpeg"):
+        assert stat.S_IMODE(os.stat(images_path / file_name).st_mode) == 0o644
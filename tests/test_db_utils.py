@@ -0,0 +1,65 @@
+import sqlite3
+
+import pytest
+
+from db.db_consts import DBTable
+from db.db_utils import DBUtils, DBConnectionProvider
+from utils.consts import ContentConsts
+from utils.content_utils import ContentUtils
+
+
+@pytest.mark.parametrize("text", [
+    "שָׁלוֹם עֲלֵיכֶם",
+    "בְּרֵאשִׁית בָּרָא אֱלֹהִים",
+    "Café crème",
+    "",
+    None,
+    ContentConsts.SEARCH_STRIPPED_MARKS + "א",
+])
+def test_strip_search_marks_expression_same_as_python(text):
+    # A plain connection, the search triggers must work on any SQLite client
+    connection = sqlite3.connect(":memory:")
+    expression = DBUtils.build_strip_search_marks_expression(column="text")
+    stripped_text = connection.execute(f"SELECT {expression} FROM (SELECT ? AS text)", (text,)).fetchone()[0]
+    assert stripped_text == ContentUtils.strip_search_marks(text=text)
+
+
+@pytest.fixture
+def db_utils(tmp_path, monkeypatch):
+    monkeypatch.setattr(DBUtils, "_CONNECTION_PROVIDER", DBConnectionProvider(database_name=str(tmp_path / "test.db")))
+    db_utils = DBUtils()
+    db_utils.create_table(table_name=DBTable.IMAGE_BLOBS.value)
+    yield db_utils
+    db_utils.close()
+
+
+def get_ref_counts(database_name: str) -> dict:
+    # Another connection sees only the committed rows
+    with sqlite3.connect(database_name) as connection:
+        return dict(connection.execute(f"SELECT digest, ref_count FROM {DBTable.IMAGE_BLOBS.value}").fetchall())
+
+
+def test_transaction_commits_the_block_at_its_end(db_utils, tmp_path):
+    database_name = str(tmp_path / "test.db")
+    with db_utils.transaction():
+        db_utils.add_image_reference(digest="a")
+        db_utils.add_image_reference(digest="b")
+        assert db_utils.release_image_reference(digest="b") == 0
+        assert get_ref_counts(database_name) == {}
+    assert get_ref_counts(database_name) == {"a": 1}
+
+
+def test_transaction_rolls_back_the_block(db_utils, tmp_path):
+    db_utils.add_image_reference(digest="a")
+    with pytest.raises(RuntimeError):
+        with db_utils.transaction():
+            assert db_utils.release_image_reference(digest="a") == 0
+            raise RuntimeError()
+    assert get_ref_counts(str(tmp_path / "test.db")) == {"a": 1}
+
+
+def test_transaction_holds_the_write_lock(db_utils, tmp_path):
+    with db_utils.transaction():
+        with sqlite3.connect(str(tmp_path / "test.db"), timeout=0) as connection:
+            with pytest.raises(sqlite3.OperationalError, match="locked"):
+                connection.execute(f"INSERT INTO {DBTable.IMAGE_BLOBS.value} (digest, ref_count) VALUES ('c', 1)")
@@ -0,0 +1,96 @@
+import threading
+from collections import Counter
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import pytest
+
+from utils.fetch_utils import ImageFetcher
+
+
+class StubImageHandler(BaseHTTPRequestHandler):
+    """
+    `/image/<name>` is found, `/flaky/<name>` fails once then is found, `/broken/<name>` always fails,
+    `/missing/<name>` is not found
+    """
+    requests_count = Counter()
+    requests_lock = threading.Lock()
+
+    def do_GET(self):
+        with self.requests_lock:
+            self.requests_count[self.path] += 1
+            count = self.requests_count[self.path]
+
+        kind = self.path.split('/')[1]
+        if kind == 'image' or (kind == 'flaky' and count > 1):
+            self.send_response(200)
+            body = f"content of {self.path}".encode()
+        elif kind == 'missing':
+            self.send_response(404)
+            body = b""
+        else:
+            self.send_response(503)
+            body = b""
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def stub_server_url():
+    StubImageHandler.requests_count.clear()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubImageHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def image_fetcher():
+    with ImageFetcher(max_workers=2, max_per_host=2, timeout=5, retries=2, backoff_factor=0) as image_fetcher:
+        yield image_fetcher
+
+
+def test_fetch_success(stub_server_url, image_fetcher):
+    assert image_fetcher.fetch(url=f"{stub_server_url}/image/1") == b"content of /image/1"
+
+
+def test_fetch_retry_then_success(stub_server_url, image_fetcher):
+    assert image_fetcher.fetch(url=f"{stub_server_url}/flaky/1") == b"content of /flaky/1"
+    assert StubImageHandler.requests_count["/flaky/1"] == 2
+
+
+def test_fetch_permanent_failure(stub_server_url, image_fetcher):
+    assert image_fetcher.fetch(url=f"{stub_server_url}/broken/1") is None
+    # The first request and the retries
+    assert StubImageHandler.requests_count["/broken/1"] == 3
+    assert image_fetcher.fetch(url=f"{stub_server_url}/missing/1") is None
+
+
+def test_fetch_all(stub_server_url, image_fetcher):
+    urls = [(index, f"{stub_server_url}/{kind}/{index}")
+            for index, kind in enumerate(['image', 'flaky', 'broken', 'missing'] * 5)]
+    results = dict(image_fetcher.fetch_all(urls=urls))
+    assert results == {key: (f"content of {url[len(stub_server_url):]}".encode()
+                             if '/image/' in url or '/flaky/' in url else None)
+                       for key, url in urls}
+
+
+def test_fetch_all_bounds_downloads_in_flight(stub_server_url, image_fetcher):
+    consumed_count = 0
+
+    def iter_urls():
+        nonlocal consumed_count
+        for index in range(100):
+            consumed_count += 1
+            yield index, f"{stub_server_url}/image/{index}"
+
+    results = image_fetcher.fetch_all(urls=iter_urls())
+    next(results)
+    # 2 workers, 2 downloads in flight per worker
+    assert consumed_count <= 4
+    assert len(list(results)) == 99
@@ -0,0 +1,84 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from db.db_consts import DBTable
+from db.db_utils import DBUtils, DBConnectionProvider
+from manager.job_runner import JobRunner, JobHeartbeat
+from utils.consts import JobStatus, JobConsts
+
+
+@pytest.fixture
+def job_runner(tmp_path, monkeypatch):
+    monkeypatch.setattr(DBUtils, "_CONNECTION_PROVIDER", DBConnectionProvider(database_name=str(tmp_path / "test.db")))
+    job_runner = JobRunner(handlers={})
+    job_runner.db_utils.create_table(table_name=DBTable.JOBS.value)
+    yield job_runner
+    job_runner.db_utils.close()
+
+
+def get_dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def add_running_job(job_runner: JobRunner, job_id: str, updated_seconds_ago: int, owner_host: str = None,
+                    owner_pid: int = None, heartbeat_seconds_ago: int = None):
+    now = datetime.now()
+    job_runner.db_utils.insert_data(table_name=DBTable.JOBS.value, data={
+        "job_id": job_id, "job_type": "reset", "status": JobStatus.RUNNING.value, "progress": json.dumps({}),
+        "error": None, "created_at": now.isoformat(),
+        "updated_at": (now - timedelta(seconds=updated_seconds_ago)).isoformat(),
+        "owner_host": owner_host, "owner_pid": owner_pid,
+        "heartbeat_at": (now - timedelta(seconds=heartbeat_seconds_ago)).isoformat()
+        if heartbeat_seconds_ago is not None else None
+    })
+
+
+@pytest.mark.parametrize("owner, heartbeat_seconds_ago, requeued", [
+    # A slow job of a live worker, no progress for long but a recent heartbeat
+    ("live", 5, False),
+    ("dead", 5, True),
+    ("other_host", 5, False),
+    ("other_host", JobConsts.STALE_AFTER_SECONDS + 60, True),
+    # A live pid with an old heartbeat is another process that got the pid
+    ("live", JobConsts.STALE_AFTER_SECONDS + 60, True),
+])
+def test_requeue_only_jobs_whose_owner_is_gone(job_runner, owner, heartbeat_seconds_ago, requeued):
+    owner_host, owner_pid = {
+        "live": (socket.gethostname(), os.getpid()),
+        "dead": (socket.gethostname(), get_dead_pid()),
+        "other_host": (f"not-{socket.gethostname()}", os.getpid())
+    }[owner]
+    add_running_job(job_runner=job_runner, job_id="job", updated_seconds_ago=JobConsts.STALE_AFTER_SECONDS + 60,
+                    owner_host=owner_host, owner_pid=owner_pid, heartbeat_seconds_ago=heartbeat_seconds_ago)
+    job_runner.requeue_stale_jobs()
+    job = job_runner.get_job(job_id="job")
+    assert job.status == (JobStatus.QUEUED.value if requeued else JobStatus.RUNNING.value)
+    if requeued:
+        assert job.owner_pid is None
+
+
+@pytest.mark.parametrize("updated_seconds_ago, requeued", [(60, False), (JobConsts.STALE_AFTER_SECONDS + 60, True)])
+def test_requeue_jobs_without_owner_by_progress_time(job_runner, updated_seconds_ago, requeued):
+    add_running_job(job_runner=job_runner, job_id="job", updated_seconds_ago=updated_seconds_ago)
+    job_runner.requeue_stale_jobs()
+    assert job_runner.get_job(job_id="job").status == (JobStatus.QUEUED.value if requeued
+                                                       else JobStatus.RUNNING.value)
+
+
+def test_heartbeat_is_written_while_the_job_runs(job_runner, monkeypatch):
+    monkeypatch.setattr(JobConsts, "HEARTBEAT_INTERVAL", 0.05)
+    add_running_job(job_runner=job_runner, job_id="job", updated_seconds_ago=0, owner_host=socket.gethostname(),
+                    owner_pid=os.getpid(), heartbeat_seconds_ago=JobConsts.STALE_AFTER_SECONDS + 60)
+    with JobHeartbeat(db_utils=job_runner.db_utils, job_id="job"):
+        time.sleep(0.3)
+    job = job_runner.get_job(job_id="job")
+    assert datetime.fromisoformat(job.heartbeat_at) > datetime.now() - timedelta(seconds=5)
@@ -0,0 +1,56 @@
+import pytest
+from pydantic import ValidationError
+
+from objects.book import Book
+from objects.update_request_data import UpdateRequestData
+
+STORED_BOOK = {
+    "CatalogNumber": 1,
+    "IsDigital": False,
+    "ImageURL": "",
+    "Description": "Description",
+    "Info": "Info",
+    "UnitPrice": 10.0,
+    "NotRealUnitPrice": None,
+    "inStock": True,
+    "isCase": False,
+}
+
+SENT_VALUES = [None, "", "text", 0, 1.5, True, [], {}]
+
+
+def validate_update(data: dict) -> UpdateRequestData:
+    return UpdateRequestData.model_validate({"token": None, "insert_type": "book", "data": data})
+
+
+@pytest.mark.parametrize("field", [field for field in STORED_BOOK.keys() if field != "CatalogNumber"])
+@pytest.mark.parametrize("value", SENT_VALUES)
+def test_partial_update_stores_only_valid_books(field, value):
+    # The reads hydrate the stored rows without validation, an accepted update must leave a valid book
+    try:
+        request_data = validate_update(data={"CatalogNumber": 1, field: value})
+    except ValidationError:
+        return
+    updated_book = {**STORED_BOOK, **request_data.data.model_dump(exclude_unset=True)}
+    Book.model_validate(updated_book)
+
+
+@pytest.mark.parametrize("field", ["Info", "UnitPrice", "inStock", "Description", "ImageURL", "IsDigital", "isCase"])
+def test_partial_update_rejects_null_of_not_nullable_field(field):
+    with pytest.raises(ValidationError):
+        validate_update(data={"CatalogNumber": 1, field: None})
+
+
+def test_partial_update_accepts_null_of_nullable_field():
+    request_data = validate_update(data={"CatalogNumber": 1, "NotRealUnitPrice": None})
+    assert request_data.data.model_dump(exclude_unset=True) == {"CatalogNumber": 1, "NotRealUnitPrice": None}
+
+
+def test_partial_update_keeps_only_sent_fields():
+    request_data = validate_update(data={"CatalogNumber": 1, "UnitPrice": 12})
+    assert request_data.data.model_dump(exclude_unset=True) == {"CatalogNumber": 1, "UnitPrice": 12.0}
+
+
+def test_update_data_must_match_insert_type():
+    with pytest.raises(ValidationError):
+        validate_update(data={"banner_id": 1})
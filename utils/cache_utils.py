@@ -0,0 +1,177 @@
+import gzip
+import json
+import mimetypes
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple, Optional
+
+import brotli
+
+from utils.consts import CatalogPayloadConsts, ItemCacheConsts, ImageServingConsts
+from utils.metrics_utils import MetricsUtils
+
+
+class CatalogCache:
+    """
+    In-process snapshots of catalog responses.
+    Every snapshot is tagged with the catalog version it was built from, so a snapshot
+    is only served while the version stored in the DB is still the same.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshots: Dict[str, Dict[str, Tuple[int, Any]]] = {}
+
+    def get(self, table_name: str, key: str, version: int):
+        with self._lock:
+            snapshot = self._snapshots.get(table_name, {}).get(key)
+        if snapshot is None or snapshot[0] != version:
+            MetricsUtils.count_cache_lookup(cache='catalog', hit=False)
+            return None
+        MetricsUtils.count_cache_lookup(cache='catalog', hit=True)
+        return snapshot[1]
+
+    def set(self, table_name: str, key: str, version: int, value: Any):
+        with self._lock:
+            self._snapshots.setdefault(table_name, {})[key] = (version, value)
+
+    def invalidate(self, table_name: str):
+        with self._lock:
+            self._snapshots.pop(table_name, None)
+
+
+class ItemCache:
+    """
+    LRU cache of single catalog items, by table name and item id.
+    Like `CatalogCache`, every item is tagged with the catalog version it was read at.
+    """
+
+    def __init__(self, max_items: int = ItemCacheConsts.MAX_ITEMS):
+        self._lock = threading.Lock()
+        self._max_items = max_items
+        self._items: 'OrderedDict[Tuple[str, Any], Tuple[int, Any]]' = OrderedDict()
+
+    def get(self, table_name: str, item_id, version: int):
+        key = (table_name, item_id)
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and item[0] != version:
+                del self._items[key]
+                item = None
+            if item is not None:
+                self._items.move_to_end(key)
+        MetricsUtils.count_cache_lookup(cache='item', hit=item is not None)
+        return item[1] if item is not None else None
+
+    def set(self, table_name: str, item_id, version: int, value: Any):
+        key = (table_name, item_id)
+        with self._lock:
+            self._items[key] = (version, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self._max_items:
+                self._items.popitem(last=False)
+
+    def invalidate(self, table_name: str, item_ids: list = None):
+        """
+        :param table_name:
+        :param item_ids: Items to remove, default is all the table items
+        :return:
+        """
+        with self._lock:
+            if item_ids is not None:
+                for item_id in item_ids:
+                    self._items.pop((table_name, item_id), None)
+                return
+            for key in [key for key in self._items.keys() if key[0] == table_name]:
+                del self._items[key]
+
+
+class ImageFile:
+    """
+    Image file to serve, with the metadata of its response
+    """
+
+    def __init__(self, path: str, stat_result: os.stat_result, etag: str, route_name: str,
+                 is_derivative: bool = False):
+        self.path = path
+        self.stat_result = stat_result
+        self.etag = etag
+        self.route_name = route_name
+        self.is_derivative = is_derivative
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self._touched_at = time.monotonic()
+
+    def touch_if_needed(self) -> bool:
+        """
+        Mark a derivative as recently used for the eviction, at most once per interval
+
+        :return: False if the file doesn't exist anymore
+        """
+        now = time.monotonic()
+        if now - self._touched_at < ImageServingConsts.DERIVATIVE_TOUCH_INTERVAL:
+            return True
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            return False
+        self._touched_at = now
+        return True
+
+
+class ImageFileCache:
+    """
+    LRU cache of image files metadata, by file name, size and format, so serving an image doesn't stat it.
+    Only content addressed images and their derivatives are kept, they never change.
+    """
+
+    def __init__(self, max_items: int = ImageServingConsts.METADATA_CACHE_MAX_ITEMS):
+        self._lock = threading.Lock()
+        self._max_items = max_items
+        self._image_files: 'OrderedDict[Tuple[str, str, str], ImageFile]' = OrderedDict()
+
+    def get(self, key: Tuple[str, str, str]) -> Optional[ImageFile]:
+        with self._lock:
+            image_file = self._image_files.get(key)
+            if image_file is not None:
+                self._image_files.move_to_end(key)
+        MetricsUtils.count_cache_lookup(cache='image_file', hit=image_file is not None)
+        return image_file
+
+    def set(self, key: Tuple[str, str, str], image_file: ImageFile):
+        with self._lock:
+            self._image_files[key] = image_file
+            self._image_files.move_to_end(key)
+            while len(self._image_files) > self._max_items:
+                self._image_files.popitem(last=False)
+
+    def invalidate(self, key: Tuple[str, str, str]):
+        with self._lock:
+            self._image_files.pop(key, None)
+
+
+class CatalogPayload:
+    """
+    Catalog response serialized to JSON once, with its gzip and brotli encodings
+    """
+
+    def __init__(self, version: int, data: dict, items_count: int):
+        self.version = version
+        self.items_count = items_count
+        with MetricsUtils.stage(name='serialize'):
+            # Same JSON format as flask `jsonify`
+            body = json.dumps(data, sort_keys=True, separators=(",", ":")).encode("utf-8")
+        with MetricsUtils.stage(name='compress'):
+            self._bodies: Dict[Optional[str], bytes] = {
+                None: body,
+                'gzip': gzip.compress(body, compresslevel=CatalogPayloadConsts.GZIP_LEVEL),
+                'br': brotli.compress(body, quality=CatalogPayloadConsts.BROTLI_QUALITY)
+            }
+
+    def get_body(self, encoding: Optional[str] = None) -> bytes:
+        """
+        :param encoding: Content encoding, None for the uncompressed body
+        :return:
+        """
+        return self._bodies[encoding]
@@ -1,11 +1,21 @@
 import os
+import re
+import unicodedata
 from enum import Enum
 
 
 class ContentConsts:
     FIXING_CHARACTERS = {" ": " "}
     LENGTH_OF_PRODUCT_ID = 7
+    IMAGE_CHUNK_SIZE = 64 * 1024
+    IMAGE_BLOB_EXTENSION = 'jpeg'
+    # Content addressed images are named by their SHA-256 hex digest
+    IMAGE_BLOB_FILE_NAME_PATTERN = re.compile(r'^([0-9a-f]{64})\.jpeg$')
     ORDER_IDS = [999991, 999992, 999993]
+    # Hebrew cantillation marks and points (niqqud), removed from the searched text and from the search queries,
+    # so words match with or without them. Latin accents are removed by the search tokenizer.
+    SEARCH_STRIPPED_MARKS = ''.join(chr(code) for code in range(0x0591, 0x05C8)
+                                    if unicodedata.category(chr(code)) == 'Mn')
     REPLACE_INFO_PARSER_TO_TEXT = {
         '<br>': '\n',
         '<b>': '',
@@ -31,3 +41,219 @@ class DomainConsts:
 
 class ServerConsts:
     IMAGES_PATH = os.getenv(key="IMAGES_PATH")
+    # Cache-Control header of each route, by route (endpoint) name
+    CACHE_CONTROL_BY_ROUTE = {
+        'get_books': os.getenv(key="GET_BOOKS_CACHE_CONTROL", default="no-cache"),
+        'get_banners': os.getenv(key="GET_BANNERS_CACHE_CONTROL", default="no-cache"),
+        'search_books': os.getenv(key="SEARCH_BOOKS_CACHE_CONTROL", default="no-cache"),
+        'get_book': os.getenv(key="GET_BOOK_CACHE_CONTROL", default="no-cache"),
+        'get_banner': os.getenv(key="GET_BANNER_CACHE_CONTROL", default="no-cache"),
+        'get_book_image': os.getenv(key="GET_IMAGE_CACHE_CONTROL", default="public, max-age=86400"),
+        # Content addressed images never change
+        'get_book_image_blob': os.getenv(key="GET_IMAGE_BLOB_CACHE_CONTROL",
+                                         default="public, max-age=31536000, immutable")
+    }
+
+
+class CatalogPayloadConsts:
+    # The payload is compressed on the request that follows a catalog change, so on the fly levels are used,
+    # brotli 11 is about 100 times slower than brotli 5 for about 10% smaller bodies
+    GZIP_LEVEL = int(os.getenv(key="CATALOG_GZIP_LEVEL", default=6))
+    BROTLI_QUALITY = int(os.getenv(key="CATALOG_BROTLI_QUALITY", default=5))
+    # Preferred first
+    ENCODINGS = ['br', 'gzip']
+
+
+class ItemCacheConsts:
+    MAX_ITEMS = int(os.getenv(key="ITEM_CACHE_MAX_ITEMS", default=1024))
+
+
+class ImageDerivativeConsts:
+    # Maximum width and height of each size, original size is not resized
+    ORIGINAL_SIZE = 'original'
+    SIZES = {
+        'thumbnail': 200,
+        'medium': 600,
+        ORIGINAL_SIZE: None
+    }
+    ORIGINAL_FORMAT = 'jpeg'
+    # Pillow format name by file extension
+    FORMATS = {
+        'jpeg': 'JPEG',
+        'webp': 'WEBP'
+    }
+    QUALITY = 85
+    CACHE_DIR_NAME = 'derivatives'
+    CACHE_MAX_BYTES = int(os.getenv(key="IMAGE_DERIVATIVES_CACHE_MAX_BYTES", default=512 * 1024 * 1024))
+    # Derivatives are generated on their first request by default, generating every size and format on upload
+    # runs in the writing request, a bulk insert with images may exceed the worker timeout
+    GENERATE_ON_UPLOAD = os.getenv(key="IMAGE_DERIVATIVES_GENERATE_ON_UPLOAD", default="0") == "1"
+    # The cache directory is scanned for eviction once this many bytes were generated, or this many seconds passed
+    EVICTION_BYTES_THRESHOLD = int(os.getenv(key="IMAGE_DERIVATIVES_EVICTION_BYTES_THRESHOLD",
+                                             default=16 * 1024 * 1024))
+    EVICTION_INTERVAL = int(os.getenv(key="IMAGE_DERIVATIVES_EVICTION_INTERVAL", default=300))
+    TEMP_SUFFIX = '.tmp'
+    # Temporary files left by a killed worker are removed by the eviction after this many seconds
+    STALE_TEMP_SECONDS = 3600
+
+
+class ImageServingConsts:
+    # Content addressed images metadata kept in memory
+    METADATA_CACHE_MAX_ITEMS = int(os.getenv(key="IMAGE_METADATA_CACHE_MAX_ITEMS", default=4096))
+    # Seconds between marking a served derivative as recently used, for the derivatives eviction
+    DERIVATIVE_TOUCH_INTERVAL = 60
+    # Hand the transfer to the front proxy, `x-accel-redirect` (nginx) or `x-sendfile` (apache, lighttpd),
+    # empty to send the files from the app
+    OFFLOAD = os.getenv(key="IMAGE_OFFLOAD", default="").lower()
+    # Internal location of the images directory on the proxy, of `x-accel-redirect`
+    ACCEL_REDIRECT_PREFIX = os.getenv(key="IMAGE_ACCEL_REDIRECT_PREFIX", default="/protected-images/")
+    # Read size when the server has no `wsgi.file_wrapper`, and of range responses
+    CHUNK_SIZE = 256 * 1024
+
+
+class ImageFetchConsts:
+    MAX_WORKERS = int(os.getenv(key="IMAGE_FETCH_MAX_WORKERS", default=8))
+    MAX_PER_HOST = int(os.getenv(key="IMAGE_FETCH_MAX_PER_HOST", default=4))
+    TIMEOUT = float(os.getenv(key="IMAGE_FETCH_TIMEOUT", default=15))
+    RETRIES = int(os.getenv(key="IMAGE_FETCH_RETRIES", default=3))
+    BACKOFF_FACTOR = 0.5
+    RETRY_STATUSES = [429, 500, 502, 503, 504]
+    # Downloads in flight per worker, the downloaded images are kept in memory until they are consumed
+    IN_FLIGHT_PER_WORKER = 2
+
+
+class CatalogResetConsts:
+    BOOKS_URL = os.getenv(key="CATALOG_RESET_BOOKS_URL",
+                          default="https://github.com/scarlet-website/api-data/blob/main/books.json")
+    # Number of books written to the DB per transaction
+    BATCH_SIZE = 50
+
+
+class JobStatus(Enum):
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+
+
+class JobType(Enum):
+    RESET_BOOKS_FROM_GITHUB = 'reset_books_from_github'
+
+
+class JobConsts:
+    # The worker running a job writes a heartbeat, however long the job steps are
+    HEARTBEAT_INTERVAL = int(os.getenv(key="JOB_HEARTBEAT_INTERVAL_SECONDS", default=30))
+    # A running job is run again when its worker is gone: a process of this host that doesn't exist anymore,
+    # or a worker that didn't write a heartbeat for this long (e.g. on another host)
+    STALE_AFTER_SECONDS = int(os.getenv(key="JOB_STALE_AFTER_SECONDS", default=10 * 60))
+    # Minimum seconds between progress writes to the DB
+    PROGRESS_INTERVAL = 1
+
+
+class BooksPageConsts:
+    MAX_LIMIT = 500
+    # Fields that are never returned, and can't be selected with `fields`
+    HIDDEN_FIELDS = ['InfoHtml']
+
+
+class SearchBooksConsts:
+    DEFAULT_LIMIT = 24
+    MAX_LIMIT = 100
+    # BM25 weight of each searched column, a match in the description counts more than in the info
+    WEIGHTS = {
+        'Description': 10.0,
+        'Info': 1.0
+    }
+    SNIPPET_TOKENS = 16
+    RESULT_FIELDS = ['CatalogNumber', 'Description', 'ImageURL', 'UnitPrice', 'NotRealUnitPrice', 'inStock',
+                     'IsDigital', 'isCase']
+
+
+class ExportFormat(Enum):
+    # Whole list in one JSON object, the original response
+    JSON = 'json'
+    NDJSON = 'ndjson'
+    CSV = 'csv'
+    # Keyset paginated JSON
+    PAGE = 'page'
+
+
+class NewsletterExportConsts:
+    # Rows fetched from the DB per chunk of a streamed export
+    BATCH_SIZE = int(os.getenv(key="NEWSLETTER_EXPORT_BATCH_SIZE", default=1000))
+    COLUMNS = ['EmailAddress']
+    MIMETYPES = {
+        ExportFormat.JSON: 'application/json',
+        ExportFormat.NDJSON: 'application/x-ndjson',
+        ExportFormat.CSV: 'text/csv',
+        ExportFormat.PAGE: 'application/json'
+    }
+    CSV_FILE_NAME = 'news_letters.csv'
+    DEFAULT_PAGE_LIMIT = 1000
+    MAX_PAGE_LIMIT = 10000
+
+
+class DurabilityMode(Enum):
+    # Every signup is committed on its own before the response
+    SYNC = 'sync'
+    # Signups are written in batches, the response is sent once the batch of the signup is committed
+    GROUP_COMMIT = 'group_commit'
+    # The response is sent once the signup is queued, queued signups are lost if the process is killed
+    BUFFERED = 'buffered'
+
+
+class NewsletterSignupConsts:
+    DURABILITY = DurabilityMode(os.getenv(key="NEWSLETTER_DURABILITY", default=DurabilityMode.GROUP_COMMIT.value))
+    # A batch is written when it has this many emails, or when its first email waited the flush interval
+    MAX_BATCH = int(os.getenv(key="NEWSLETTER_MAX_BATCH", default=500))
+    FLUSH_INTERVAL_MS = int(os.getenv(key="NEWSLETTER_FLUSH_INTERVAL_MS", default=200))
+    # Flush interval of group commit, where the requests wait for the batch.
+    # Signups queued while a batch is written make the next batch, so bursts are batched even without a delay.
+    COMMIT_DELAY_MS = int(os.getenv(key="NEWSLETTER_COMMIT_DELAY_MS", default=0))
+    MAX_QUEUE = int(os.getenv(key="NEWSLETTER_MAX_QUEUE", default=10000))
+    # Seconds a signup waits for its batch to be committed, after that it is answered as queued
+    COMMIT_TIMEOUT = 5
+    # Seconds to write the queued signups on shutdown
+    STOP_TIMEOUT = 5
+    # Signups per minute of a client, 0 (default) disables the limit.
+    # Behind a reverse proxy all the clients have the proxy address, so the limit is applied only if
+    # `TRUST_FORWARDED_FOR` is set, or `NEWSLETTER_RATE_LIMIT_DIRECT_CLIENTS` when the clients connect directly.
+    RATE_LIMIT_PER_MINUTE = int(os.getenv(key="NEWSLETTER_RATE_LIMIT_PER_MINUTE", default=0))
+    RATE_LIMIT_BURST = int(os.getenv(key="NEWSLETTER_RATE_LIMIT_BURST", default=5))
+    RATE_LIMIT_DIRECT_CLIENTS = os.getenv(key="NEWSLETTER_RATE_LIMIT_DIRECT_CLIENTS", default="0") == "1"
+    # Clients tracked by the rate limiter, the least recently seen are forgotten
+    RATE_LIMIT_MAX_CLIENTS = 10000
+    # Behind a reverse proxy the client address is the last `X-Forwarded-For` address, the one the proxy added
+    TRUST_FORWARDED_FOR = os.getenv(key="TRUST_FORWARDED_FOR", default="0") == "1"
+
+
+class AsgiConsts:
+    # Threads running the blocking work (SQLite, image derivatives) of the async routes
+    THREADPOOL_SIZE = int(os.getenv(key="ASGI_THREADPOOL_SIZE", default=40))
+    # Threads running the Flask routes that have no async version
+    WSGI_WORKERS = int(os.getenv(key="ASGI_WSGI_WORKERS", default=10))
+
+
+class LogConsts:
+    LEVEL = os.getenv(key="LOG_LEVEL", default="INFO").upper()
+    # Levels of specific modules, e.g. `db.db_utils=WARNING,manager.routes=DEBUG`
+    MODULE_LEVELS = os.getenv(key="LOG_LEVELS", default="")
+    # `text` or `json`
+    FORMAT = os.getenv(key="LOG_FORMAT", default="text").lower()
+    TEXT_FORMAT = "%(asctime)s %(levelname)s [%(process)d] %(name)s: %(message)s"
+    # Records waiting to be written, records logged while the queue is full are dropped
+    QUEUE_SIZE = int(os.getenv(key="LOG_QUEUE_SIZE", default=10000))
+
+
+class MetricsConsts:
+    # Set PROMETHEUS_MULTIPROC_DIR to an empty directory to aggregate the metrics of all the workers,
+    # every worker writes its metrics to files named by its pid in that directory
+    MULTIPROCESS_DIR = os.getenv(key="PROMETHEUS_MULTIPROC_DIR")
+    # Per request profiling with the `X-Profile` request header (`stages` or `cprofile`)
+    PROFILING_ENABLED = os.getenv(key="METRICS_PROFILING_ENABLED", default="0") == "1"
+    PROFILE_HEADER = 'X-Profile'
+    PROFILE_STAGES = 'stages'
+    PROFILE_CPROFILE = 'cprofile'
+    # Lines of the cProfile stats written to the log
+    CPROFILE_LINES = 40
+    LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
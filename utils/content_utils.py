@@ -1,37 +1,77 @@
-import base64
+import hashlib
 import os
+import re
+import tempfile
 import uuid
+from typing import Tuple, Optional, Dict
 
-from utils.consts import ContentConsts, ServerConsts
+from utils.consts import ContentConsts, ServerConsts, ImageDerivativeConsts
 from utils.exceptions import NotValidEmailAddressException
+from utils.image_utils import ImageUtils
+from utils.log_utils import LogUtils
+from utils.metrics_utils import MetricsUtils
+
+logger = LogUtils.get_logger(__name__)
+
+
+def compile_replacements_pattern(replacements: Dict[str, str]) -> re.Pattern:
+    # Longest first, so a key is never shadowed by its own prefix
+    keys = sorted(replacements.keys(), key=len, reverse=True)
+    return re.compile('|'.join(re.escape(key) for key in keys))
 
 
 class ContentUtils:
+    _INFO_TO_HTML_PATTERN = compile_replacements_pattern(replacements=ContentConsts.REPLACE_INFO_PARSER_TO_HTML)
+    _INFO_TO_TEXT_PATTERN = compile_replacements_pattern(replacements=ContentConsts.REPLACE_INFO_PARSER_TO_TEXT)
+    _SEARCH_STRIPPED_MARKS_TABLE = str.maketrans('', '', ContentConsts.SEARCH_STRIPPED_MARKS)
+
     @staticmethod
     def info_html_parser(text_info: str) -> str:
         """
-        Parsing description text to html
+        Parsing description text to html, in a single pass over the text
 
         :param text_info:
         :return:
         """
-        for key, value in ContentConsts.REPLACE_INFO_PARSER_TO_HTML.items():
-            text_info = text_info.replace(key, value)
-        html_info = text_info.strip()
-        return html_info
+        replacements = ContentConsts.REPLACE_INFO_PARSER_TO_HTML
+        html_info = ContentUtils._INFO_TO_HTML_PATTERN.sub(lambda match: replacements[match.group(0)], text_info)
+        return html_info.strip()
 
     @staticmethod
     def info_text_parser(html_info: str) -> str:
         """
-        Parsing description html to regular text
+        Parsing description html to regular text, in a single pass over the html
 
         :param html_info:
         :return:
         """
-        for key, value in ContentConsts.REPLACE_INFO_PARSER_TO_TEXT.items():
-            html_info = html_info.replace(key, value)
-        text_info = html_info.strip()
-        return text_info
+        replacements = ContentConsts.REPLACE_INFO_PARSER_TO_TEXT
+        text_info = ContentUtils._INFO_TO_TEXT_PATTERN.sub(lambda match: replacements[match.group(0)], html_info)
+        return text_info.strip()
+
+    @staticmethod
+    def build_search_query(text: str) -> str:
+        """
+        Build a full text search query from free text, each word matches as a prefix and all words must match.
+        Words are quoted, so characters of the FTS5 query syntax are searched as is.
+
+        :param text:
+        :return: FTS5 query, empty if the text has no words
+        """
+        words = ContentUtils.strip_search_marks(text=text).split()
+        return ' '.join('"' + word.replace('"', '""') + '"*' for word in words)
+
+    @staticmethod
+    def strip_search_marks(text: Optional[str]) -> Optional[str]:
+        """
+        Remove the marks the search tables are indexed without (`ContentConsts.SEARCH_STRIPPED_MARKS`)
+
+        :param text:
+        :return:
+        """
+        if not text:
+            return text
+        return text.translate(ContentUtils._SEARCH_STRIPPED_MARKS_TABLE)
 
     @staticmethod
     def fix_characters(content: str) -> str:
@@ -56,39 +96,169 @@ class ContentUtils:
         return product_id
 
     @staticmethod
-    def add_image(image_data: bytes, file_name: str):
-        print("Start content_utils add_image")
+    def generate_image_derivatives_if_needed(file_name: str):
+        if not ImageDerivativeConsts.GENERATE_ON_UPLOAD:
+            return
+        try:
+            ImageUtils.generate_all_derivatives(file_name=file_name)
+        except Exception as e:
+            # Derivatives are generated again on the first request
+            logger.warning("Error generating derivatives of image `%s`, except: %s", file_name, e)
+
+    @staticmethod
+    def iter_image_chunks(image_data, chunk_size: int = ContentConsts.IMAGE_CHUNK_SIZE):
+        """
+        Iterate over the image content, the image is either bytes or a file like object (e.g. werkzeug FileStorage)
+
+        :param image_data:
+        :param chunk_size:
+        :return:
+        """
+        if isinstance(image_data, (bytes, bytearray, memoryview)):
+            yield image_data
+            return
+
+        for chunk in iter(lambda: image_data.read(chunk_size), b""):
+            yield chunk
+
+    @staticmethod
+    def write_temp_image(image_data) -> Tuple[str, str]:
+        """
+        Stream the image to a temporary file in the images directory
+
+        :param image_data: Bytes or a file like object
+        :return: Temporary file path, and the SHA-256 hex digest of the image
+        """
+        os.makedirs(ServerConsts.IMAGES_PATH, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=ServerConsts.IMAGES_PATH, prefix=".image.", suffix=".tmp")
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, "wb") as f:
+                for chunk in ContentUtils.iter_image_chunks(image_data=image_data):
+                    digest.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                os.fsync(f.fileno())
+            # `mkstemp` creates the file readable by the owner only, the front proxy may serve it
+            os.chmod(temp_path, 0o644)
+            return temp_path, digest.hexdigest()
+        except Exception as e:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise e
+
+    @staticmethod
+    def save_image(image_data, file_name: str):
+        """
+        Stream the image to a temporary file and atomically move it into place,
+        so a partially written image is never served
+
+        :param image_data: Bytes or a file like object
+        :param file_name:
+        :return:
+        """
         try:
-            image_data = "data:image/jpeg;base64," + base64.b64encode(image_data).decode('utf-8')
-            if not os.path.exists(ServerConsts.IMAGES_PATH):
-                os.mkdir(ServerConsts.IMAGES_PATH)
-            ContentUtils.delete_image_if_exists(image_file_name=file_name)
+            temp_path, _ = ContentUtils.write_temp_image(image_data=image_data)
             path = os.path.join(ServerConsts.IMAGES_PATH, file_name)
-            with open(path, "wb") as f:
-                f.write(base64.b64decode(image_data.split(',')[1]))
-                print(f"Saved image at {path}")
-            return path
+            os.replace(temp_path, path)
+            logger.info("Saved image at %s", path)
         except Exception as e:
-            print(f"Error saving image: `{file_name}`, except: {str(e)}")
+            logger.error("Error saving image: `%s`, except: %s", file_name, e)
             raise e
 
+        ImageUtils.delete_derivatives(file_name=file_name)
+        ContentUtils.generate_image_derivatives_if_needed(file_name=file_name)
+
+    @staticmethod
+    def add_image(image_data, file_name: str):
+        ContentUtils.save_image(image_data=image_data, file_name=file_name)
+        return os.path.join(ServerConsts.IMAGES_PATH, file_name)
+
+    @staticmethod
+    def get_image_blob_file_name(digest: str) -> str:
+        return f"{digest}.{ContentConsts.IMAGE_BLOB_EXTENSION}"
+
+    @staticmethod
+    def get_image_blob_digest(file_name: str) -> Optional[str]:
+        """
+        Get the digest of a content addressed image file name
+
+        :param file_name:
+        :return: The digest, None if the file name isn't a content addressed image
+        """
+        if not file_name:
+            return None
+        match = ContentConsts.IMAGE_BLOB_FILE_NAME_PATTERN.match(file_name)
+        if not match:
+            return None
+        return match.group(1)
+
+    @staticmethod
+    def add_image_blob(image_data) -> str:
+        """
+        Save the image in the content addressed store, identical images are stored once
+
+        :param image_data: Bytes or a file like object
+        :return: Image file name, derived from the image SHA-256 digest
+        """
+        temp_path, digest = ContentUtils.write_temp_image(image_data=image_data)
+        file_name = ContentUtils.get_image_blob_file_name(digest=digest)
+        if ContentUtils.store_image_blob(temp_path=temp_path, file_name=file_name):
+            ContentUtils.generate_image_derivatives_if_needed(file_name=file_name)
+        return file_name
+
+    @staticmethod
+    def store_image_blob(temp_path: str, file_name: str) -> bool:
+        """
+        Move an image written by `write_temp_image` to its content addressed name, unless the image already exists
+
+        :param temp_path:
+        :param file_name: Content addressed file name of the image
+        :return: True if the image was stored, False if it already existed
+        """
+        path = os.path.join(ServerConsts.IMAGES_PATH, file_name)
+        if os.path.exists(path):
+            os.remove(temp_path)
+            logger.debug("Image `%s` already exists", file_name)
+            MetricsUtils.count_image_upload(stored=False)
+            return False
+
+        os.replace(temp_path, path)
+        logger.info("Saved image at %s", path)
+        MetricsUtils.count_image_upload(stored=True)
+        return True
+
+    @staticmethod
+    def discard_temp_image(temp_path: str):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
     @staticmethod
     def get_image_file_name(insert_type: str, item_id: str) -> str:
         file_name = f"{insert_type}_{item_id}.jpeg"
         return file_name
 
+    @staticmethod
+    def image_exists(image_file_name: str) -> bool:
+        return os.path.exists(os.path.join(ServerConsts.IMAGES_PATH, image_file_name))
+
     @staticmethod
     def delete_image_if_exists(image_file_name):
         file_path = None
         try:
             file_path = os.path.join(ServerConsts.IMAGES_PATH, image_file_name)
+            ImageUtils.delete_derivatives(file_name=image_file_name)
             if os.path.exists(file_path):
                 os.remove(file_path)
-                print(f"Removed image {file_path} successfully")
+                logger.info("Removed image %s successfully", file_path)
             else:
-                print(f"Image file {file_path} doesn't exist")
+                logger.debug("Image file %s doesn't exist", file_path)
         except Exception as e:
-            print(f"Error deleting image `{file_path}`, except: {str(e)}")
+            logger.error("Error deleting image `%s`, except: %s", file_path, e)
+
+    @staticmethod
+    def normalize_email_address(email: str) -> str:
+        return email.strip().lower()
 
     @staticmethod
     def check_valid_email_address(email: str):
@@ -98,7 +268,7 @@ class ContentUtils:
                 raise NotValidEmailAddressException
         except Exception as e:
             desc = f"Not valid email address: `{email}`"
-            print(f"desc, except: {str(e)}")
+            logger.debug("%s, except: %s", desc, e)
             raise NotValidEmailAddressException(desc)
 
     @staticmethod
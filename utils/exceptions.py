@@ -6,3 +6,8 @@ class UnknownInsertType(Exception):
 class NotValidEmailAddressException(Exception):
     def __init__(self, msg: str = None):
         self.msg = msg
+
+
+class NewsletterBufferFullException(Exception):
+    def __init__(self, msg: str = None):
+        self.msg = msg
@@ -0,0 +1,45 @@
+import csv
+import io
+import json
+from typing import Iterable, Iterator, List
+
+
+class ExportUtils:
+    """
+    Encoders of streamed exports, every batch of rows is encoded to a single chunk
+    """
+
+    @staticmethod
+    def iter_json_list(key: str, batches: Iterable[List[tuple]]) -> Iterator[str]:
+        """
+        Encode the first column of the rows as a JSON list in an object, in the same format as flask `jsonify`
+
+        :param key: Key of the list in the object
+        :param batches:
+        :return:
+        """
+        yield f'{{{json.dumps(key)}:['
+        separator = ''
+        for rows in batches:
+            yield separator + ','.join(json.dumps(row[0]) for row in rows)
+            separator = ','
+        yield ']}\n'
+
+    @staticmethod
+    def iter_ndjson(columns: List[str], batches: Iterable[List[tuple]]) -> Iterator[str]:
+        for rows in batches:
+            yield ''.join(json.dumps(dict(zip(columns, row))) + '\n' for row in rows)
+
+    @staticmethod
+    def iter_csv(columns: List[str], batches: Iterable[List[tuple]]) -> Iterator[str]:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        for rows in batches:
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        # Header of an empty export
+        if buffer.tell():
+            yield buffer.getvalue()
@@ -0,0 +1,91 @@
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Iterable, Iterator, Optional, Tuple, Any
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from utils.consts import ImageFetchConsts
+from utils.log_utils import LogUtils
+
+logger = LogUtils.get_logger(__name__)
+
+
+class ImageFetcher:
+    """
+    Download images concurrently over a pooled HTTP session.
+    Failed requests are retried with backoff, and the number of concurrent requests to a single host is limited.
+    """
+
+    def __init__(self, max_workers: int = ImageFetchConsts.MAX_WORKERS,
+                 max_per_host: int = ImageFetchConsts.MAX_PER_HOST,
+                 timeout: float = ImageFetchConsts.TIMEOUT,
+                 retries: int = ImageFetchConsts.RETRIES,
+                 backoff_factor: float = ImageFetchConsts.BACKOFF_FACTOR):
+        self._max_workers = max_workers
+        self._timeout = timeout
+        self._session = requests.Session()
+        retry = Retry(total=retries, backoff_factor=backoff_factor, status_forcelist=ImageFetchConsts.RETRY_STATUSES,
+                      allowed_methods=["GET"], raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers, max_retries=retry)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._host_semaphores = defaultdict(lambda: threading.BoundedSemaphore(max_per_host))
+        self._host_semaphores_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        self._session.close()
+
+    def _get_host_semaphore(self, url: str) -> threading.BoundedSemaphore:
+        with self._host_semaphores_lock:
+            return self._host_semaphores[urlparse(url).netloc]
+
+    def fetch(self, url: str) -> Optional[bytes]:
+        """
+        Download a single image
+
+        :param url:
+        :return: Image content, None if the image couldn't be downloaded
+        """
+        try:
+            with self._get_host_semaphore(url=url):
+                response = self._session.get(url, timeout=self._timeout)
+            if response.status_code == 200:
+                return response.content
+            logger.warning("Error getting image of `%s`, status code: %s", url, response.status_code)
+        except Exception as e:
+            logger.warning("Error getting image of `%s`, except: %s", url, e)
+        return None
+
+    def fetch_all(self, urls: Iterable[Tuple[Any, str]]) -> Iterator[Tuple[Any, Optional[bytes]]]:
+        """
+        Download many images concurrently, images are yielded as soon as they complete (not by the given order).
+        A bounded number of downloads is in flight, so only those images are kept in memory, not the whole set.
+
+        :param urls: (key, url) pairs
+        :return: (key, image content) pairs, the content is None if the image couldn't be downloaded
+        """
+        max_in_flight = self._max_workers * ImageFetchConsts.IN_FLIGHT_PER_WORKER
+        urls = iter(urls)
+        with ThreadPoolExecutor(max_workers=self._max_workers) as executor:
+            futures = {}
+            while True:
+                for key, url in urls:
+                    futures[executor.submit(self.fetch, url)] = key
+                    if len(futures) >= max_in_flight:
+                        break
+                if not futures:
+                    return
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    # Dropping the future, and its image, once it is yielded
+                    yield futures.pop(future), future.result()
@@ -0,0 +1,111 @@
+import os
+from typing import Optional, List, BinaryIO, Iterator
+
+
+class HttpUtils:
+    @staticmethod
+    def make_etag(*parts) -> str:
+        """
+        Build an (unquoted) entity tag from the given parts
+
+        :param parts:
+        :return:
+        """
+        return '-'.join(str(part) for part in parts)
+
+    @staticmethod
+    def get_file_etag(stat_result: os.stat_result) -> str:
+        return HttpUtils.make_etag(f"{stat_result.st_mtime_ns:x}", f"{stat_result.st_size:x}")
+
+    @staticmethod
+    def is_etag_matching(if_none_match: Optional[str], etag: str) -> bool:
+        """
+        Check if an If-None-Match header value matches the entity tag (weak comparison, as the RFC requires)
+
+        :param if_none_match: Raw header value, e.g. `"abc", W/"def"`
+        :param etag: Unquoted entity tag
+        :return:
+        """
+        if not if_none_match:
+            return False
+
+        for tag in if_none_match.split(','):
+            tag = tag.strip()
+            if tag == '*':
+                return True
+            if tag.startswith('W/'):
+                tag = tag[2:]
+            if tag.strip('"') == etag:
+                return True
+        return False
+
+    @staticmethod
+    def choose_content_encoding(accept_encoding: Optional[str], encodings: List[str]) -> Optional[str]:
+        """
+        Choose the response content encoding by an Accept-Encoding header value
+
+        :param accept_encoding: Raw header value, e.g. `gzip, deflate, br;q=0.9`
+        :param encodings: Available encodings, preferred first
+        :return: The chosen encoding, None for no encoding
+        """
+        if not accept_encoding:
+            return None
+
+        quality_by_encoding = {}
+        for accepted in accept_encoding.split(','):
+            name, _, params = accepted.strip().partition(';')
+            quality = 1.0
+            params = params.strip()
+            if params.startswith('q='):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0
+            quality_by_encoding[name.strip().lower()] = quality
+
+        best_encoding, best_quality = None, 0
+        for encoding in encodings:
+            quality = quality_by_encoding.get(encoding, quality_by_encoding.get('*', 0))
+            if quality > best_quality:
+                best_encoding, best_quality = encoding, quality
+        return best_encoding
+
+    @staticmethod
+    def get_offload_headers(path: str, root_path: str, offload: str, accel_redirect_prefix: str) -> dict:
+        """
+        Headers handing the file transfer to the front proxy
+
+        :param path: File path
+        :param root_path: Directory the proxy location of `x-accel-redirect` points to
+        :param offload: `x-accel-redirect` or `x-sendfile`
+        :param accel_redirect_prefix: Internal proxy location of the root directory
+        :return:
+        """
+        if offload == 'x-accel-redirect':
+            relative_path = os.path.relpath(path, root_path).replace(os.sep, '/')
+            return {'X-Accel-Redirect': accel_redirect_prefix.rstrip('/') + '/' + relative_path}
+        if offload == 'x-sendfile':
+            return {'X-Sendfile': os.path.abspath(path)}
+        raise ValueError(f"Unknown offload `{offload}`")
+
+    @staticmethod
+    def iter_file_range(file: BinaryIO, start: int, length: int, chunk_size: int) -> Iterator[bytes]:
+        """
+        Read a byte range of the file, closing the file at the end
+
+        :param file: File opened in binary mode
+        :param start:
+        :param length:
+        :param chunk_size:
+        :return:
+        """
+        try:
+            file.seek(start)
+            while length > 0:
+                chunk = file.read(min(chunk_size, length))
+                if not chunk:
+                    break
+                length -= len(chunk)
+                yield chunk
+        finally:
+            file.close()
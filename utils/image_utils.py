@@ -0,0 +1,177 @@
+import os
+import tempfile
+import threading
+import time
+from typing import Optional
+
+from PIL import Image
+
+from utils.consts import ImageDerivativeConsts, ServerConsts
+from utils.log_utils import LogUtils
+
+logger = LogUtils.get_logger(__name__)
+
+
+class ImageUtils:
+    """
+    Resized / re-encoded derivatives of the saved images.
+    Derivatives are kept in a cache directory inside the images directory, the least recently used derivatives
+    are evicted when the cache grows over its maximum size.
+    """
+    _eviction_lock = threading.Lock()
+    _eviction_thread: Optional[threading.Thread] = None
+    _bytes_since_eviction = 0
+    _last_eviction_time = 0.0
+
+    @staticmethod
+    def get_cache_dir() -> str:
+        return os.path.join(ServerConsts.IMAGES_PATH, ImageDerivativeConsts.CACHE_DIR_NAME)
+
+    @staticmethod
+    def is_original(size: str, image_format: str) -> bool:
+        return size == ImageDerivativeConsts.ORIGINAL_SIZE and image_format == ImageDerivativeConsts.ORIGINAL_FORMAT
+
+    @staticmethod
+    def get_derivative_file_name(file_name: str, size: str, image_format: str) -> str:
+        name, _ = os.path.splitext(file_name)
+        return f"{name}_{size}.{image_format}"
+
+    @staticmethod
+    def get_derivative_path(file_name: str, size: str, image_format: str) -> Optional[str]:
+        """
+        Get the path of an image derivative, generating it on the first request
+
+        :param file_name: Original image file name
+        :param size: One of `ImageDerivativeConsts.SIZES`
+        :param image_format: One of `ImageDerivativeConsts.FORMATS`
+        :return: Derivative path, None if the original should be served
+        """
+        if ImageUtils.is_original(size=size, image_format=image_format):
+            return None
+
+        derivative_file_name = ImageUtils.get_derivative_file_name(file_name=file_name, size=size,
+                                                                   image_format=image_format)
+        path = os.path.join(ImageUtils.get_cache_dir(), derivative_file_name)
+        if os.path.exists(path):
+            # Marking as recently used, for the eviction
+            os.utime(path)
+            return path
+
+        ImageUtils.generate_derivative(file_name=file_name, size=size, image_format=image_format)
+        return path
+
+    @staticmethod
+    def generate_derivative(file_name: str, size: str, image_format: str) -> str:
+        original_path = os.path.join(ServerConsts.IMAGES_PATH, file_name)
+        cache_dir = ImageUtils.get_cache_dir()
+        os.makedirs(cache_dir, exist_ok=True)
+        path = os.path.join(cache_dir, ImageUtils.get_derivative_file_name(file_name=file_name, size=size,
+                                                                           image_format=image_format))
+
+        with Image.open(original_path) as image:
+            max_size = ImageDerivativeConsts.SIZES[size]
+            if max_size:
+                image.thumbnail((max_size, max_size))
+            if image.mode not in ("RGB", "L"):
+                image = image.convert("RGB")
+
+            # Writing to a temporary file first, so a partially written derivative is never served.
+            # The temporary file is unique, threads of the same worker may generate the same derivative.
+            fd, temp_path = tempfile.mkstemp(dir=cache_dir, suffix=ImageDerivativeConsts.TEMP_SUFFIX)
+            try:
+                with os.fdopen(fd, 'wb') as temp_file:
+                    image.save(temp_file, format=ImageDerivativeConsts.FORMATS[image_format],
+                               quality=ImageDerivativeConsts.QUALITY)
+                    derivative_size = temp_file.tell()
+                # `mkstemp` creates the file readable by the owner only, the front proxy may serve it
+                os.chmod(temp_path, 0o644)
+                os.replace(temp_path, path)
+            except BaseException:
+                os.remove(temp_path)
+                raise
+
+        ImageUtils.schedule_eviction(added_bytes=derivative_size)
+        logger.debug("Generated image derivative %s", path)
+        return path
+
+    @staticmethod
+    def generate_all_derivatives(file_name: str):
+        for size in ImageDerivativeConsts.SIZES.keys():
+            for image_format in ImageDerivativeConsts.FORMATS.keys():
+                if not ImageUtils.is_original(size=size, image_format=image_format):
+                    ImageUtils.generate_derivative(file_name=file_name, size=size, image_format=image_format)
+
+    @staticmethod
+    def delete_derivatives(file_name: str):
+        for size in ImageDerivativeConsts.SIZES.keys():
+            for image_format in ImageDerivativeConsts.FORMATS.keys():
+                path = os.path.join(ImageUtils.get_cache_dir(), ImageUtils.get_derivative_file_name(
+                    file_name=file_name, size=size, image_format=image_format
+                ))
+                if os.path.exists(path):
+                    os.remove(path)
+
+    @staticmethod
+    def schedule_eviction(added_bytes: int):
+        """
+        Evict derivatives in a background thread, once enough bytes were generated or enough time passed since
+        the last eviction, instead of scanning the cache directory on every generated derivative
+
+        :param added_bytes: Size of the generated derivative
+        :return:
+        """
+        with ImageUtils._eviction_lock:
+            ImageUtils._bytes_since_eviction += added_bytes
+            now = time.monotonic()
+            if ImageUtils._bytes_since_eviction < ImageDerivativeConsts.EVICTION_BYTES_THRESHOLD and \
+                    now - ImageUtils._last_eviction_time < ImageDerivativeConsts.EVICTION_INTERVAL:
+                return
+            if ImageUtils._eviction_thread is not None and ImageUtils._eviction_thread.is_alive():
+                return
+            ImageUtils._bytes_since_eviction = 0
+            ImageUtils._last_eviction_time = now
+            ImageUtils._eviction_thread = threading.Thread(target=ImageUtils.evict_derivatives,
+                                                           name="derivatives-eviction", daemon=True)
+            ImageUtils._eviction_thread.start()
+
+    @staticmethod
+    def evict_derivatives():
+        cache_dir = ImageUtils.get_cache_dir()
+        if not os.path.exists(cache_dir):
+            return
+
+        try:
+            entries = []
+            for entry in os.scandir(cache_dir):
+                if not entry.is_file():
+                    continue
+                if entry.name.endswith(ImageDerivativeConsts.TEMP_SUFFIX):
+                    # Derivatives being written, unless left by a killed worker
+                    ImageUtils.remove_stale_temp_file(entry=entry)
+                    continue
+                entries.append(entry)
+        except FileNotFoundError:
+            return
+
+        total_size = sum(entry.stat().st_size for entry in entries)
+        if total_size <= ImageDerivativeConsts.CACHE_MAX_BYTES:
+            return
+
+        for entry in sorted(entries, key=lambda e: e.stat().st_mtime):
+            entry_size = entry.stat().st_size
+            try:
+                os.remove(entry.path)
+                total_size -= entry_size
+            except FileNotFoundError:
+                pass
+            if total_size <= ImageDerivativeConsts.CACHE_MAX_BYTES:
+                break
+        logger.info("Evicted image derivatives, cache size: %d", total_size)
+
+    @staticmethod
+    def remove_stale_temp_file(entry: os.DirEntry):
+        try:
+            if time.time() - entry.stat().st_mtime > ImageDerivativeConsts.STALE_TEMP_SECONDS:
+                os.remove(entry.path)
+        except FileNotFoundError:
+            pass
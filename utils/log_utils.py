@@ -0,0 +1,128 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional
+
+from utils.consts import LogConsts
+
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats every record as a single JSON line
+    """
+
+    def format(self, record: logging.LogRecord) -> str:
+        log_entry = {
+            "time": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.process,
+            "thread": record.threadName,
+            "message": record.getMessage()
+        }
+        if record.exc_info:
+            log_entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(log_entry, ensure_ascii=False)
+
+
+class DroppingQueueHandler(QueueHandler):
+    """
+    Queue handler that never blocks the logging thread, records are dropped while the queue is full
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped_records = 0
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped_records += 1
+
+
+class LogUtils:
+    """
+    Logging is configured once per process, records are written to stdout by a background listener thread,
+    so request threads only put records on a queue
+    """
+    _lock = threading.Lock()
+    _listener: Optional[QueueListener] = None
+    _queue_handler: Optional[DroppingQueueHandler] = None
+
+    @staticmethod
+    def get_formatter() -> logging.Formatter:
+        if LogConsts.FORMAT == "json":
+            return JsonFormatter()
+        return logging.Formatter(fmt=LogConsts.TEXT_FORMAT)
+
+    @staticmethod
+    def parse_module_levels(module_levels: str) -> Dict[str, str]:
+        """
+        :param module_levels: Comma separated `module=LEVEL` pairs
+        :return: Level by module name
+        """
+        levels = {}
+        for module_level in module_levels.split(','):
+            if '=' not in module_level:
+                continue
+            module, level = module_level.split('=', 1)
+            levels[module.strip()] = level.strip().upper()
+        return levels
+
+    @staticmethod
+    def _start_listener():
+        stream_handler = logging.StreamHandler(stream=sys.stdout)
+        stream_handler.setFormatter(LogUtils.get_formatter())
+        LogUtils._listener = QueueListener(LogUtils._queue_handler.queue, stream_handler, respect_handler_level=False)
+        LogUtils._listener.start()
+
+    @staticmethod
+    def _restart_listener_after_fork():
+        # The listener thread doesn't survive a fork, a forked worker starts its own listener
+        if LogUtils._queue_handler is not None:
+            LogUtils._lock = threading.Lock()
+            LogUtils._queue_handler.queue = queue.Queue(maxsize=LogConsts.QUEUE_SIZE)
+            LogUtils._start_listener()
+
+    @staticmethod
+    def stop_logging():
+        # Writes the records still in the queue
+        if LogUtils._listener is not None:
+            LogUtils._listener.stop()
+            LogUtils._listener = None
+
+    @staticmethod
+    def setup_logging():
+        with LogUtils._lock:
+            if LogUtils._queue_handler is not None:
+                return
+
+            LogUtils._queue_handler = DroppingQueueHandler(log_queue=queue.Queue(maxsize=LogConsts.QUEUE_SIZE))
+            root_logger = logging.getLogger()
+            root_logger.addHandler(LogUtils._queue_handler)
+            root_logger.setLevel(LogConsts.LEVEL)
+            for module, level in LogUtils.parse_module_levels(module_levels=LogConsts.MODULE_LEVELS).items():
+                logging.getLogger(module).setLevel(level)
+
+            LogUtils._start_listener()
+            atexit.register(LogUtils.stop_logging)
+            if hasattr(os, "register_at_fork"):
+                os.register_at_fork(after_in_child=LogUtils._restart_listener_after_fork)
+
+    @staticmethod
+    def get_logger(name: str) -> logging.Logger:
+        """
+        Get the logger of a module, configuring logging on the first call
+
+        :param name: Module name, `__name__`
+        :return:
+        """
+        LogUtils.setup_logging()
+        return logging.getLogger(name)
@@ -0,0 +1,162 @@
+import contextvars
+import cProfile
+import functools
+import io
+import pstats
+import re
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional, Tuple
+
+from prometheus_client import Counter, Histogram, CollectorRegistry, generate_latest, REGISTRY, \
+    CONTENT_TYPE_LATEST
+from prometheus_client import multiprocess
+
+from utils.consts import MetricsConsts
+from utils.log_utils import LogUtils
+
+logger = LogUtils.get_logger(__name__)
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by route', ['route', 'method', 'status'],
+    buckets=MetricsConsts.LATENCY_BUCKETS
+)
+DB_QUERY_LATENCY = Histogram(
+    'db_query_duration_seconds', 'SQLite statement latency, fetching the rows of a statement is observed as FETCH',
+    ['operation', 'table'],
+    buckets=MetricsConsts.LATENCY_BUCKETS
+)
+CACHE_REQUESTS = Counter('cache_requests_total', 'In-process cache lookups', ['cache', 'result'])
+IMAGE_BYTES_SERVED = Counter('image_bytes_served_total', 'Bytes of image files served')
+IMAGE_UPLOADS = Counter('image_uploads_total', 'Uploaded images, by whether the image was already stored',
+                        ['result'])
+
+# Seconds spent in each stage of the current request, only set while the request is profiled
+_request_stages: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    'request_stages', default=None
+)
+
+
+class RequestProfile:
+    """
+    Profiling of a single request, a breakdown of the time spent in each stage and optionally a cProfile run
+    """
+
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.stages: Dict[str, float] = {}
+        self._stages_token = None
+        self._profiler: Optional[cProfile.Profile] = None
+        self._start_time = 0.0
+
+    def start(self):
+        self._stages_token = _request_stages.set(self.stages)
+        if self.mode == MetricsConsts.PROFILE_CPROFILE:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        self._start_time = time.perf_counter()
+
+    def stop(self, route: str) -> str:
+        """
+        :param route:
+        :return: Server-Timing header value
+        """
+        total = time.perf_counter() - self._start_time
+        if self._profiler is not None:
+            self._profiler.disable()
+            stats_stream = io.StringIO()
+            pstats.Stats(self._profiler, stream=stats_stream).sort_stats('cumulative').print_stats(
+                MetricsConsts.CPROFILE_LINES
+            )
+            logger.info("Profile of `%s`:\n%s", route, stats_stream.getvalue())
+        _request_stages.reset(self._stages_token)
+
+        timings = [f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in self.stages.items()]
+        timings.append(f"total;dur={total * 1000:.2f}")
+        return ', '.join(timings)
+
+
+class MetricsUtils:
+    _SQL_OPERATION_PATTERN = re.compile(r'^\s*(\w+)')
+    _SQL_TABLE_PATTERN = re.compile(r'\b(?:FROM|INTO|UPDATE|ON|TABLE(?:\s+IF(?:\s+NOT)?\s+EXISTS)?)\s+(\w+)',
+                                    re.IGNORECASE)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=1024)
+    def get_query_labels(sql: str) -> Tuple[str, str]:
+        operation_match = MetricsUtils._SQL_OPERATION_PATTERN.match(sql)
+        table_match = MetricsUtils._SQL_TABLE_PATTERN.search(sql)
+        operation = operation_match.group(1).upper() if operation_match else 'UNKNOWN'
+        table = table_match.group(1) if table_match else ''
+        return operation, table
+
+    @staticmethod
+    def add_stage_time(stage: str, seconds: float):
+        stages = _request_stages.get()
+        if stages is not None:
+            stages[stage] = stages.get(stage, 0.0) + seconds
+
+    @staticmethod
+    def observe_query(labels: Tuple[str, str], seconds: float):
+        DB_QUERY_LATENCY.labels(*labels).observe(seconds)
+        MetricsUtils.add_stage_time(stage='db', seconds=seconds)
+
+    @staticmethod
+    @contextmanager
+    def stage(name: str):
+        """
+        Time a stage of the request, only reported for profiled requests
+
+        :param name:
+        :return:
+        """
+        if _request_stages.get() is None:
+            yield
+            return
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            MetricsUtils.add_stage_time(stage=name, seconds=time.perf_counter() - start_time)
+
+    @staticmethod
+    def count_cache_lookup(cache: str, hit: bool):
+        CACHE_REQUESTS.labels(cache, 'hit' if hit else 'miss').inc()
+
+    @staticmethod
+    def count_image_upload(stored: bool):
+        IMAGE_UPLOADS.labels('stored' if stored else 'duplicate').inc()
+
+    @staticmethod
+    def count_image_bytes_served(size: int):
+        IMAGE_BYTES_SERVED.inc(size)
+
+    @staticmethod
+    def observe_request(route: str, method: str, status: int, seconds: float):
+        REQUEST_LATENCY.labels(route, method, str(status)).observe(seconds)
+
+    @staticmethod
+    def get_request_profile(profile_header: Optional[str]) -> Optional[RequestProfile]:
+        """
+        :param profile_header: Value of the profiling request header
+        :return: Profile to run for the request, None if the request isn't profiled
+        """
+        if not MetricsConsts.PROFILING_ENABLED or not profile_header:
+            return None
+        mode = profile_header.strip().lower()
+        if mode not in (MetricsConsts.PROFILE_STAGES, MetricsConsts.PROFILE_CPROFILE):
+            return None
+        return RequestProfile(mode=mode)
+
+    @staticmethod
+    def generate_metrics() -> Tuple[bytes, str]:
+        """
+        :return: Metrics in the Prometheus text format, of all the workers when running in multiprocess mode,
+                 and the content type
+        """
+        if MetricsConsts.MULTIPROCESS_DIR:
+            registry = CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        else:
+            registry = REGISTRY
+        return generate_latest(registry), CONTENT_TYPE_LATEST
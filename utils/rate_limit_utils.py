@@ -0,0 +1,45 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Tuple
+
+
+class RateLimiter:
+    """
+    Token bucket rate limiter by client.
+    Buckets are kept in the process memory, so every worker limits its own requests.
+    """
+
+    def __init__(self, rate_per_minute: int, burst: int, max_clients: int):
+        """
+        :param rate_per_minute: Requests per minute of a client, 0 disables the limit
+        :param burst: Requests a client can make at once
+        :param max_clients: Clients tracked, the least recently seen are forgotten
+        """
+        self._rate = rate_per_minute / 60
+        self._burst = burst
+        self._max_clients = max_clients
+        self._lock = threading.Lock()
+        self._buckets: 'OrderedDict[str, Tuple[float, float]]' = OrderedDict()
+
+    def check(self, client: str) -> float:
+        """
+        Take a token of the client
+
+        :param client: Client address
+        :return: 0 if the request is allowed, otherwise seconds until the client has a token
+        """
+        if not self._rate:
+            return 0
+
+        now = time.monotonic()
+        with self._lock:
+            tokens, last_time = self._buckets.pop(client, (self._burst, now))
+            tokens = min(self._burst, tokens + (now - last_time) * self._rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[client] = (tokens, now)
+            while len(self._buckets) > self._max_clients:
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) / self._rate